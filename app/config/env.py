@@ -102,6 +102,35 @@ NOTIFY_REACHED_USAGE_PERCENT = config(
 # sends a notification when there is n days left of their service
 NOTIFY_DAYS_LEFT = config("NOTIFY_DAYS_LEFT", default=3, cast=int)
 
+# most nodes synced at once, each holds a database connection meanwhile
+NODE_SYNC_CONCURRENCY = config("NODE_SYNC_CONCURRENCY", default=4, cast=int)
+
+# interval of fetching the user usages from each node in seconds
+USAGE_POLL_INTERVAL = config("USAGE_POLL_INTERVAL", default=10, cast=int)
+# upper bound of the adaptive timeout of fetching usages in seconds
+USAGE_POLL_TIMEOUT = config("USAGE_POLL_TIMEOUT", default=10, cast=int)
+# interval of storing the fetched usages in the database in seconds
+USAGE_FLUSH_INTERVAL = config("USAGE_FLUSH_INTERVAL", default=30, cast=int)
+# stores the fetched usages earlier if this many deltas are buffered
+USAGE_FLUSH_THRESHOLD = config(
+    "USAGE_FLUSH_THRESHOLD", default=500000, cast=int
+)
+# the fetched usages are journaled here until they are stored, set empty
+# to disable journaling
+USAGE_JOURNAL_DIR = config(
+    "USAGE_JOURNAL_DIR", default="/var/lib/marzneshin/usage_journal"
+)
+# hourly user usages older than this many days are only kept as daily
+# and monthly rollups, 0 keeps them forever
+USAGE_HOURLY_RETENTION_DAYS = config(
+    "USAGE_HOURLY_RETENTION_DAYS", default=90, cast=int
+)
+# daily user usages older than this many days are only kept as monthly
+# rollups, 0 keeps them forever
+USAGE_DAILY_RETENTION_DAYS = config(
+    "USAGE_DAILY_RETENTION_DAYS", default=730, cast=int
+)
+
 DISABLE_RECORDING_NODE_USAGE = config(
     "DISABLE_RECORDING_NODE_USAGE", cast=bool, default=False
 )
@@ -2,6 +2,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from .base import Base, SessionLocal, engine  # noqa
+from .changes import change_sequence, mark_users_changed  # noqa
 from .crud import (
     create_admin,
     create_notification_reminder,  # noqa
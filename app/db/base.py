@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import DateTime, cast, create_engine, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -27,3 +28,58 @@ else:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+
+def upsert_increment(model, index_elements: list[str], columns: list[str]):
+    """
+    builds a dialect native upsert for `model` which inserts a new row
+    or adds the given values of `columns` to the already existing row
+    identified by `index_elements`; to be executed with a list of params
+    """
+    table = model.__table__
+    if engine.dialect.name == "mysql":
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update(
+            {c: table.c[c] + stmt.inserted[c] for c in columns}
+        )
+
+    if engine.dialect.name == "postgresql":
+        stmt = postgresql.insert(table)
+    else:
+        stmt = sqlite.insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={c: table.c[c] + stmt.excluded[c] for c in columns},
+    )
+
+
+def truncate_datetime(column, resolution: str):
+    """
+    builds a dialect native expression truncating a datetime column to the
+    start of its hour, day, week (starting on monday) or month
+    """
+    if engine.dialect.name == "postgresql":
+        return func.date_trunc(resolution, column, type_=DateTime)
+
+    if engine.dialect.name == "mysql":
+        if resolution == "week":
+            column = func.subdate(column, func.weekday(column))
+        fmt = {
+            "hour": "%Y-%m-%d %H:00:00",
+            "day": "%Y-%m-%d 00:00:00",
+            "week": "%Y-%m-%d 00:00:00",
+            "month": "%Y-%m-01 00:00:00",
+        }[resolution]
+        return cast(func.date_format(column, fmt), DateTime)
+
+    if resolution == "week":
+        # to the next sunday unless it is one, then back to its monday
+        return func.strftime(
+            "%Y-%m-%d 00:00:00", column, "weekday 0", "-6 days", type_=DateTime
+        )
+    fmt = {
+        "hour": "%Y-%m-%d %H:00:00",
+        "day": "%Y-%m-%d 00:00:00",
+        "month": "%Y-%m-01 00:00:00",
+    }[resolution]
+    return func.strftime(fmt, column, type_=DateTime)
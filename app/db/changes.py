@@ -0,0 +1,131 @@
+"""
+orders the changes of the state nodes hold about users, so a node that
+reconnects only gets the users changed after the last update it applied
+"""
+
+import threading
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .models import Service, User
+
+# the attributes of a user nodes depend on
+NODE_USER_ATTRIBUTES = ("username", "key", "activated", "removed", "services")
+
+
+class ChangeSequence:
+    """
+    gives out the sequences of the changes; a sequence is open until the
+    transaction of its change ends, as a node mustn't be told it holds a
+    change which isn't committed yet and may be queued after later ones
+    """
+
+    def __init__(self):
+        self._value: int | None = None
+        self._lock = threading.Lock()
+        self._open: set[int] = set()
+
+    def load(self, db: Session) -> int:
+        with self._lock:
+            if self._value is None:
+                self._value = db.execute(
+                    select(func.coalesce(func.max(User.change_seq), 0))
+                ).scalar()
+            return self._value
+
+    def next(self, db: Session) -> int:
+        self.load(db)
+        with self._lock:
+            self._value += 1
+            self._open.add(self._value)
+            db.info.setdefault("change_seqs", []).append(self._value)
+            return self._value
+
+    def close(self, db: Session) -> None:
+        """closes the sequences given to the changes of the session"""
+        sequences = db.info.pop("change_seqs", ())
+        if (held := db.info.get("held_change_seqs")) is not None:
+            held.extend(sequences)
+        else:
+            self.release(sequences)
+
+    def hold(self, db: Session, held: list[int]) -> None:
+        """
+        keeps the sequences of the session open past its transactions, in
+        `held` until released, for changes queued to nodes after commit
+        """
+        db.info["held_change_seqs"] = held
+
+    def release(self, sequences) -> None:
+        with self._lock:
+            self._open.difference_update(sequences)
+
+    @property
+    def current(self) -> int:
+        """the latest sequence given to a change, 0 until loaded"""
+        return self._value or 0
+
+    @property
+    def settled(self) -> int:
+        """the latest sequence which no open one precedes"""
+        with self._lock:
+            return min(self._open) - 1 if self._open else self.current
+
+
+change_sequence = ChangeSequence()
+
+
+def mark_users_changed(db: Session, user_ids: list[int]) -> int:
+    """sequences a change of users made with a bulk update, returns it"""
+    users = User.__table__
+    sequence = change_sequence.next(db)
+    db.execute(
+        update(users)
+        .where(users.c.id.in_(user_ids))
+        .values(change_seq=sequence)
+    )
+    return sequence
+
+
+@event.listens_for(Session, "after_transaction_end")
+def close_change_sequences(session: Session, transaction):
+    if transaction.parent is None:
+        change_sequence.close(session)
+
+
+@event.listens_for(Session, "before_flush")
+def sequence_user_changes(session: Session, flush_context, instances):
+    changed = {obj for obj in session.new if isinstance(obj, User)}
+    removed = set()
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            attrs = inspect(obj).attrs
+            if any(
+                attrs[name].history.has_changes()
+                for name in NODE_USER_ATTRIBUTES
+            ):
+                changed.add(obj)
+            # nodes keep the key a user was added with, and a user who
+            # left a service may have left some nodes
+            if (
+                attrs.key.history.has_changes()
+                or attrs.services.history.deleted
+            ):
+                removed.add(obj)
+        elif isinstance(obj, Service):
+            history = inspect(obj).attrs.inbounds.history
+            if history.has_changes():
+                changed.update(obj.users)
+            if history.deleted:
+                removed.update(obj.users)
+    for obj in session.deleted:
+        if isinstance(obj, Service):
+            removed.update(obj.users)
+
+    if changed or removed:
+        sequence = change_sequence.next(session)
+        for user in changed | removed:
+            user.change_seq = sequence
+        for user in removed:
+            user.removal_seq = sequence
@@ -1,3 +1,4 @@
+import calendar
 import json
 import secrets
 from collections import defaultdict
@@ -6,9 +7,22 @@ from enum import Enum
 from types import NoneType
 from typing import List, Optional, Tuple, Union
 
-from sqlalchemy import and_, delete, update, select, func
+from sqlalchemy import (
+    DateTime,
+    and_,
+    bindparam,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    update,
+)
 from sqlalchemy.orm import Session
 
+from app.db.base import truncate_datetime, upsert_increment
+from app.db.changes import change_sequence
 from app.db.models import (
     JWT,
     TLS,
@@ -16,6 +30,8 @@ from app.db.models import (
     Node,
     NodeUsage,
     NodeUserUsage,
+    NodeUserUsageDaily,
+    NodeUserUsageMonthly,
     NotificationReminder,
     InboundHost,
     Service,
@@ -23,6 +39,8 @@ from app.db.models import (
     System,
     User,
     Backend,
+    inbounds_services,
+    users_services,
 )
 from app.models.admin import AdminCreate, AdminPartialModify
 from app.models.node import (
@@ -33,7 +51,7 @@ from app.models.node import (
 )
 from app.models.proxy import InboundHost as InboundHostModify
 from app.models.service import Service as ServiceModify, ServiceCreate
-from app.models.system import TrafficUsageSeries
+from app.models.system import TrafficUsageSeries, UsageResolution
 from app.models.user import (
     ReminderType,
     UserCreate,
@@ -43,6 +61,7 @@ from app.models.user import (
     UserExpireStrategy,
     UserNodeUsageSeries,
     UserUsageSeriesResponse,
+    reset_strategy_to_days,
 )
 
 
@@ -59,86 +78,253 @@ def add_default_hosts(db: Session, inbounds: List[Inbound]):
     db.commit()
 
 
+def get_node_backends_fingerprint(db: Session, node_id: int) -> str | None:
+    return db.execute(
+        select(Node.backends_fingerprint).where(Node.id == node_id)
+    ).scalar()
+
+
+def set_node_backends_fingerprint(db: Session, node_id: int, fingerprint: str):
+    db.execute(
+        update(Node)
+        .where(Node.id == node_id)
+        .values(backends_fingerprint=fingerprint)
+    )
+
+
 def ensure_node_backends(db: Session, backends, node_id: int):
-    old_backends = db.query(Backend).where(Backend.node_id == node_id)
-    for backend in old_backends:
-        db.delete(backend)
-    backends = [
-        Backend(
-            name=backend.name,
-            backend_type=backend.type,
-            version=backend.version,
-            node_id=node_id,
+    """adds, updates and removes the node backends that differ"""
+    current = {
+        name: (backend_id, backend_type, version)
+        for backend_id, name, backend_type, version in db.execute(
+            select(
+                Backend.id, Backend.name, Backend.backend_type, Backend.version
+            ).where(Backend.node_id == node_id)
         )
-        for backend in backends
-    ]
-    db.add_all(backends)
+    }
+    additions, changes = list(), list()
+    for backend in backends:
+        if backend.name not in current:
+            additions.append(
+                dict(
+                    name=backend.name,
+                    backend_type=backend.type,
+                    version=backend.version,
+                    node_id=node_id,
+                    running=True,
+                )
+            )
+            continue
+        backend_id, backend_type, version = current.pop(backend.name)
+        if (backend_type, version) != (backend.type, backend.version):
+            changes.append(
+                dict(
+                    backend_id=backend_id,
+                    new_type=backend.type,
+                    new_version=backend.version,
+                )
+            )
+    if current:
+        db.execute(
+            delete(Backend).where(
+                Backend.id.in_(b[0] for b in current.values())
+            )
+        )
+    if changes:
+        backends_table = Backend.__table__
+        db.execute(
+            update(backends_table)
+            .where(backends_table.c.id == bindparam("backend_id"))
+            .values(
+                backend_type=bindparam("new_type"),
+                version=bindparam("new_version"),
+            ),
+            changes,
+        )
+    if additions:
+        db.execute(insert(Backend), additions)
     db.flush()
 
 
 def ensure_node_inbounds(db: Session, inbounds: List[Inbound], node_id: int):
-    current_tags = [
-        i[0]
-        for i in db.execute(
-            select(Inbound.tag).filter(Inbound.node_id == node_id)
-        ).all()
-    ]
-    updated_tags = set(i.tag for i in list(inbounds))
-    inbound_additions, tag_deletions = list(), set()
-    for tag in current_tags:
-        if tag not in updated_tags:
-            tag_deletions.add(tag)
-    removals = db.query(Inbound).where(
-        and_(Inbound.node_id == node_id, Inbound.tag.in_(tag_deletions))
-    )
-    for i in removals:
-        db.delete(i)
-
+    """
+    adds, updates and removes the node inbounds that differ, giving the
+    new ones a default host
+    """
+    current = {
+        tag: (inbound_id, config)
+        for inbound_id, tag, config in db.execute(
+            select(Inbound.id, Inbound.tag, Inbound.config).where(
+                Inbound.node_id == node_id
+            )
+        )
+    }
+    new_inbounds, changes = list(), list()
     for inb in inbounds:
-        if inb.tag in current_tags:
-            stmt = (
-                update(Inbound)
-                .where(
-                    and_(Inbound.node_id == node_id, Inbound.tag == inb.tag)
-                )
-                .values(
+        if inb.tag not in current:
+            new_inbounds.append(
+                Inbound(
+                    tag=inb.tag,
                     protocol=json.loads(inb.config)["protocol"],
                     config=inb.config,
+                    node_id=node_id,
                 )
             )
-            db.execute(stmt)
-        else:
-            inbound_additions.append(inb)
-    new_inbounds = [
-        Inbound(
-            tag=inb.tag,
-            protocol=json.loads(inb.config)["protocol"],
-            config=inb.config,
-            node_id=node_id,
+            continue
+        inbound_id, config = current.pop(inb.tag)
+        if config != inb.config:
+            changes.append(
+                dict(
+                    inbound_id=inbound_id,
+                    new_protocol=json.loads(inb.config)["protocol"],
+                    new_config=inb.config,
+                )
+            )
+    # removed through the orm to drop their hosts and services along
+    if current:
+        for i in db.query(Inbound).where(
+            Inbound.id.in_(i[0] for i in current.values())
+        ):
+            db.delete(i)
+    if changes:
+        inbounds_table = Inbound.__table__
+        db.execute(
+            update(inbounds_table)
+            .where(inbounds_table.c.id == bindparam("inbound_id"))
+            .values(
+                protocol=bindparam("new_protocol"),
+                config=bindparam("new_config"),
+            ),
+            changes,
         )
-        for inb in inbound_additions
-    ]
     db.add_all(new_inbounds)
-    db.flush()
-    for i in new_inbounds:
-        db.refresh(i)
     add_default_hosts(db, new_inbounds)
-    db.commit()
+
+
+def get_node_service_tags(db: Session, node_id: int) -> dict[int, list]:
+    """returns the tags of the node inbounds in each service"""
+    service_tags = defaultdict(list)
+    for service_id, tag in db.execute(
+        select(inbounds_services.c.service_id, Inbound.tag)
+        .join(Inbound, Inbound.id == inbounds_services.c.inbound_id)
+        .where(Inbound.node_id == node_id)
+        .order_by(Inbound.id)
+    ):
+        service_tags[service_id].append(tag)
+    return service_tags
 
 
 def get_node_users(
     db: Session,
-    node_id: int,
+    service_ids: list[int],
+    yield_per: int | None = None,
 ):
+    """
+    returns the (user_id, username, key, service_id) rows of the activated
+    users in the services ordered by user id, fetched yield_per rows at a
+    time with a server side cursor if given
+    """
+    users = User.__table__
     query = (
-        db.query(User.id, User.username, User.key, Inbound)
+        select(
+            users.c.id,
+            users.c.username,
+            users.c.key,
+            users_services.c.service_id,
+        )
+        .join(users_services, users_services.c.user_id == users.c.id)
+        .where(
+            users_services.c.service_id.in_(service_ids),
+            users.c.activated == True,
+        )
+        .order_by(users.c.id)
+    )
+    if yield_per:
+        return db.execute(
+            query.execution_options(yield_per=yield_per)
+        ).tuples()
+    return db.execute(query).tuples().all()
+
+
+def get_users_node_ids(db: Session, user_ids: list[int]):
+    """returns the (user_id, node_id) pairs of the nodes users are on"""
+    return (
+        db.query(User.id, Inbound.node_id)
         .distinct()
         .join(Inbound.services)
         .join(Service.users)
-        .filter(Inbound.node_id == node_id)
-        .filter(User.activated == True)
+        .filter(User.id.in_(user_ids))
+        .all()
+    )
+
+
+def get_users_node_inbounds(db: Session, user_ids: list[int]):
+    """returns the (user_id, node_id, tag) of the inbounds users have"""
+    return (
+        db.query(User.id, Inbound.node_id, Inbound.tag)
+        .distinct()
+        .join(Inbound.services)
+        .join(Service.users)
+        .filter(User.id.in_(user_ids))
+        .all()
     )
-    return query.all()
+
+
+def get_node_user_changes(
+    db: Session, node_id: int, since: int, limit: int
+) -> list[tuple] | None:
+    """
+    returns the (user, tags, sequence) updates of the node users changed
+    after the sequence `since` with their inbound tags on the node, empty
+    for the ones not activated; a user who may have left the node since,
+    or whose key changed, is removed first. None if more than `limit`
+    users changed
+    """
+    node_users = (
+        select(users_services.c.user_id)
+        .join(
+            inbounds_services,
+            inbounds_services.c.service_id == users_services.c.service_id,
+        )
+        .join(Inbound, Inbound.id == inbounds_services.c.inbound_id)
+        .where(Inbound.node_id == node_id)
+    )
+    users = db.execute(
+        select(
+            User.id,
+            User.username,
+            User.key,
+            User.change_seq,
+            User.removal_seq,
+        )
+        .where(
+            User.change_seq > since,
+            (User.removal_seq > since) | User.id.in_(node_users),
+        )
+        .limit(limit + 1)
+    ).all()
+    if len(users) > limit:
+        return None
+
+    tags = defaultdict(list)
+    for user_id, tag in (
+        db.query(User.id, Inbound.tag)
+        .distinct()
+        .join(Inbound.services)
+        .join(Service.users)
+        .filter(
+            Inbound.node_id == node_id,
+            User.change_seq > since,
+            User.activated == True,
+        )
+    ):
+        tags[user_id].append(tag)
+    updates = []
+    for user in users:
+        if user.removal_seq > since and user.id in tags:
+            updates.append((user, [], user.change_seq))
+        updates.append((user, tags.get(user.id, []), user.change_seq))
+    return updates
 
 
 def get_user_hosts(db: Session, user_id: int):
@@ -312,69 +498,221 @@ def get_users(
     return query.all()
 
 
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _next_month(value: datetime) -> datetime:
+    return (value.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _truncate(value: datetime, resolution: UsageResolution) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if resolution == UsageResolution.hour:
+        return value
+    value = value.replace(hour=0)
+    if resolution == UsageResolution.day:
+        return value
+    if resolution == UsageResolution.week:
+        return value - timedelta(days=value.weekday())
+    return value.replace(day=1)
+
+
+_TABLE_RESOLUTIONS = {
+    NodeUserUsage: UsageResolution.hour,
+    NodeUserUsageDaily: UsageResolution.day,
+    NodeUserUsageMonthly: UsageResolution.month,
+}
+
+
+def _node_user_usage_sources(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    resolution: UsageResolution = UsageResolution.hour,
+) -> list[tuple[type, datetime, datetime]]:
+    """
+    splits [start, end] between the hourly, daily and monthly usage tables
+    preferring the coarsest one not coarser than the resolution, ranges
+    which were purged from the finer tables are read from coarser ones
+    """
+    hourly_from = db.query(func.min(NodeUserUsage.created_at)).scalar()
+    daily_from, daily_last = db.query(
+        func.min(NodeUserUsageDaily.created_at),
+        func.max(NodeUserUsageDaily.created_at),
+    ).one()
+    monthly_last = db.query(func.max(NodeUserUsageMonthly.created_at)).scalar()
+
+    daily_until = daily_last + timedelta(days=1) if daily_last else None
+    monthly_until = _next_month(monthly_last) if monthly_last else None
+    tables = [
+        (
+            NodeUserUsage,
+            (
+                _truncate(hourly_from, UsageResolution.day)
+                if hourly_from
+                else daily_until or datetime.min
+            ),
+            datetime.max,
+        ),
+        (
+            NodeUserUsageDaily,
+            daily_from and _truncate(daily_from, UsageResolution.month),
+            daily_until,
+        ),
+        (NodeUserUsageMonthly, datetime.min, monthly_until),
+    ]
+    # weeks are built from days, they don't line up with months
+    fit = {
+        UsageResolution.hour: 1,
+        UsageResolution.day: 2,
+        UsageResolution.week: 2,
+        UsageResolution.month: 3,
+    }[resolution]
+    preferred = tables[:fit][::-1] + tables[fit:]
+
+    sources, remaining = [], [(_naive_utc(start), _naive_utc(end))]
+    for model, lower, upper in preferred:
+        if lower is None or upper is None:
+            continue
+        rest = []
+        for a, b in remaining:
+            if max(a, lower) < min(b, upper):
+                sources.append((model, max(a, lower), min(b, upper)))
+            if a < min(b, lower):
+                rest.append((a, min(b, lower)))
+            if max(a, upper) < b:
+                rest.append((max(a, upper), b))
+        remaining = rest
+    return sources
+
+
+def _bucket(model, resolution: UsageResolution):
+    if _TABLE_RESOLUTIONS[model] == resolution:
+        return model.created_at
+    return truncate_datetime(model.created_at, resolution.value)
+
+
+def _source_conditions(model, start: datetime, end: datetime, last: bool):
+    return and_(
+        model.created_at >= _truncate(start, _TABLE_RESOLUTIONS[model]),
+        model.created_at <= end if last else model.created_at < end,
+    )
+
+
+def _usage_series(
+    usages: dict[datetime, int],
+    start: datetime,
+    end: datetime,
+    resolution: UsageResolution,
+) -> list[tuple[int, int]]:
+    """
+    lays bucketed usages out on a gap filled series from start to end,
+    usages of buckets starting before `start` fall into the first slot
+    """
+    first = _truncate(_naive_utc(start), resolution)
+    end = _naive_utc(end)
+    if resolution == UsageResolution.month:
+        months = []
+        while first <= end:
+            months.append(calendar.timegm(first.timetuple()))
+            first = _next_month(first)
+        slots = dict.fromkeys(months, 0)
+    else:
+        step = {
+            UsageResolution.hour: 3600,
+            UsageResolution.day: 86400,
+            UsageResolution.week: 604800,
+        }[resolution]
+        slots = dict.fromkeys(
+            range(
+                calendar.timegm(first.timetuple()),
+                calendar.timegm(end.timetuple()) + 1,
+                step,
+            ),
+            0,
+        )
+    if not slots:
+        return []
+
+    first_slot = next(iter(slots))
+    for bucket, used_traffic in usages.items():
+        slot = max(calendar.timegm(bucket.timetuple()), first_slot)
+        if slot in slots:
+            slots[slot] += used_traffic
+    return list(slots.items())
+
+
 def get_total_usages(
-    db: Session, admin: Admin, start: datetime, end: datetime
+    db: Session,
+    admin: Admin,
+    start: datetime,
+    end: datetime,
+    resolution: UsageResolution = UsageResolution.hour,
 ):
     usages = defaultdict(int)
 
-    query = (
-        db.query(
-            NodeUserUsage.created_at, func.sum(NodeUserUsage.used_traffic)
-        )
-        .group_by(NodeUserUsage.created_at)
-        .filter(
-            and_(
-                NodeUserUsage.created_at >= start,
-                NodeUserUsage.created_at <= end,
+    sources = _node_user_usage_sources(db, start, end, resolution)
+    for model, source_start, source_end in sources:
+        bucket = _bucket(model, resolution)
+        query = (
+            db.query(bucket, func.sum(model.used_traffic))
+            .group_by(bucket)
+            .filter(
+                _source_conditions(
+                    model,
+                    source_start,
+                    source_end,
+                    source_end == _naive_utc(end),
+                )
             )
         )
-    )
 
-    if not admin.is_sudo:
-        query = (
-            query.filter(
-                Admin.id == admin.id,
+        if not admin.is_sudo:
+            query = (
+                query.filter(
+                    Admin.id == admin.id,
+                )
+                .join(User, model.user_id == User.id)
+                .join(Admin, User.admin_id == Admin.id)
             )
-            .join(User, NodeUserUsage.user_id == User.id)
-            .join(Admin, User.admin_id == Admin.id)
-        )
-    for created_at, used_traffic in query.all():
-        usages[created_at.replace(tzinfo=timezone.utc).timestamp()] += int(
-            used_traffic
-        )
+        for created_at, used_traffic in query.all():
+            usages[created_at] += int(used_traffic)
 
-    result = TrafficUsageSeries(usages=[])
-    current = start.astimezone(timezone.utc).replace(
-        minute=0, second=0, microsecond=0
+    return TrafficUsageSeries(
+        usages=_usage_series(usages, start, end, resolution)
     )
 
-    while current <= end.replace(tzinfo=timezone.utc):
-        result.usages.append(
-            (int(current.timestamp()), usages.get(current.timestamp()) or 0)
-        )
-        current += timedelta(hours=1)
-
-    return result
-
 
 def get_user_usages(
     db: Session,
     db_user: User,
     start: datetime,
     end: datetime,
+    resolution: UsageResolution = UsageResolution.hour,
 ) -> UserUsageSeriesResponse:
-    cond = and_(
-        NodeUserUsage.user_id == db_user.id,
-        NodeUserUsage.created_at >= start,
-        NodeUserUsage.created_at <= end,
-    )
+    usages = defaultdict(lambda: defaultdict(int))
 
-    usages = defaultdict(dict)
-
-    for v in db.query(NodeUserUsage).filter(cond):
-        usages[v.node_id][
-            v.created_at.replace(tzinfo=timezone.utc).timestamp()
-        ] = v.used_traffic
+    sources = _node_user_usage_sources(db, start, end, resolution)
+    for model, source_start, source_end in sources:
+        bucket = _bucket(model, resolution)
+        query = (
+            db.query(model.node_id, bucket, func.sum(model.used_traffic))
+            .filter(
+                model.user_id == db_user.id,
+                _source_conditions(
+                    model,
+                    source_start,
+                    source_end,
+                    source_end == _naive_utc(end),
+                ),
+            )
+            .group_by(model.node_id, bucket)
+        )
+        for node_id, created_at, used_traffic in query:
+            usages[node_id][created_at] += int(used_traffic)
 
     node_ids = list(usages.keys())
     nodes = db.query(Node).where(Node.id.in_(node_ids))
@@ -382,20 +720,171 @@ def get_user_usages(
 
     result = UserUsageSeriesResponse(username=db_user.username, node_usages=[])
     for node_id, rows in usages.items():
-        node_usages = UserNodeUsageSeries(
-            node_id=node_id, node_name=node_id_names[node_id], usages=[]
+        result.node_usages.append(
+            UserNodeUsageSeries(
+                node_id=node_id,
+                node_name=node_id_names[node_id],
+                usages=_usage_series(rows, start, end, resolution),
+            )
         )
-        current = start.astimezone(timezone.utc).replace(
-            minute=0, second=0, microsecond=0
+    return result
+
+
+def rollup_node_user_usages(
+    db: Session, until: datetime, limit: int = 24
+) -> int:
+    """
+    compacts the days of hourly usages which ended before `until` into
+    daily rows and the months of those into monthly rows, at most `limit`
+    periods per call; returns the number of compacted periods
+    """
+    columns = ["created_at", "user_id", "node_id", "used_traffic"]
+
+    def rollup(source, target, period_start, period_end):
+        db.execute(
+            insert(target).from_select(
+                columns,
+                select(
+                    literal(period_start, DateTime),
+                    source.user_id,
+                    source.node_id,
+                    func.sum(source.used_traffic),
+                )
+                .where(
+                    source.created_at >= period_start,
+                    source.created_at < period_end,
+                )
+                .group_by(source.user_id, source.node_id),
+            )
+        )
+        db.commit()
+
+    def next_period(source, target, after: datetime | None):
+        """the first period of target with rows in source from `after`"""
+        query = db.query(func.min(source.created_at))
+        if after:
+            query = query.filter(source.created_at >= after)
+        first = query.scalar()
+        return _truncate(first, _TABLE_RESOLUTIONS[target]) if first else None
+
+    done = 0
+    last = db.query(func.max(NodeUserUsageDaily.created_at)).scalar()
+    day = next_period(
+        NodeUserUsage,
+        NodeUserUsageDaily,
+        last + timedelta(days=1) if last else None,
+    )
+    while day and day + timedelta(days=1) <= until and done < limit:
+        rollup(NodeUserUsage, NodeUserUsageDaily, day, day + timedelta(days=1))
+        done += 1
+        day = next_period(
+            NodeUserUsage, NodeUserUsageDaily, day + timedelta(days=1)
+        )
+
+    # the days before this are compacted
+    compacted = min(day or datetime.max, _truncate(until, UsageResolution.day))
+    last = db.query(func.max(NodeUserUsageMonthly.created_at)).scalar()
+    month = next_period(
+        NodeUserUsageDaily,
+        NodeUserUsageMonthly,
+        _next_month(last) if last else None,
+    )
+    while month and _next_month(month) <= compacted and done < limit:
+        rollup(
+            NodeUserUsageDaily,
+            NodeUserUsageMonthly,
+            month,
+            _next_month(month),
+        )
+        done += 1
+        month = next_period(
+            NodeUserUsageDaily, NodeUserUsageMonthly, _next_month(month)
+        )
+
+    return done
+
+
+def add_compacted_node_user_usages(
+    db: Session,
+    node_user_usages: dict[tuple[datetime, int], tuple],
+) -> None:
+    """
+    adds the usages of hours whose day or month is compacted already to
+    the daily and monthly rows too, as those are only rolled up once
+    node_user_usages: maps (hour, node_id) to the arrays of its user ids
+    and their usages
+    """
+    daily_last = db.query(func.max(NodeUserUsageDaily.created_at)).scalar()
+    if not daily_last:
+        return
+    monthly_last = db.query(func.max(NodeUserUsageMonthly.created_at)).scalar()
+
+    for target, last, resolution in (
+        (NodeUserUsageDaily, daily_last, UsageResolution.day),
+        (NodeUserUsageMonthly, monthly_last, UsageResolution.month),
+    ):
+        if last is None:
+            continue
+        usages = defaultdict(int)
+        for (hour, node_id), (uids, values) in node_user_usages.items():
+            period = _truncate(hour, resolution)
+            if period > last:
+                continue
+            for uid, value in zip(uids.tolist(), values.tolist()):
+                usages[period, uid, node_id] += value
+        if not usages:
+            continue
+        db.execute(
+            upsert_increment(
+                target, ["created_at", "user_id", "node_id"], ["used_traffic"]
+            ),
+            [
+                {
+                    "created_at": period,
+                    "user_id": uid,
+                    "node_id": node_id,
+                    "used_traffic": value,
+                }
+                for (period, uid, node_id), value in usages.items()
+            ],
         )
 
-        while current <= end:
-            node_usages.usages.append(
-                (int(current.timestamp()), rows.get(current.timestamp()) or 0)
+
+def purge_node_user_usages(
+    db: Session,
+    hourly_before: datetime | None,
+    daily_before: datetime | None,
+):
+    """
+    removes hourly and daily usages older than the given times, rows which
+    are not compacted into the coarser table yet are kept
+    """
+    if hourly_before and daily_before:
+        # purged hours have to be read from the days, not whole months
+        daily_before = min(daily_before, hourly_before)
+    if hourly_before:
+        last = db.query(func.max(NodeUserUsageDaily.created_at)).scalar()
+        if last:
+            before = min(
+                _truncate(hourly_before, UsageResolution.day),
+                last + timedelta(days=1),
             )
-            current += timedelta(hours=1)
-        result.node_usages.append(node_usages)
-    return result
+            db.execute(
+                delete(NodeUserUsage).where(NodeUserUsage.created_at < before)
+            )
+    if daily_before:
+        last = db.query(func.max(NodeUserUsageMonthly.created_at)).scalar()
+        if last:
+            before = min(
+                _truncate(daily_before, UsageResolution.month),
+                _next_month(last),
+            )
+            db.execute(
+                delete(NodeUserUsageDaily).where(
+                    NodeUserUsageDaily.created_at < before
+                )
+            )
+    db.commit()
 
 
 def get_users_count(
@@ -444,6 +933,7 @@ def create_user(
         if allowed_services is not None
         else user.service_ids
     )
+    now = datetime.utcnow()
     dbuser = User(
         username=user.username,
         key=user.key,
@@ -457,6 +947,8 @@ def create_user(
         data_limit=(user.data_limit or None),
         admin=admin,
         data_limit_reset_strategy=user.data_limit_reset_strategy,
+        next_reset_at=next_reset_at(user.data_limit_reset_strategy, now),
+        created_at=now,
         note=user.note,
     )
     db.add(dbuser)
@@ -502,6 +994,10 @@ def update_user(
 
     if modify.data_limit_reset_strategy is not None:
         dbuser.data_limit_reset_strategy = modify.data_limit_reset_strategy
+        dbuser.next_reset_at = next_reset_at(
+            modify.data_limit_reset_strategy,
+            dbuser.traffic_reset_at or dbuser.created_at,
+        )
 
     if modify.activation_deadline is not None:
         dbuser.activation_deadline = modify.activation_deadline
@@ -527,8 +1023,20 @@ def update_user(
     return dbuser
 
 
+def next_reset_at(
+    strategy: UserDataUsageResetStrategy, last_reset: datetime
+) -> datetime | None:
+    """returns when the usage of a user reset at last_reset is reset next"""
+    if days := reset_strategy_to_days.get(strategy):
+        return last_reset + timedelta(days=days)
+    return None
+
+
 def reset_user_data_usage(db: Session, dbuser: User):
     dbuser.traffic_reset_at = datetime.utcnow()
+    dbuser.next_reset_at = next_reset_at(
+        dbuser.data_limit_reset_strategy, dbuser.traffic_reset_at
+    )
 
     dbuser.used_traffic = 0
 
@@ -568,6 +1076,57 @@ def reset_all_users_data_usage(db: Session, admin: Optional[Admin] = None):
     db.commit()
 
 
+def reset_due_users_data_usage(db: Session, now: datetime) -> tuple[int, list]:
+    """
+    resets the usage of the users whose next reset time came
+    returns the number of users reset and the ids of the ones the
+    reset made active again, which are marked activated
+    """
+    due = and_(User.next_reset_at.isnot(None), User.next_reset_at <= now)
+    reactivated = (
+        db.execute(
+            select(User.id).where(
+                due,
+                User.activated == False,
+                User.enabled == True,
+                User.removed == False,
+                User.data_limit_reached,
+                ~and_(
+                    User.expire_strategy == UserExpireStrategy.FIXED_DATE,
+                    User.expire_date <= now,
+                ),
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+    users = User.__table__
+    count = db.execute(
+        update(users)
+        .where(due)
+        .values(
+            used_traffic=0,
+            traffic_reset_at=now,
+            next_reset_at=case(
+                {
+                    strategy: now + timedelta(days=days)
+                    for strategy, days in reset_strategy_to_days.items()
+                },
+                value=users.c.data_limit_reset_strategy,
+            ),
+        )
+    ).rowcount
+    for i in range(0, len(reactivated), 1000):
+        db.execute(
+            update(users)
+            .where(users.c.id.in_(reactivated[i : i + 1000]))
+            .values(activated=True, change_seq=change_sequence.next(db))
+        )
+    db.commit()
+    return count, reactivated
+
+
 def update_user_status(db: Session, dbuser: User, status: UserStatus):
     dbuser.status = status
     db.commit()
@@ -756,7 +1315,10 @@ def get_nodes(
 
 
 def get_nodes_usage(
-    db: Session, start: datetime, end: datetime
+    db: Session,
+    start: datetime,
+    end: datetime,
+    resolution: UsageResolution | None = None,
 ) -> List[NodeUsageResponse]:
     usages = dict()
 
@@ -769,14 +1331,33 @@ def get_nodes_usage(
         )
 
     cond = and_(NodeUsage.created_at >= start, NodeUsage.created_at <= end)
+    columns = [
+        NodeUsage.node_id,
+        func.sum(NodeUsage.uplink),
+        func.sum(NodeUsage.downlink),
+    ]
+    if resolution:
+        bucket = truncate_datetime(NodeUsage.created_at, resolution.value)
+        query = db.query(*columns, bucket).group_by(NodeUsage.node_id, bucket)
+    else:
+        query = db.query(*columns).group_by(NodeUsage.node_id)
+
+    series = defaultdict(dict)
+    for node_id, uplink, downlink, *bucket in query.filter(cond):
+        if (node_id or 0) not in usages:
+            continue
+        usages[node_id or 0].uplink += int(uplink or 0)
+        usages[node_id or 0].downlink += int(downlink or 0)
+        if bucket:
+            series[node_id or 0][bucket[0]] = int(uplink or 0) + int(
+                downlink or 0
+            )
 
-    for v in db.query(NodeUsage).filter(cond):
-        try:
-            usages[v.node_id or 0].uplink += v.uplink
-            usages[v.node_id or 0].downlink += v.downlink
-        except KeyError:
-            pass
-
+    if resolution:
+        for node_id, node_usage in usages.items():
+            node_usage.usages = _usage_series(
+                series[node_id], start, end, resolution
+            )
     return list(usages.values())
 
 
@@ -828,18 +1409,37 @@ def update_node(db: Session, dbnode: Node, modify: NodeModify):
     return dbnode
 
 
-def update_node_status(
-    db: Session,
-    node_id: int,
-    status: NodeStatus,
-    message: str = None,
-    version: str = None,
-):
-    db_node = db.query(Node).where(Node.id == node_id).first()
-    db_node.status = status
-    if message:
-        db_node.message = message
-    db_node.last_status_change = datetime.utcnow()
+def update_nodes_status(db: Session, statuses: dict[int, tuple]):
+    """
+    stores the (status, message, changed_at) of nodes in bulk, a node
+    changed without a message keeps its last one; nodes disabled in the
+    meantime are left as they are
+    """
+    nodes = Node.__table__
+    params = [
+        dict(
+            node_id=node_id,
+            new_status=status,
+            new_message=message,
+            changed_at=changed_at,
+        )
+        for node_id, (status, message, changed_at) in statuses.items()
+    ]
+    values = dict(
+        status=bindparam("new_status"),
+        last_status_change=bindparam("changed_at"),
+    )
+    stmt = update(nodes).where(
+        nodes.c.id == bindparam("node_id"),
+        nodes.c.status != NodeStatus.disabled,
+    )
+    if with_message := [p for p in params if p["new_message"]]:
+        db.execute(
+            stmt.values(message=bindparam("new_message"), **values),
+            with_message,
+        )
+    if without_message := [p for p in params if not p["new_message"]]:
+        db.execute(stmt.values(**values), without_message)
     db.commit()
 
 
@@ -0,0 +1,35 @@
+"""add change_seq to users
+
+Revision ID: 0d7a5c8e4f12
+Revises: 6f3c21d9b0a4
+Create Date: 2026-10-17 15:06:52.117304
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0d7a5c8e4f12"
+down_revision = "6f3c21d9b0a4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column(
+            "change_seq",
+            sa.BigInteger(),
+            nullable=False,
+            server_default="0",
+        ),
+    )
+    op.create_index(op.f("ix_users_change_seq"), "users", ["change_seq"])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_users_change_seq"), table_name="users")
+    op.drop_column("users", "change_seq")
@@ -0,0 +1,33 @@
+"""add removal_seq to users
+
+Revision ID: 5b1d9e3f7a20
+Revises: 9a4e7b2c5d13
+Create Date: 2026-10-17 19:24:08.503117
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "5b1d9e3f7a20"
+down_revision = "9a4e7b2c5d13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column(
+            "removal_seq",
+            sa.BigInteger(),
+            nullable=False,
+            server_default="0",
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "removal_seq")
@@ -0,0 +1,64 @@
+"""add next_reset_at to users
+
+Revision ID: 6f3c21d9b0a4
+Revises: ab2f3a8e18ab
+Create Date: 2026-10-17 12:41:08.529173
+
+"""
+
+from datetime import timedelta
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy import table, column
+
+# revision identifiers, used by Alembic.
+revision = "6f3c21d9b0a4"
+down_revision = "ab2f3a8e18ab"
+branch_labels = None
+depends_on = None
+
+reset_strategy_to_days = {"day": 1, "week": 7, "month": 30, "year": 365}
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("next_reset_at", sa.DateTime()))
+    op.create_index(op.f("ix_users_next_reset_at"), "users", ["next_reset_at"])
+
+    users = table(
+        "users",
+        column("id", sa.Integer),
+        column("data_limit_reset_strategy", sa.String),
+        column("traffic_reset_at", sa.DateTime),
+        column("created_at", sa.DateTime),
+        column("next_reset_at", sa.DateTime),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(
+            users.c.id,
+            users.c.data_limit_reset_strategy,
+            sa.func.coalesce(users.c.traffic_reset_at, users.c.created_at),
+        ).where(users.c.data_limit_reset_strategy != "no_reset")
+    ).all()
+    values = [
+        {
+            "uid": uid,
+            "reset_at": last_reset
+            + timedelta(days=reset_strategy_to_days[strategy]),
+        }
+        for uid, strategy, last_reset in rows
+        if last_reset is not None
+    ]
+    if values:
+        bind.execute(
+            users.update()
+            .where(users.c.id == sa.bindparam("uid"))
+            .values(next_reset_at=sa.bindparam("reset_at")),
+            values,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_users_next_reset_at"), table_name="users")
+    op.drop_column("users", "next_reset_at")
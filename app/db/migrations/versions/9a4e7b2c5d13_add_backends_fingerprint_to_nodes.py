@@ -0,0 +1,28 @@
+"""add backends_fingerprint to nodes
+
+Revision ID: 9a4e7b2c5d13
+Revises: 0d7a5c8e4f12
+Create Date: 2026-10-17 17:42:08.530912
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "9a4e7b2c5d13"
+down_revision = "0d7a5c8e4f12"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "nodes",
+        sa.Column("backends_fingerprint", sa.String(length=64), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("nodes", "backends_fingerprint")
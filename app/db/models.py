@@ -176,6 +176,15 @@ class User(Base):
         BigInteger, default=0, server_default="0", nullable=False
     )
     traffic_reset_at = Column(DateTime)
+    next_reset_at = Column(DateTime, index=True)
+    change_seq = Column(
+        BigInteger, nullable=False, default=0, server_default="0", index=True
+    )
+    # the last change nodes apply by removing the user first, as its key
+    # changed or it may have left some of them
+    removal_seq = Column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
     node_usages = relationship(
         "NodeUserUsage",
         back_populates="user",
@@ -386,6 +395,8 @@ class Node(Base):
     address = Column(String(256))
     port = Column(Integer)
     xray_version = Column(String(32))
+    # hash of the backends and inbounds last stored from the node
+    backends_fingerprint = Column(String(64))
     inbounds = relationship(
         "Inbound", back_populates="node", cascade="all, delete"
     )
@@ -410,6 +421,16 @@ class Node(Base):
         back_populates="node",
         cascade="all, delete, delete-orphan",
     )
+    daily_user_usages = relationship(
+        "NodeUserUsageDaily",
+        back_populates="node",
+        cascade="all, delete, delete-orphan",
+    )
+    monthly_user_usages = relationship(
+        "NodeUserUsageMonthly",
+        back_populates="node",
+        cascade="all, delete, delete-orphan",
+    )
     usage_coefficient = Column(
         Float, nullable=False, server_default=text("1.0"), default=1
     )
@@ -432,6 +453,30 @@ class NodeUserUsage(Base):
     used_traffic = Column(BigInteger, default=0)
 
 
+class NodeUserUsageDaily(Base):
+    __tablename__ = "node_user_usages_daily"
+    __table_args__ = (UniqueConstraint("created_at", "user_id", "node_id"),)
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)  # one day per record
+    user_id = Column(Integer, ForeignKey("users.id"))
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="daily_user_usages")
+    used_traffic = Column(BigInteger, default=0)
+
+
+class NodeUserUsageMonthly(Base):
+    __tablename__ = "node_user_usages_monthly"
+    __table_args__ = (UniqueConstraint("created_at", "user_id", "node_id"),)
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)  # one month per record
+    user_id = Column(Integer, ForeignKey("users.id"))
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="monthly_user_usages")
+    used_traffic = Column(BigInteger, default=0)
+
+
 class NodeUsage(Base):
     __tablename__ = "node_usages"
     __table_args__ = (UniqueConstraint("created_at", "node_id"),)
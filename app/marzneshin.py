@@ -24,17 +24,28 @@ from app.config.env import (
     UVICORN_SSL_CERTFILE,
     UVICORN_SSL_KEYFILE,
     UVICORN_UDS,
+    USAGE_FLUSH_INTERVAL,
     DASHBOARD_PATH,
     WEBHOOK_ADDRESS,
 )
+from app.marznode.status import node_health
 from app.templates import render_template
-from . import __version__, telegram
+from app.utils.expiry import expiry_timers
+from app.utils.loop_monitor import loop_monitor
+from . import __version__, telegram, usage
 from .routes import api_router
 from .tasks import (
     delete_expired_reminders,
+    flush_user_usages,
+    ingest_pending_usages,
+    ingest_user_usages,
+    load_expiry_timers,
+    load_remaining_quotas,
     nodes_startup,
-    record_user_usages,
+    replay_usage_journal,
     reset_user_data_usage,
+    rollup_usages,
+    review_user_timers,
     review_users,
     send_notifications,
 )
@@ -44,9 +55,25 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    loop_monitor_task = asyncio.create_task(loop_monitor.run())
+    await replay_usage_journal()
+    await load_remaining_quotas()
+    await load_expiry_timers()
+    expiry_task = asyncio.create_task(expiry_timers.run(review_user_timers))
+    ingestion_task = asyncio.create_task(ingest_user_usages())
     await nodes_startup()
     yield
     scheduler.shutdown()
+    expiry_task.cancel()
+    for node_id in list(usage.pollers):
+        usage.stop_polling(node_id)
+    ingestion_task.cancel()
+    await node_health.flush()
+    logger.info("Storing buffered usages before shutdown...")
+    await ingest_pending_usages()
+    await flush_user_usages()
+    usage.worker.shutdown()
+    loop_monitor_task.cancel()
     logger.info("Sending pending notifications before shutdown...")
     await send_notifications()
 
@@ -78,11 +105,22 @@ app.add_middleware(
 )
 
 scheduler = AsyncIOScheduler(timezone="UTC")
-scheduler.add_job(record_user_usages, "interval", coalesce=True, seconds=30)
 scheduler.add_job(
-    review_users, "interval", seconds=30, coalesce=True, max_instances=1
+    flush_user_usages,
+    "interval",
+    coalesce=True,
+    max_instances=1,
+    seconds=USAGE_FLUSH_INTERVAL,
+)
+# users are reviewed by the expiry timers as they expire, this only
+# reconciles the ones changed outside of the api
+scheduler.add_job(
+    review_users, "interval", minutes=10, coalesce=True, max_instances=1
 )
 scheduler.add_job(reset_user_data_usage, "interval", coalesce=True, hours=1)
+scheduler.add_job(
+    rollup_usages, "interval", coalesce=True, max_instances=1, minutes=10
+)
 
 if WEBHOOK_ADDRESS:
     scheduler.add_job(
@@ -6,6 +6,7 @@ from . import operations
 from .base import MarzNodeBase
 from .grpcio import MarzNodeGRPCIO
 from .grpclib import MarzNodeGRPCLIB
+from .outbox import UpdatePriority
 
 nodes: Dict[int, MarzNodeBase] = {}
 
@@ -16,4 +17,5 @@ __all__ = [
     "MarzNodeGRPCIO",
     "MarzNodeGRPCLIB",
     "MarzNodeBase",
+    "UpdatePriority",
 ]
@@ -1,15 +1,43 @@
+import asyncio
 from abc import ABC
 
+from .outbox import UpdatePriority
+
 
 class MarzNodeBase(ABC):
 
     async def update_user(
-        self, user, inbounds: list[str] | None = None
+        self, user, inbounds: list[str] | None = None, sequence: int = 0
     ) -> None:
-        """updates a user on the node"""
+        """updates a user on the node as of the change `sequence`"""
+
+    async def update_users(self, updates: list[tuple]) -> None:
+        """updates the (user, inbounds, sequence) on the node in order"""
+        for user, inbounds, sequence in updates:
+            await self.update_user(user, inbounds, sequence)
+
+    def queue_user_updates(
+        self, updates: list[tuple], priority: UpdatePriority | None = None
+    ) -> None:
+        """
+        queues the (user, inbounds, sequence) without waiting for them, ahead
+        of the less urgent ones where the node keeps an outbox
+        """
+        asyncio.ensure_future(self.update_users(updates))
+
+    async def stop(self) -> None:
+        """stops connecting to the node, e.g. once it is removed"""
 
     async def fetch_users_stats(self):
-        """get user stats from the node"""
+        """get user stats from the node as arrays of uids and usages"""
+
+    async def stream_users_stats(self, interval: int):
+        """
+        yields the uids and usages of the batches pushed by the node, raises
+        NotImplementedError if the node doesn't support streaming them
+        """
+        raise NotImplementedError
+        yield
 
     async def get_logs(self, name: str, include_buffer: bool):
         pass
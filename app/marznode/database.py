@@ -1,28 +1,95 @@
-from app.db import crud, GetDB
+import asyncio
+from itertools import islice
+
+from app.config.env import NODE_SYNC_CONCURRENCY
+from app.db import crud, change_sequence, GetDB
 from app.models.node import NodeStatus
+from .encoding import backends_fingerprint
+from .status import node_health
+
+# most users sent to a reconnecting node one by one, more changes
+# repopulate all of its users at once
+INCREMENTAL_SYNC_LIMIT = 10000
+
+# users sent to a node per repopulation chunk
+REPOPULATE_CHUNK_SIZE = 1000
+
+# a repopulating node holds a database connection until it is done, so
+# the nodes synced at once are bounded below the connection pool size
+sync_slots = asyncio.Semaphore(NODE_SYNC_CONCURRENCY)
+
+
+def group_user_rows(rows, service_tags: dict[int, list]):
+    """
+    folds the (user_id, username, key, service_id) rows ordered by user id
+    into (user_id, username, key, tags) per user
+    """
+    user_id = None
+    for row_id, username, key, service_id in rows:
+        if row_id != user_id:
+            if user_id is not None:
+                yield user
+            user_id, tags = row_id, list(service_tags[service_id])
+            user = (row_id, username, key, tags)
+        else:
+            tags.extend(
+                tag for tag in service_tags[service_id] if tag not in tags
+            )
+    if user_id is not None:
+        yield user
 
 
 class MarzNodeDB:
     def list_users(self):
+        """yields the (user_id, username, key, tags) of the node users"""
         with GetDB() as db:
-            relations = crud.get_node_users(db, self.id)
-            users = dict()
-            for rel in relations:
-                if not users.get(rel[0]):
-                    users[rel[0]] = dict(
-                        username=rel[1], id=rel[0], key=rel[2], inbounds=[]
-                    )
-                users[rel[0]]["inbounds"].append(rel[3].tag)
-        return list(users.values())
+            service_tags = crud.get_node_service_tags(db, self.id)
+            if not service_tags:
+                return
+            yield from group_user_rows(
+                crud.get_node_users(
+                    db, list(service_tags), yield_per=REPOPULATE_CHUNK_SIZE
+                ),
+                service_tags,
+            )
+
+    def iter_users(self, chunk_size: int = REPOPULATE_CHUNK_SIZE):
+        """yields the users of the node in chunks as they are fetched"""
+        users = self.list_users()
+        while chunk := list(islice(users, chunk_size)):
+            yield chunk
+
+    async def fetch_user_chunks(self):
+        """yields the chunks of iter_users, each fetched in a thread"""
+        chunks = self.iter_users()
+        while chunk := await asyncio.to_thread(next, chunks, None):
+            yield chunk
+
+    def list_user_changes(self, since: int) -> list[tuple] | None:
+        """
+        returns the (user, inbounds, sequence) of the users changed after
+        the last sequence the node applied, None if the node has to be
+        repopulated
+        """
+        if not since or since > change_sequence.current:
+            return None
+        with GetDB() as db:
+            return crud.get_node_user_changes(
+                db, self.id, since, INCREMENTAL_SYNC_LIMIT
+            )
 
     def store_backends(self, backends):
-        inbounds = [
-            inbound for backend in backends for inbound in backend.inbounds
-        ]
+        """stores the backends and inbounds of the node if they changed"""
+        fingerprint = backends_fingerprint(backends)
         with GetDB() as db:
+            if crud.get_node_backends_fingerprint(db, self.id) == fingerprint:
+                return
+            inbounds = [
+                inbound for backend in backends for inbound in backend.inbounds
+            ]
             crud.ensure_node_backends(db, backends, self.id)
+            crud.set_node_backends_fingerprint(db, self.id, fingerprint)
             crud.ensure_node_inbounds(db, inbounds, self.id)
 
     def set_status(self, status: NodeStatus, message: str | None = None):
-        with GetDB() as db:
-            crud.update_node_status(db, self.id, status, message)
+        node_health.set(self.id, status, message)
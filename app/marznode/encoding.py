@@ -0,0 +1,67 @@
+"""conversions between the node messages and the compact forms the panel uses"""
+
+import hashlib
+from array import array
+from typing import Iterable
+
+from .marznode_pb2 import PackedUsersData, UsersStats
+
+
+def decode_users_stats(response: UsersStats) -> tuple[array, array]:
+    """
+    returns the uids and usages of a stats response as arrays, whether
+    the node sent them packed or as nested messages; zero usages are dropped
+    """
+    if response.uids:
+        uids = array("I", response.uids)
+        usages = array("Q", response.usages)
+        if 0 not in usages:
+            return uids, usages
+        pairs = [(u, v) for u, v in zip(uids, usages) if v]
+        return array("I", (u for u, _ in pairs)), array(
+            "Q", (v for _, v in pairs)
+        )
+
+    uids, usages = array("I"), array("Q")
+    for stat in response.users_stats:
+        if stat.usage:
+            uids.append(stat.uid)
+            usages.append(stat.usage)
+    return uids, usages
+
+
+def pack_users_data(users_data: Iterable[tuple]) -> PackedUsersData:
+    """
+    encodes the (user_id, username, key, tags) of users as columns,
+    sharing the inbound tags between them
+    """
+    tags: dict[str, int] = dict()
+    ids, usernames, keys = array("I"), list(), list()
+    inbound_counts, inbound_indexes = array("I"), array("I")
+    for user_id, username, key, user_tags in users_data:
+        ids.append(user_id)
+        usernames.append(username)
+        keys.append(key)
+        inbound_counts.append(len(user_tags))
+        for tag in user_tags:
+            inbound_indexes.append(tags.setdefault(tag, len(tags)))
+    return PackedUsersData(
+        ids=ids,
+        usernames=usernames,
+        keys=keys,
+        tags=list(tags),
+        inbound_counts=inbound_counts,
+        inbound_indexes=inbound_indexes,
+    )
+
+
+def backends_fingerprint(backends) -> str:
+    """a hash of the backends and inbounds a node reports, in any order"""
+    digest = hashlib.sha256()
+    for backend in sorted(backends, key=lambda b: b.name):
+        digest.update(
+            repr((backend.name, backend.type, backend.version)).encode()
+        )
+        for inbound in sorted(backend.inbounds, key=lambda i: i.tag):
+            digest.update(repr((inbound.tag, inbound.config)).encode())
+    return digest.hexdigest()
@@ -3,11 +3,14 @@ import atexit
 import logging
 
 from _testcapi import INT_MAX
-from grpc import ChannelConnectivity, RpcError
-from grpc.aio import insecure_channel
+from grpc import ChannelConnectivity, RpcError, StatusCode
+from grpc.aio import AioRpcError, insecure_channel
 
+from app.db import change_sequence
 from .base import MarzNodeBase
-from .database import MarzNodeDB
+from .database import MarzNodeDB, sync_slots
+from .encoding import decode_users_stats, pack_users_data
+from .outbox import UpdatePriority, UserUpdatesOutbox
 from .marznode_pb2 import (
     UserData,
     UsersData,
@@ -19,12 +22,16 @@ from .marznode_pb2 import (
     BackendConfig,
     Backend,
     BackendStats,
+    UsersStatsRequest,
 )
 from .marznode_pb2_grpc import MarzServiceStub
 from ..models.node import NodeStatus
 
 logger = logging.getLogger(__name__)
 
+# seconds to wait before syncing a node again which ended its stream
+RESYNC_DELAY = 1
+
 channel_options = [
     ("grpc.keepalive_time_ms", 8000),
     ("grpc.keepalive_timeout_ms", 5000),
@@ -48,17 +55,28 @@ class MarzNodeGRPCIO(MarzNodeBase, MarzNodeDB):
             f"{self._address}:{self._port}", channel_options
         )
         self._stub = MarzServiceStub(self._channel)
-        asyncio.create_task(self._monitor_channel())
+        self._monitor_task = asyncio.create_task(self._monitor_channel())
         self._streaming_task = None
 
-        self._updates_queue = asyncio.Queue(5)
+        self.outbox = UserUpdatesOutbox(
+            settled=lambda: change_sequence.settled
+        )
         self.synced = False
         self.usage_coefficient = usage_coefficient
+        self._packed_users = True
+        self._streamed_users = True
         atexit.register(self._close_channel)
 
     def _close_channel(self):
         asyncio.run(self._channel.close())
 
+    async def stop(self):
+        """stops connecting to the node, e.g. once it is removed"""
+        self._monitor_task.cancel()
+        if self._streaming_task:
+            self._streaming_task.cancel()
+        await self._channel.close()
+
     async def _monitor_channel(self):
         try:
             await asyncio.wait_for(self._channel.channel_ready(), timeout=5)
@@ -79,64 +97,183 @@ class MarzNodeGRPCIO(MarzNodeBase, MarzNodeDB):
                 self.set_status(NodeStatus.unhealthy)
                 if self._streaming_task:
                     self._streaming_task.cancel()
+                    self._streaming_task = None
             else:
                 self.set_status(NodeStatus.healthy)
                 logger.info("Connected to node %i", self.id)
 
-            await self._channel.wait_for_state_change(state)
+            await self._wait_for_change(state)
+
+    async def _wait_for_change(self, state: ChannelConnectivity):
+        """
+        waits for the channel state to change, or for the user updates
+        stream to end, after which the node is synced again
+        """
+        changed = asyncio.ensure_future(
+            self._channel.wait_for_state_change(state)
+        )
+        waits = [changed]
+        if self._streaming_task:
+            waits.append(self._streaming_task)
+        try:
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            changed.cancel()
+        if not changed.done():
+            # the stream ended on a connection which is still ready
+            await asyncio.sleep(RESYNC_DELAY)
 
     async def _stream_user_updates(self):
         logger.debug("opened the stream")
         stream = self._stub.SyncUsers()
+        # completes as soon as the node ends the stream, even while there
+        # is nothing to send
+        closed = asyncio.ensure_future(stream)
+        try:
+            await self._send_user_updates(stream, closed)
+        except (RpcError, asyncio.InvalidStateError) as exc:
+            logger.debug("node %i stream failed: %r", self.id, exc)
+        finally:
+            closed.cancel()
+        logger.info("node %i detached", self.id)
+        self.synced = False
+        self.set_status(NodeStatus.unhealthy)
+
+    async def _send_user_updates(self, stream, closed: asyncio.Future):
         while True:
-            user_update = await self._updates_queue.get()
-            logger.debug("got something from queue")
-            user = user_update["user"]
+            pending = asyncio.ensure_future(self.outbox.get_batch())
             try:
+                await asyncio.wait(
+                    [pending, closed], return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                pending.cancel()
+            if closed.done():
+                return closed.result()
+            batch, sequence = pending.result()
+            logger.debug("sending %i user updates", len(batch))
+            last = len(batch) - 1
+            for i, (user, inbounds) in enumerate(batch):
+                # only the last message carries the sequence, a node which
+                # got part of the batch hasn't got all the changes up to it
                 await stream.write(
                     UserData(
                         user=User(
-                            id=user.id, username=user.username, key=user.key
+                            id=user.id,
+                            username=user.username,
+                            key=user.key,
                         ),
-                        inbounds=[
-                            Inbound(tag=t) for t in user_update["inbounds"]
-                        ],
+                        inbounds=[Inbound(tag=t) for t in inbounds],
+                        sequence=sequence if i == last else 0,
                     )
                 )
-            except RpcError:
-                self.synced = False
-                self.set_status(NodeStatus.unhealthy)
-                return
 
-    async def update_user(self, user, inbounds: set[str] | None = None):
-        if inbounds is None:
-            inbounds = set()
+    async def update_user(
+        self, user, inbounds: set[str] | None = None, sequence: int = 0
+    ):
+        self.queue_user_updates([(user, inbounds, sequence)])
+
+    async def update_users(self, updates: list[tuple]) -> None:
+        self.queue_user_updates(updates)
 
-        await self._updates_queue.put({"user": user, "inbounds": inbounds})
+    def queue_user_updates(
+        self, updates: list[tuple], priority: UpdatePriority | None = None
+    ) -> None:
+        for user, inbounds, sequence in updates:
+            self.outbox.put(user, inbounds or (), sequence, priority)
 
-    async def _repopulate_users(self, users_data: list[dict]) -> None:
+    async def _repopulate_users(self, sequence: int = 0) -> None:
+        if self._packed_users:
+            try:
+                packed = await asyncio.to_thread(
+                    pack_users_data, self.list_users()
+                )
+                packed.sequence = sequence
+                await self._stub.RepopulatePackedUsers(packed)
+                return
+            except AioRpcError as exc:
+                if exc.code() != StatusCode.UNIMPLEMENTED:
+                    raise
+                # older nodes only take the nested messages
+                self._packed_users = False
         updates = [
             UserData(
-                user=User(id=u["id"], username=u["username"], key=u["key"]),
-                inbounds=[Inbound(tag=t) for t in u["inbounds"]],
+                user=User(id=user_id, username=username, key=key),
+                inbounds=[Inbound(tag=t) for t in tags],
             )
-            for u in users_data
+            for user_id, username, key, tags in self.list_users()
         ]
-        await self._stub.RepopulateUsers(UsersData(users_data=updates))
+        await self._stub.RepopulateUsers(
+            UsersData(users_data=updates, sequence=sequence)
+        )
+
+    async def _stream_repopulate_users(self, sequence: int) -> None:
+        async def chunks():
+            async for chunk in self.fetch_user_chunks():
+                packed = pack_users_data(chunk)
+                packed.sequence = sequence
+                yield packed
+
+        await self._stub.StreamRepopulateUsers(chunks())
+
+    async def _repopulate(self, sequence: int) -> None:
+        """repopulates the node, in chunks if the node takes them"""
+        if self._streamed_users:
+            try:
+                await self._stream_repopulate_users(sequence)
+                return
+            except AioRpcError as exc:
+                if exc.code() != StatusCode.UNIMPLEMENTED:
+                    raise
+                self._streamed_users = False
+        await self._repopulate_users(sequence)
+
+    async def _fetch_sync_state(self) -> int:
+        """the sequence of the last users data the node applied"""
+        try:
+            response = await self._stub.FetchSyncState(Empty())
+        except AioRpcError as exc:
+            if exc.code() != StatusCode.UNIMPLEMENTED:
+                raise
+            return 0
+        return response.sequence
 
     async def fetch_users_stats(self):
         response = await self._stub.FetchUsersStats(Empty())
-        return response.users_stats
+        return decode_users_stats(response)
+
+    async def stream_users_stats(self, interval: int):
+        try:
+            async for response in self._stub.StreamUsersStats(
+                UsersStatsRequest(interval=interval, packed=True)
+            ):
+                yield decode_users_stats(response)
+        except AioRpcError as exc:
+            if exc.code() == StatusCode.UNIMPLEMENTED:
+                raise NotImplementedError from exc
+            raise
 
     async def _fetch_backends(self) -> list:
         response = await self._stub.FetchBackends(Empty())
         return response.backends
 
     async def _sync(self):
-        backends = await self._fetch_backends()
-        self.store_backends(backends)
-        users = self.list_users()
-        await self._repopulate_users(users)
+        async with sync_slots:
+            backends = await self._fetch_backends()
+            await asyncio.to_thread(self.store_backends, backends)
+            since = await self._fetch_sync_state()
+            changes = await asyncio.to_thread(self.list_user_changes, since)
+            if changes is None:
+                since = change_sequence.settled
+                await self._repopulate(since)
+            else:
+                logger.info(
+                    "Sending %i changed users to node %i",
+                    len(changes),
+                    self.id,
+                )
+                self.queue_user_updates(changes)
+            self.outbox.advance(since)
         self.synced = True
 
     async def get_logs(self, name: str = "xray", include_buffer=True):
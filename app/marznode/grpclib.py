@@ -1,16 +1,21 @@
 import asyncio
 import atexit
 import logging
+import random
 import ssl
 import tempfile
+import time
 
-from grpclib import GRPCError
+from grpclib import GRPCError, Status
 from grpclib.client import Channel
 from grpclib.exceptions import StreamTerminatedError
 
+from app.db import change_sequence
 from .base import MarzNodeBase
-from .database import MarzNodeDB
+from .database import MarzNodeDB, sync_slots
+from .encoding import decode_users_stats, pack_users_data
 from .marznode_grpc import MarzServiceStub
+from .outbox import UpdatePriority, UserUpdatesOutbox
 from .marznode_pb2 import (
     UserData,
     UsersData,
@@ -22,11 +27,24 @@ from .marznode_pb2 import (
     Backend,
     RestartBackendRequest,
     BackendStats,
+    UsersStatsRequest,
 )
 from ..models.node import NodeStatus
 
 logger = logging.getLogger(__name__)
 
+# seconds to wait for a node to accept a connection
+CONNECT_TIMEOUT = 5
+# bounds of the delay before reconnecting to a node in seconds
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# a node which hasn't answered any call for this many seconds is probed
+# and its connection closed if it doesn't answer in KEEPALIVE_TIMEOUT
+KEEPALIVE_TIME = 20
+KEEPALIVE_TIMEOUT = 10
+# seconds a connection has to stay up for the reconnect delay to reset
+STABLE_CONNECTION_TIME = 60
+
 
 def string_to_temp_file(content: str):
     file = tempfile.NamedTemporaryFile(mode="w+t")
@@ -59,92 +77,258 @@ class MarzNodeGRPCLIB(MarzNodeBase, MarzNodeDB):
 
         self._channel = Channel(self._address, self._port, ssl=ctx)
         self._stub = MarzServiceStub(self._channel)
-        asyncio.create_task(self._monitor_channel())
+        self._answered_at = 0.0
+        self._monitor_task = asyncio.create_task(self._monitor_channel())
         self._streaming_task = None
 
-        self._updates_queue = asyncio.Queue(1)
+        self.outbox = UserUpdatesOutbox(
+            settled=lambda: change_sequence.settled
+        )
         self.synced = False
         self.usage_coefficient = usage_coefficient
+        self._packed_users = True
+        self._streamed_users = True
         atexit.register(self._channel.close)
 
+    async def stop(self):
+        """stops connecting to the node, e.g. once it is removed"""
+        self._monitor_task.cancel()
+        if self._streaming_task:
+            self._streaming_task.cancel()
+        self._channel.close()
+
     async def _monitor_channel(self):
-        while state := self._channel._state:
-            logger.debug("node %i channel state: %s", self.id, state.value)
+        """
+        connects and syncs the node, then waits for the user updates
+        stream to end or the node to stop answering; failed attempts and
+        connections which didn't stay up are retried after a jittered,
+        exponentially growing delay
+        """
+        failures = 0
+        while True:
+            if failures:
+                delay = min(
+                    RECONNECT_MAX_DELAY,
+                    RECONNECT_MIN_DELAY * 2 ** (failures - 1),
+                )
+                await asyncio.sleep(delay * random.uniform(0.5, 1))
             try:
-                await asyncio.wait_for(self._channel.__connect__(), timeout=2)
-            except Exception:
-                logger.debug("timeout for node, id: %i", self.id)
-                self.set_status(NodeStatus.unhealthy, "timeout")
-                self.synced = False
-                if self._streaming_task:
-                    self._streaming_task.cancel()
+                await self._probe(CONNECT_TIMEOUT)
+                await self._sync()
+            except Exception as exc:
+                failures += 1
+                logger.debug("node %i connection failed: %r", self.id, exc)
+                if isinstance(exc, asyncio.TimeoutError):
+                    self.set_status(NodeStatus.unhealthy, "timeout")
+                else:
+                    self.set_status(NodeStatus.unhealthy)
+                continue
+
+            connected_at = time.monotonic()
+            self._streaming_task = asyncio.create_task(
+                self._stream_user_updates()
+            )
+            self.set_status(NodeStatus.healthy)
+            logger.info("Connected to node %i", self.id)
+            await self._watch_stream()
+            self.synced = False
+            self.set_status(NodeStatus.unhealthy)
+            # a node ending the stream right after each sync isn't
+            # reconnected to in a tight loop
+            if time.monotonic() - connected_at < STABLE_CONNECTION_TIME:
+                failures += 1
             else:
-                if not self.synced:
-                    try:
-                        await self._sync()
-                    except:
-                        pass
-                    else:
-                        self._streaming_task = asyncio.create_task(
-                            self._stream_user_updates()
-                        )
-                        self.set_status(NodeStatus.healthy)
-                        logger.info("Connected to node %i", self.id)
-            await asyncio.sleep(10)
+                failures = 0
+
+    async def _probe(self, timeout: float) -> None:
+        """
+        makes a cheap call to the node, raising if it doesn't answer in
+        time; an error status is still an answer
+        """
+        try:
+            await self._stub.FetchSyncState(Empty(), timeout=timeout)
+        except GRPCError:
+            pass
+        self._answered_at = time.monotonic()
+
+    async def _watch_stream(self):
+        """
+        waits for the user updates stream to end; a node which didn't
+        answer any call for KEEPALIVE_TIME is probed, and its connection
+        closed if it doesn't answer
+        """
+        while not self._streaming_task.done():
+            idle = time.monotonic() - self._answered_at
+            if idle < KEEPALIVE_TIME:
+                await asyncio.wait(
+                    [self._streaming_task], timeout=KEEPALIVE_TIME - idle
+                )
+                continue
+            try:
+                await self._probe(KEEPALIVE_TIMEOUT)
+            except Exception as exc:
+                logger.info("node %i stopped answering: %r", self.id, exc)
+                self._channel.close()
+                self._streaming_task.cancel()
+                await asyncio.wait([self._streaming_task])
 
     async def _stream_user_updates(self):
         try:
             async with self._stub.SyncUsers.open() as stream:
+                await stream.send_request()
                 logger.debug("opened the stream")
-                while True:
-                    user_update = await self._updates_queue.get()
-                    logger.debug("got something from queue")
-                    user = user_update["user"]
-                    await stream.send_message(
-                        UserData(
-                            user=User(
-                                id=user.id,
-                                username=user.username,
-                                key=user.key,
-                            ),
-                            inbounds=[
-                                Inbound(tag=t) for t in user_update["inbounds"]
-                            ],
-                        )
-                    )
+                # finishes as soon as the node ends the stream or the
+                # connection is lost, even while there is nothing to send
+                closed = asyncio.ensure_future(stream.recv_initial_metadata())
+                try:
+                    await self._send_user_updates(stream, closed)
+                finally:
+                    closed.cancel()
         except (OSError, ConnectionError, GRPCError, StreamTerminatedError):
             logger.info("node %i detached", self.id)
             self.synced = False
 
-    async def update_user(self, user, inbounds: set[str] | None = None):
-        if inbounds is None:
-            inbounds = set()
+    async def _send_user_updates(self, stream, closed: asyncio.Future):
+        while True:
+            pending = asyncio.ensure_future(self.outbox.get_batch())
+            try:
+                await asyncio.wait(
+                    [pending, closed], return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                pending.cancel()
+            if closed.done():
+                return closed.result()
+            batch, sequence = pending.result()
+            logger.debug("sending %i user updates", len(batch))
+            last = len(batch) - 1
+            for i, (user, inbounds) in enumerate(batch):
+                # only the last message carries the sequence, a node which
+                # got part of the batch hasn't got all the changes up to it
+                await stream.send_message(
+                    UserData(
+                        user=User(
+                            id=user.id,
+                            username=user.username,
+                            key=user.key,
+                        ),
+                        inbounds=[Inbound(tag=t) for t in inbounds],
+                        sequence=sequence if i == last else 0,
+                    )
+                )
 
-        await self._updates_queue.put({"user": user, "inbounds": inbounds})
+    async def update_user(
+        self, user, inbounds: set[str] | None = None, sequence: int = 0
+    ):
+        self.queue_user_updates([(user, inbounds, sequence)])
+
+    async def update_users(self, updates: list[tuple]) -> None:
+        self.queue_user_updates(updates)
+
+    def queue_user_updates(
+        self, updates: list[tuple], priority: UpdatePriority | None = None
+    ) -> None:
+        for user, inbounds, sequence in updates:
+            self.outbox.put(user, inbounds or (), sequence, priority)
 
-    async def _repopulate_users(self, users_data: list[dict]) -> None:
+    async def _repopulate_users(self, sequence: int = 0) -> None:
+        if self._packed_users:
+            try:
+                packed = await asyncio.to_thread(
+                    pack_users_data, self.list_users()
+                )
+                packed.sequence = sequence
+                await self._stub.RepopulatePackedUsers(packed)
+                return
+            except GRPCError as exc:
+                if exc.status != Status.UNIMPLEMENTED:
+                    raise
+                # older nodes only take the nested messages
+                self._packed_users = False
         updates = [
             UserData(
-                user=User(id=u["id"], username=u["username"], key=u["key"]),
-                inbounds=[Inbound(tag=t) for t in u["inbounds"]],
+                user=User(id=user_id, username=username, key=key),
+                inbounds=[Inbound(tag=t) for t in tags],
             )
-            for u in users_data
+            for user_id, username, key, tags in self.list_users()
         ]
-        await self._stub.RepopulateUsers(UsersData(users_data=updates))
+        await self._stub.RepopulateUsers(
+            UsersData(users_data=updates, sequence=sequence)
+        )
+
+    async def _stream_repopulate_users(self, sequence: int) -> None:
+        async with self._stub.StreamRepopulateUsers.open() as stream:
+            # sent before the chunks, so a node without users is emptied
+            await stream.send_request()
+            async for chunk in self.fetch_user_chunks():
+                packed = pack_users_data(chunk)
+                packed.sequence = sequence
+                await stream.send_message(packed)
+            await stream.end()
+            await stream.recv_message()
+
+    async def _repopulate(self, sequence: int) -> None:
+        """repopulates the node, in chunks if the node takes them"""
+        if self._streamed_users:
+            try:
+                await self._stream_repopulate_users(sequence)
+                return
+            except GRPCError as exc:
+                if exc.status != Status.UNIMPLEMENTED:
+                    raise
+                self._streamed_users = False
+        await self._repopulate_users(sequence)
+
+    async def _fetch_sync_state(self) -> int:
+        """the sequence of the last users data the node applied"""
+        try:
+            response = await self._stub.FetchSyncState(Empty())
+        except GRPCError as exc:
+            if exc.status != Status.UNIMPLEMENTED:
+                raise
+            return 0
+        return response.sequence
 
     async def fetch_users_stats(self):
         response = await self._stub.FetchUsersStats(Empty())
-        return response.users_stats
+        self._answered_at = time.monotonic()
+        return decode_users_stats(response)
+
+    async def stream_users_stats(self, interval: int):
+        try:
+            async with self._stub.StreamUsersStats.open() as stm:
+                await stm.send_message(
+                    UsersStatsRequest(interval=interval, packed=True), end=True
+                )
+                async for response in stm:
+                    self._answered_at = time.monotonic()
+                    yield decode_users_stats(response)
+        except GRPCError as exc:
+            if exc.status == Status.UNIMPLEMENTED:
+                raise NotImplementedError from exc
+            raise
 
     async def _fetch_backends(self) -> list:
         response = await self._stub.FetchBackends(Empty())
         return response.backends
 
     async def _sync(self):
-        backends = await self._fetch_backends()
-        self.store_backends(backends)
-        users = self.list_users()
-        await self._repopulate_users(users)
+        async with sync_slots:
+            backends = await self._fetch_backends()
+            await asyncio.to_thread(self.store_backends, backends)
+            since = await self._fetch_sync_state()
+            changes = await asyncio.to_thread(self.list_user_changes, since)
+            if changes is None:
+                since = change_sequence.settled
+                await self._repopulate(since)
+            else:
+                logger.info(
+                    "Sending %i changed users to node %i",
+                    len(changes),
+                    self.id,
+                )
+                self.queue_user_updates(changes)
+            self.outbox.advance(since)
         self.synced = True
 
     async def get_logs(self, name: str = "xray", include_buffer=True):
@@ -173,7 +357,9 @@ class MarzNodeGRPCLIB(MarzNodeBase, MarzNodeDB):
             await self._sync()
         except:
             self.synced = False
-            self.set_status(NodeStatus.unhealthy)
+            # the monitor reconnects once the stream is gone
+            if self._streaming_task:
+                self._streaming_task.cancel()
             raise
         else:
             self.set_status(NodeStatus.healthy)
@@ -0,0 +1,142 @@
+"""shares one log stream of each node backend between all of its viewers"""
+
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# lines of each backend kept to be replayed to new viewers
+LOG_BUFFER_LINES = 1000
+# lines a viewer may fall behind before its oldest ones are dropped
+SUBSCRIBER_QUEUE_LINES = 1000
+
+
+def line_filter(
+    pattern: str | None, regex: bool = False
+) -> Callable[[str], bool] | None:
+    """
+    a predicate matching the lines containing pattern, or matching it as
+    a regular expression; raises re.error for an invalid expression
+    """
+    if not pattern:
+        return None
+    if regex:
+        return re.compile(pattern).search
+    return lambda line: pattern in line
+
+
+class LogSubscriber:
+    def __init__(self, matches: Callable[[str], bool] | None = None):
+        self._matches = matches
+        self._lines: deque[str | None] = deque()
+        self._ready = asyncio.Event()
+
+    def put(self, line: str | None) -> None:
+        """queues a line, None ends the stream; never blocks the others"""
+        if line is not None:
+            if self._matches and not self._matches(line):
+                return
+            if len(self._lines) >= SUBSCRIBER_QUEUE_LINES:
+                self._lines.popleft()
+        self._lines.append(line)
+        self._ready.set()
+
+    async def get(self) -> str | None:
+        while not self._lines:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._lines.popleft()
+
+
+class LogBroadcaster:
+    """
+    reads the logs of a node backend once, keeping the latest lines, and
+    passes them to its subscribers; the stream starts with the first one
+    and stops after the last one leaves
+    """
+
+    def __init__(self, node, backend: str):
+        self.node = node
+        self.backend = backend
+        self._buffer: deque[str] = deque(maxlen=LOG_BUFFER_LINES)
+        self._subscribers: set[LogSubscriber] = set()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(
+        self,
+        include_buffer: bool = True,
+        matches: Callable[[str], bool] | None = None,
+    ) -> LogSubscriber:
+        subscriber = LogSubscriber(matches)
+        if include_buffer:
+            for line in self._buffer:
+                subscriber.put(line)
+        self._subscribers.add(subscriber)
+        if self._task is None:
+            # the node's own buffer is fetched once, for the first viewer
+            self._task = asyncio.create_task(self._stream(include_buffer))
+        return subscriber
+
+    def unsubscribe(self, subscriber: LogSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+        if not self._subscribers:
+            self.close()
+
+    def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for subscriber in self._subscribers:
+            subscriber.put(None)
+        self._subscribers.clear()
+        self._buffer.clear()
+        if broadcasters.get((self.node.id, self.backend)) is self:
+            del broadcasters[(self.node.id, self.backend)]
+
+    async def _stream(self, include_buffer: bool):
+        try:
+            async for line in self.node.get_logs(
+                name=self.backend, include_buffer=include_buffer
+            ):
+                self._buffer.append(line)
+                for subscriber in self._subscribers:
+                    subscriber.put(line)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.debug(
+                "log stream of node %i backend %s ended: %r",
+                self.node.id,
+                self.backend,
+                exc,
+            )
+        self._task = None
+        self.close()
+
+
+broadcasters: dict[tuple[int, str], LogBroadcaster] = {}
+
+
+def get_broadcaster(node, backend: str) -> LogBroadcaster:
+    """the broadcaster of a backend of the node, made on first use"""
+    broadcaster = broadcasters.get((node.id, backend))
+    if broadcaster is not None and broadcaster.node is not node:
+        # the node was replaced since
+        broadcaster.close()
+        broadcaster = None
+    if broadcaster is None:
+        broadcaster = broadcasters[(node.id, backend)] = LogBroadcaster(
+            node, backend
+        )
+    return broadcaster
+
+
+def close_broadcasters(node_id: int) -> None:
+    for key in [key for key in broadcasters if key[0] == node_id]:
+        broadcasters[key].close()
@@ -22,6 +22,18 @@ class MarzServiceBase(abc.ABC):
     async def RepopulateUsers(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.UsersData, app.marznode.marznode_pb2.Empty]') -> None:
         pass
 
+    @abc.abstractmethod
+    async def RepopulatePackedUsers(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.PackedUsersData, app.marznode.marznode_pb2.Empty]') -> None:
+        pass
+
+    @abc.abstractmethod
+    async def StreamRepopulateUsers(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.PackedUsersData, app.marznode.marznode_pb2.Empty]') -> None:
+        pass
+
+    @abc.abstractmethod
+    async def FetchSyncState(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.Empty, app.marznode.marznode_pb2.SyncState]') -> None:
+        pass
+
     @abc.abstractmethod
     async def FetchBackends(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.Empty, app.marznode.marznode_pb2.BackendsResponse]') -> None:
         pass
@@ -30,6 +42,10 @@ class MarzServiceBase(abc.ABC):
     async def FetchUsersStats(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.Empty, app.marznode.marznode_pb2.UsersStats]') -> None:
         pass
 
+    @abc.abstractmethod
+    async def StreamUsersStats(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.UsersStatsRequest, app.marznode.marznode_pb2.UsersStats]') -> None:
+        pass
+
     @abc.abstractmethod
     async def FetchBackendConfig(self, stream: 'grpclib.server.Stream[app.marznode.marznode_pb2.Backend, app.marznode.marznode_pb2.BackendConfig]') -> None:
         pass
@@ -60,6 +76,24 @@ class MarzServiceBase(abc.ABC):
                 app.marznode.marznode_pb2.UsersData,
                 app.marznode.marznode_pb2.Empty,
             ),
+            '/marznode.MarzService/RepopulatePackedUsers': grpclib.const.Handler(
+                self.RepopulatePackedUsers,
+                grpclib.const.Cardinality.UNARY_UNARY,
+                app.marznode.marznode_pb2.PackedUsersData,
+                app.marznode.marznode_pb2.Empty,
+            ),
+            '/marznode.MarzService/StreamRepopulateUsers': grpclib.const.Handler(
+                self.StreamRepopulateUsers,
+                grpclib.const.Cardinality.STREAM_UNARY,
+                app.marznode.marznode_pb2.PackedUsersData,
+                app.marznode.marznode_pb2.Empty,
+            ),
+            '/marznode.MarzService/FetchSyncState': grpclib.const.Handler(
+                self.FetchSyncState,
+                grpclib.const.Cardinality.UNARY_UNARY,
+                app.marznode.marznode_pb2.Empty,
+                app.marznode.marznode_pb2.SyncState,
+            ),
             '/marznode.MarzService/FetchBackends': grpclib.const.Handler(
                 self.FetchBackends,
                 grpclib.const.Cardinality.UNARY_UNARY,
@@ -72,6 +106,12 @@ class MarzServiceBase(abc.ABC):
                 app.marznode.marznode_pb2.Empty,
                 app.marznode.marznode_pb2.UsersStats,
             ),
+            '/marznode.MarzService/StreamUsersStats': grpclib.const.Handler(
+                self.StreamUsersStats,
+                grpclib.const.Cardinality.UNARY_STREAM,
+                app.marznode.marznode_pb2.UsersStatsRequest,
+                app.marznode.marznode_pb2.UsersStats,
+            ),
             '/marznode.MarzService/FetchBackendConfig': grpclib.const.Handler(
                 self.FetchBackendConfig,
                 grpclib.const.Cardinality.UNARY_UNARY,
@@ -114,6 +154,24 @@ class MarzServiceStub:
             app.marznode.marznode_pb2.UsersData,
             app.marznode.marznode_pb2.Empty,
         )
+        self.RepopulatePackedUsers = grpclib.client.UnaryUnaryMethod(
+            channel,
+            '/marznode.MarzService/RepopulatePackedUsers',
+            app.marznode.marznode_pb2.PackedUsersData,
+            app.marznode.marznode_pb2.Empty,
+        )
+        self.StreamRepopulateUsers = grpclib.client.StreamUnaryMethod(
+            channel,
+            '/marznode.MarzService/StreamRepopulateUsers',
+            app.marznode.marznode_pb2.PackedUsersData,
+            app.marznode.marznode_pb2.Empty,
+        )
+        self.FetchSyncState = grpclib.client.UnaryUnaryMethod(
+            channel,
+            '/marznode.MarzService/FetchSyncState',
+            app.marznode.marznode_pb2.Empty,
+            app.marznode.marznode_pb2.SyncState,
+        )
         self.FetchBackends = grpclib.client.UnaryUnaryMethod(
             channel,
             '/marznode.MarzService/FetchBackends',
@@ -126,6 +184,12 @@ class MarzServiceStub:
             app.marznode.marznode_pb2.Empty,
             app.marznode.marznode_pb2.UsersStats,
         )
+        self.StreamUsersStats = grpclib.client.UnaryStreamMethod(
+            channel,
+            '/marznode.MarzService/StreamUsersStats',
+            app.marznode.marznode_pb2.UsersStatsRequest,
+            app.marznode.marznode_pb2.UsersStats,
+        )
         self.FetchBackendConfig = grpclib.client.UnaryUnaryMethod(
             channel,
             '/marznode.MarzService/FetchBackendConfig',
@@ -14,15 +14,15 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1b\x61pp/marznode/marznode.proto\x12\x08marznode\"\x07\n\x05\x45mpty\"z\n\x07\x42\x61\x63kend\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x11\n\x04type\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x14\n\x07version\x18\x03 \x01(\tH\x01\x88\x01\x01\x12#\n\x08inbounds\x18\x04 \x03(\x0b\x32\x11.marznode.InboundB\x07\n\x05_typeB\n\n\x08_version\"7\n\x10\x42\x61\x63kendsResponse\x12#\n\x08\x62\x61\x63kends\x18\x01 \x03(\x0b\x32\x11.marznode.Backend\"6\n\x07Inbound\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12\x13\n\x06\x63onfig\x18\x02 \x01(\tH\x00\x88\x01\x01\x42\t\n\x07_config\"1\n\x04User\x12\n\n\x02id\x18\x01 \x01(\r\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x0b\n\x03key\x18\x03 \x01(\t\"M\n\x08UserData\x12\x1c\n\x04user\x18\x01 \x01(\x0b\x32\x0e.marznode.User\x12#\n\x08inbounds\x18\x02 \x03(\x0b\x32\x11.marznode.Inbound\"3\n\tUsersData\x12&\n\nusers_data\x18\x01 \x03(\x0b\x32\x12.marznode.UserData\"j\n\nUsersStats\x12\x33\n\x0busers_stats\x18\x01 \x03(\x0b\x32\x1e.marznode.UsersStats.UserStats\x1a\'\n\tUserStats\x12\x0b\n\x03uid\x18\x01 \x01(\r\x12\r\n\x05usage\x18\x02 \x01(\x04\"\x17\n\x07LogLine\x12\x0c\n\x04line\x18\x01 \x01(\t\"U\n\rBackendConfig\x12\x15\n\rconfiguration\x18\x01 \x01(\t\x12-\n\rconfig_format\x18\x02 \x01(\x0e\x32\x16.marznode.ConfigFormat\"B\n\x12\x42\x61\x63kendLogsRequest\x12\x14\n\x0c\x62\x61\x63kend_name\x18\x01 \x01(\t\x12\x16\n\x0einclude_buffer\x18\x02 \x01(\x08\"f\n\x15RestartBackendRequest\x12\x14\n\x0c\x62\x61\x63kend_name\x18\x01 \x01(\t\x12,\n\x06\x63onfig\x18\x02 \x01(\x0b\x32\x17.marznode.BackendConfigH\x00\x88\x01\x01\x42\t\n\x07_config\"\x1f\n\x0c\x42\x61\x63kendStats\x12\x0f\n\x07running\x18\x01 \x01(\x08*-\n\x0c\x43onfigFormat\x12\t\n\x05PLAIN\x10\x00\x12\x08\n\x04JSON\x10\x01\x12\x08\n\x04YAML\x10\x02\x32\xfe\x03\n\x0bMarzService\x12\x32\n\tSyncUsers\x12\x12.marznode.UserData\x1a\x0f.marznode.Empty(\x01\x12\x37\n\x0fRepopulateUsers\x12\x13.marznode.UsersData\x1a\x0f.marznode.Empty\x12<\n\rFetchBackends\x12\x0f.marznode.Empty\x1a\x1a.marznode.BackendsResponse\x12\x38\n\x0f\x46\x65tchUsersStats\x12\x0f.marznode.Empty\x1a\x14.marznode.UsersStats\x12@\n\x12\x46\x65tchBackendConfig\x12\x11.marznode.Backend\x1a\x17.marznode.BackendConfig\x12\x42\n\x0eRestartBackend\x12\x1f.marznode.RestartBackendRequest\x1a\x0f.marznode.Empty\x12\x46\n\x11StreamBackendLogs\x12\x1c.marznode.BackendLogsRequest\x1a\x11.marznode.LogLine0\x01\x12<\n\x0fGetBackendStats\x12\x11.marznode.Backend\x1a\x16.marznode.BackendStatsb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1b\x61pp/marznode/marznode.proto\x12\x08marznode\"\x07\n\x05\x45mpty\"z\n\x07\x42\x61\x63kend\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x11\n\x04type\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x14\n\x07version\x18\x03 \x01(\tH\x01\x88\x01\x01\x12#\n\x08inbounds\x18\x04 \x03(\x0b\x32\x11.marznode.InboundB\x07\n\x05_typeB\n\n\x08_version\"7\n\x10\x42\x61\x63kendsResponse\x12#\n\x08\x62\x61\x63kends\x18\x01 \x03(\x0b\x32\x11.marznode.Backend\"6\n\x07Inbound\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12\x13\n\x06\x63onfig\x18\x02 \x01(\tH\x00\x88\x01\x01\x42\t\n\x07_config\"1\n\x04User\x12\n\n\x02id\x18\x01 \x01(\r\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x0b\n\x03key\x18\x03 \x01(\t\"_\n\x08UserData\x12\x1c\n\x04user\x18\x01 \x01(\x0b\x32\x0e.marznode.User\x12#\n\x08inbounds\x18\x02 \x03(\x0b\x32\x11.marznode.Inbound\x12\x10\n\x08sequence\x18\x03 \x01(\x04\"E\n\tUsersData\x12&\n\nusers_data\x18\x01 \x03(\x0b\x32\x12.marznode.UserData\x12\x10\n\x08sequence\x18\x02 \x01(\x04\"\x90\x01\n\x0fPackedUsersData\x12\x0b\n\x03ids\x18\x01 \x03(\r\x12\x11\n\tusernames\x18\x02 \x03(\t\x12\x0c\n\x04keys\x18\x03 \x03(\t\x12\x0c\n\x04tags\x18\x04 \x03(\t\x12\x16\n\x0einbound_counts\x18\x05 \x03(\r\x12\x17\n\x0finbound_indexes\x18\x06 \x03(\r\x12\x10\n\x08sequence\x18\x07 \x01(\x04\"\x1d\n\tSyncState\x12\x10\n\x08sequence\x18\x01 \x01(\x04\"\x88\x01\n\nUsersStats\x12\x33\n\x0busers_stats\x18\x01 \x03(\x0b\x32\x1e.marznode.UsersStats.UserStats\x12\x0c\n\x04uids\x18\x02 \x03(\r\x12\x0e\n\x06usages\x18\x03 \x03(\x04\x1a\'\n\tUserStats\x12\x0b\n\x03uid\x18\x01 \x01(\r\x12\r\n\x05usage\x18\x02 \x01(\x04\"I\n\x11UsersStatsRequest\x12\x10\n\x08interval\x18\x01 \x01(\r\x12\x12\n\nbatch_size\x18\x02 \x01(\r\x12\x0e\n\x06packed\x18\x03 \x01(\x08\"\x17\n\x07LogLine\x12\x0c\n\x04line\x18\x01 \x01(\t\"U\n\rBackendConfig\x12\x15\n\rconfiguration\x18\x01 \x01(\t\x12-\n\rconfig_format\x18\x02 \x01(\x0e\x32\x16.marznode.ConfigFormat\"B\n\x12\x42\x61\x63kendLogsRequest\x12\x14\n\x0c\x62\x61\x63kend_name\x18\x01 \x01(\t\x12\x16\n\x0einclude_buffer\x18\x02 \x01(\x08\"f\n\x15RestartBackendRequest\x12\x14\n\x0c\x62\x61\x63kend_name\x18\x01 \x01(\t\x12,\n\x06\x63onfig\x18\x02 \x01(\x0b\x32\x17.marznode.BackendConfigH\x00\x88\x01\x01\x42\t\n\x07_config\"\x1f\n\x0c\x42\x61\x63kendStats\x12\x0f\n\x07running\x18\x01 \x01(\x08*-\n\x0c\x43onfigFormat\x12\t\n\x05PLAIN\x10\x00\x12\x08\n\x04JSON\x10\x01\x12\x08\n\x04YAML\x10\x02\x32\x8b\x06\n\x0bMarzService\x12\x32\n\tSyncUsers\x12\x12.marznode.UserData\x1a\x0f.marznode.Empty(\x01\x12\x37\n\x0fRepopulateUsers\x12\x13.marznode.UsersData\x1a\x0f.marznode.Empty\x12\x43\n\x15RepopulatePackedUsers\x12\x19.marznode.PackedUsersData\x1a\x0f.marznode.Empty\x12\x45\n\x15StreamRepopulateUsers\x12\x19.marznode.PackedUsersData\x1a\x0f.marznode.Empty(\x01\x12\x36\n\x0e\x46\x65tchSyncState\x12\x0f.marznode.Empty\x1a\x13.marznode.SyncState\x12<\n\rFetchBackends\x12\x0f.marznode.Empty\x1a\x1a.marznode.BackendsResponse\x12\x38\n\x0f\x46\x65tchUsersStats\x12\x0f.marznode.Empty\x1a\x14.marznode.UsersStats\x12G\n\x10StreamUsersStats\x12\x1b.marznode.UsersStatsRequest\x1a\x14.marznode.UsersStats0\x01\x12@\n\x12\x46\x65tchBackendConfig\x12\x11.marznode.Backend\x1a\x17.marznode.BackendConfig\x12\x42\n\x0eRestartBackend\x12\x1f.marznode.RestartBackendRequest\x1a\x0f.marznode.Empty\x12\x46\n\x11StreamBackendLogs\x12\x1c.marznode.BackendLogsRequest\x1a\x11.marznode.LogLine0\x01\x12<\n\x0fGetBackendStats\x12\x11.marznode.Backend\x1a\x16.marznode.BackendStatsb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'app.marznode.marznode_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_CONFIGFORMAT']._serialized_start=895
-  _globals['_CONFIGFORMAT']._serialized_end=940
+  _globals['_CONFIGFORMAT']._serialized_start=1215
+  _globals['_CONFIGFORMAT']._serialized_end=1260
   _globals['_EMPTY']._serialized_start=41
   _globals['_EMPTY']._serialized_end=48
   _globals['_BACKEND']._serialized_start=50
@@ -34,23 +34,29 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_USER']._serialized_start=287
   _globals['_USER']._serialized_end=336
   _globals['_USERDATA']._serialized_start=338
-  _globals['_USERDATA']._serialized_end=415
-  _globals['_USERSDATA']._serialized_start=417
-  _globals['_USERSDATA']._serialized_end=468
-  _globals['_USERSSTATS']._serialized_start=470
-  _globals['_USERSSTATS']._serialized_end=576
-  _globals['_USERSSTATS_USERSTATS']._serialized_start=537
-  _globals['_USERSSTATS_USERSTATS']._serialized_end=576
-  _globals['_LOGLINE']._serialized_start=578
-  _globals['_LOGLINE']._serialized_end=601
-  _globals['_BACKENDCONFIG']._serialized_start=603
-  _globals['_BACKENDCONFIG']._serialized_end=688
-  _globals['_BACKENDLOGSREQUEST']._serialized_start=690
-  _globals['_BACKENDLOGSREQUEST']._serialized_end=756
-  _globals['_RESTARTBACKENDREQUEST']._serialized_start=758
-  _globals['_RESTARTBACKENDREQUEST']._serialized_end=860
-  _globals['_BACKENDSTATS']._serialized_start=862
-  _globals['_BACKENDSTATS']._serialized_end=893
-  _globals['_MARZSERVICE']._serialized_start=943
-  _globals['_MARZSERVICE']._serialized_end=1453
+  _globals['_USERDATA']._serialized_end=433
+  _globals['_USERSDATA']._serialized_start=435
+  _globals['_USERSDATA']._serialized_end=504
+  _globals['_PACKEDUSERSDATA']._serialized_start=507
+  _globals['_PACKEDUSERSDATA']._serialized_end=651
+  _globals['_SYNCSTATE']._serialized_start=653
+  _globals['_SYNCSTATE']._serialized_end=682
+  _globals['_USERSSTATS']._serialized_start=685
+  _globals['_USERSSTATS']._serialized_end=821
+  _globals['_USERSSTATS_USERSTATS']._serialized_start=782
+  _globals['_USERSSTATS_USERSTATS']._serialized_end=821
+  _globals['_USERSSTATSREQUEST']._serialized_start=823
+  _globals['_USERSSTATSREQUEST']._serialized_end=896
+  _globals['_LOGLINE']._serialized_start=898
+  _globals['_LOGLINE']._serialized_end=921
+  _globals['_BACKENDCONFIG']._serialized_start=923
+  _globals['_BACKENDCONFIG']._serialized_end=1008
+  _globals['_BACKENDLOGSREQUEST']._serialized_start=1010
+  _globals['_BACKENDLOGSREQUEST']._serialized_end=1076
+  _globals['_RESTARTBACKENDREQUEST']._serialized_start=1078
+  _globals['_RESTARTBACKENDREQUEST']._serialized_end=1180
+  _globals['_BACKENDSTATS']._serialized_start=1182
+  _globals['_BACKENDSTATS']._serialized_end=1213
+  _globals['_MARZSERVICE']._serialized_start=1263
+  _globals['_MARZSERVICE']._serialized_end=2042
 # @@protoc_insertion_point(module_scope)
@@ -56,21 +56,49 @@ class User(_message.Message):
     def __init__(self, id: _Optional[int] = ..., username: _Optional[str] = ..., key: _Optional[str] = ...) -> None: ...
 
 class UserData(_message.Message):
-    __slots__ = ("user", "inbounds")
+    __slots__ = ("user", "inbounds", "sequence")
     USER_FIELD_NUMBER: _ClassVar[int]
     INBOUNDS_FIELD_NUMBER: _ClassVar[int]
+    SEQUENCE_FIELD_NUMBER: _ClassVar[int]
     user: User
     inbounds: _containers.RepeatedCompositeFieldContainer[Inbound]
-    def __init__(self, user: _Optional[_Union[User, _Mapping]] = ..., inbounds: _Optional[_Iterable[_Union[Inbound, _Mapping]]] = ...) -> None: ...
+    sequence: int
+    def __init__(self, user: _Optional[_Union[User, _Mapping]] = ..., inbounds: _Optional[_Iterable[_Union[Inbound, _Mapping]]] = ..., sequence: _Optional[int] = ...) -> None: ...
 
 class UsersData(_message.Message):
-    __slots__ = ("users_data",)
+    __slots__ = ("users_data", "sequence")
     USERS_DATA_FIELD_NUMBER: _ClassVar[int]
+    SEQUENCE_FIELD_NUMBER: _ClassVar[int]
     users_data: _containers.RepeatedCompositeFieldContainer[UserData]
-    def __init__(self, users_data: _Optional[_Iterable[_Union[UserData, _Mapping]]] = ...) -> None: ...
+    sequence: int
+    def __init__(self, users_data: _Optional[_Iterable[_Union[UserData, _Mapping]]] = ..., sequence: _Optional[int] = ...) -> None: ...
+
+class PackedUsersData(_message.Message):
+    __slots__ = ("ids", "usernames", "keys", "tags", "inbound_counts", "inbound_indexes", "sequence")
+    IDS_FIELD_NUMBER: _ClassVar[int]
+    USERNAMES_FIELD_NUMBER: _ClassVar[int]
+    KEYS_FIELD_NUMBER: _ClassVar[int]
+    TAGS_FIELD_NUMBER: _ClassVar[int]
+    INBOUND_COUNTS_FIELD_NUMBER: _ClassVar[int]
+    INBOUND_INDEXES_FIELD_NUMBER: _ClassVar[int]
+    SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    ids: _containers.RepeatedScalarFieldContainer[int]
+    usernames: _containers.RepeatedScalarFieldContainer[str]
+    keys: _containers.RepeatedScalarFieldContainer[str]
+    tags: _containers.RepeatedScalarFieldContainer[str]
+    inbound_counts: _containers.RepeatedScalarFieldContainer[int]
+    inbound_indexes: _containers.RepeatedScalarFieldContainer[int]
+    sequence: int
+    def __init__(self, ids: _Optional[_Iterable[int]] = ..., usernames: _Optional[_Iterable[str]] = ..., keys: _Optional[_Iterable[str]] = ..., tags: _Optional[_Iterable[str]] = ..., inbound_counts: _Optional[_Iterable[int]] = ..., inbound_indexes: _Optional[_Iterable[int]] = ..., sequence: _Optional[int] = ...) -> None: ...
+
+class SyncState(_message.Message):
+    __slots__ = ("sequence",)
+    SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    sequence: int
+    def __init__(self, sequence: _Optional[int] = ...) -> None: ...
 
 class UsersStats(_message.Message):
-    __slots__ = ("users_stats",)
+    __slots__ = ("users_stats", "uids", "usages")
     class UserStats(_message.Message):
         __slots__ = ("uid", "usage")
         UID_FIELD_NUMBER: _ClassVar[int]
@@ -79,8 +107,22 @@ class UsersStats(_message.Message):
         usage: int
         def __init__(self, uid: _Optional[int] = ..., usage: _Optional[int] = ...) -> None: ...
     USERS_STATS_FIELD_NUMBER: _ClassVar[int]
+    UIDS_FIELD_NUMBER: _ClassVar[int]
+    USAGES_FIELD_NUMBER: _ClassVar[int]
     users_stats: _containers.RepeatedCompositeFieldContainer[UsersStats.UserStats]
-    def __init__(self, users_stats: _Optional[_Iterable[_Union[UsersStats.UserStats, _Mapping]]] = ...) -> None: ...
+    uids: _containers.RepeatedScalarFieldContainer[int]
+    usages: _containers.RepeatedScalarFieldContainer[int]
+    def __init__(self, users_stats: _Optional[_Iterable[_Union[UsersStats.UserStats, _Mapping]]] = ..., uids: _Optional[_Iterable[int]] = ..., usages: _Optional[_Iterable[int]] = ...) -> None: ...
+
+class UsersStatsRequest(_message.Message):
+    __slots__ = ("interval", "batch_size", "packed")
+    INTERVAL_FIELD_NUMBER: _ClassVar[int]
+    BATCH_SIZE_FIELD_NUMBER: _ClassVar[int]
+    PACKED_FIELD_NUMBER: _ClassVar[int]
+    interval: int
+    batch_size: int
+    packed: bool
+    def __init__(self, interval: _Optional[int] = ..., batch_size: _Optional[int] = ..., packed: bool = ...) -> None: ...
 
 class LogLine(_message.Message):
     __slots__ = ("line",)
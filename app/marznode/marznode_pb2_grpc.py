@@ -49,6 +49,21 @@ class MarzServiceStub(object):
                 request_serializer=app_dot_marznode_dot_marznode__pb2.UsersData.SerializeToString,
                 response_deserializer=app_dot_marznode_dot_marznode__pb2.Empty.FromString,
                 _registered_method=True)
+        self.RepopulatePackedUsers = channel.unary_unary(
+                '/marznode.MarzService/RepopulatePackedUsers',
+                request_serializer=app_dot_marznode_dot_marznode__pb2.PackedUsersData.SerializeToString,
+                response_deserializer=app_dot_marznode_dot_marznode__pb2.Empty.FromString,
+                _registered_method=True)
+        self.StreamRepopulateUsers = channel.stream_unary(
+                '/marznode.MarzService/StreamRepopulateUsers',
+                request_serializer=app_dot_marznode_dot_marznode__pb2.PackedUsersData.SerializeToString,
+                response_deserializer=app_dot_marznode_dot_marznode__pb2.Empty.FromString,
+                _registered_method=True)
+        self.FetchSyncState = channel.unary_unary(
+                '/marznode.MarzService/FetchSyncState',
+                request_serializer=app_dot_marznode_dot_marznode__pb2.Empty.SerializeToString,
+                response_deserializer=app_dot_marznode_dot_marznode__pb2.SyncState.FromString,
+                _registered_method=True)
         self.FetchBackends = channel.unary_unary(
                 '/marznode.MarzService/FetchBackends',
                 request_serializer=app_dot_marznode_dot_marznode__pb2.Empty.SerializeToString,
@@ -59,6 +74,11 @@ class MarzServiceStub(object):
                 request_serializer=app_dot_marznode_dot_marznode__pb2.Empty.SerializeToString,
                 response_deserializer=app_dot_marznode_dot_marznode__pb2.UsersStats.FromString,
                 _registered_method=True)
+        self.StreamUsersStats = channel.unary_stream(
+                '/marznode.MarzService/StreamUsersStats',
+                request_serializer=app_dot_marznode_dot_marznode__pb2.UsersStatsRequest.SerializeToString,
+                response_deserializer=app_dot_marznode_dot_marznode__pb2.UsersStats.FromString,
+                _registered_method=True)
         self.FetchBackendConfig = channel.unary_unary(
                 '/marznode.MarzService/FetchBackendConfig',
                 request_serializer=app_dot_marznode_dot_marznode__pb2.Backend.SerializeToString,
@@ -96,6 +116,26 @@ class MarzServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def RepopulatePackedUsers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamRepopulateUsers(self, request_iterator, context):
+        """repopulates the users sent in chunks, a user is never split between
+        chunks; the users are replaced once the stream ends
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FetchSyncState(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def FetchBackends(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -108,6 +148,12 @@ class MarzServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamUsersStats(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def FetchBackendConfig(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -145,6 +191,21 @@ def add_MarzServiceServicer_to_server(servicer, server):
                     request_deserializer=app_dot_marznode_dot_marznode__pb2.UsersData.FromString,
                     response_serializer=app_dot_marznode_dot_marznode__pb2.Empty.SerializeToString,
             ),
+            'RepopulatePackedUsers': grpc.unary_unary_rpc_method_handler(
+                    servicer.RepopulatePackedUsers,
+                    request_deserializer=app_dot_marznode_dot_marznode__pb2.PackedUsersData.FromString,
+                    response_serializer=app_dot_marznode_dot_marznode__pb2.Empty.SerializeToString,
+            ),
+            'StreamRepopulateUsers': grpc.stream_unary_rpc_method_handler(
+                    servicer.StreamRepopulateUsers,
+                    request_deserializer=app_dot_marznode_dot_marznode__pb2.PackedUsersData.FromString,
+                    response_serializer=app_dot_marznode_dot_marznode__pb2.Empty.SerializeToString,
+            ),
+            'FetchSyncState': grpc.unary_unary_rpc_method_handler(
+                    servicer.FetchSyncState,
+                    request_deserializer=app_dot_marznode_dot_marznode__pb2.Empty.FromString,
+                    response_serializer=app_dot_marznode_dot_marznode__pb2.SyncState.SerializeToString,
+            ),
             'FetchBackends': grpc.unary_unary_rpc_method_handler(
                     servicer.FetchBackends,
                     request_deserializer=app_dot_marznode_dot_marznode__pb2.Empty.FromString,
@@ -155,6 +216,11 @@ def add_MarzServiceServicer_to_server(servicer, server):
                     request_deserializer=app_dot_marznode_dot_marznode__pb2.Empty.FromString,
                     response_serializer=app_dot_marznode_dot_marznode__pb2.UsersStats.SerializeToString,
             ),
+            'StreamUsersStats': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamUsersStats,
+                    request_deserializer=app_dot_marznode_dot_marznode__pb2.UsersStatsRequest.FromString,
+                    response_serializer=app_dot_marznode_dot_marznode__pb2.UsersStats.SerializeToString,
+            ),
             'FetchBackendConfig': grpc.unary_unary_rpc_method_handler(
                     servicer.FetchBackendConfig,
                     request_deserializer=app_dot_marznode_dot_marznode__pb2.Backend.FromString,
@@ -240,6 +306,87 @@ class MarzService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def RepopulatePackedUsers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/marznode.MarzService/RepopulatePackedUsers',
+            app_dot_marznode_dot_marznode__pb2.PackedUsersData.SerializeToString,
+            app_dot_marznode_dot_marznode__pb2.Empty.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamRepopulateUsers(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/marznode.MarzService/StreamRepopulateUsers',
+            app_dot_marznode_dot_marznode__pb2.PackedUsersData.SerializeToString,
+            app_dot_marznode_dot_marznode__pb2.Empty.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def FetchSyncState(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/marznode.MarzService/FetchSyncState',
+            app_dot_marznode_dot_marznode__pb2.Empty.SerializeToString,
+            app_dot_marznode_dot_marznode__pb2.SyncState.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def FetchBackends(request,
             target,
@@ -294,6 +441,33 @@ class MarzService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def StreamUsersStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/marznode.MarzService/StreamUsersStats',
+            app_dot_marznode_dot_marznode__pb2.UsersStatsRequest.SerializeToString,
+            app_dot_marznode_dot_marznode__pb2.UsersStats.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def FetchBackendConfig(request,
             target,
@@ -1,10 +1,12 @@
-import asyncio
 from collections import defaultdict
 from typing import TYPE_CHECKING
 
-from app import marznode
+from app import marznode, usage
 from .grpcio import MarzNodeGRPCIO
 from .grpclib import MarzNodeGRPCLIB
+from .logs import close_broadcasters
+from .outbox import UpdatePriority
+from .status import node_health
 from ..models.node import NodeConnectionBackend
 from ..models.user import User
 
@@ -13,9 +15,15 @@ if TYPE_CHECKING:
 
 
 def update_user(
-    user: "DBUser", old_inbounds: set | None = None, remove: bool = False
+    user: "DBUser",
+    old_inbounds: set | None = None,
+    remove: bool = False,
+    priority: UpdatePriority | None = None,
 ):
-    """updates a user on all related nodes"""
+    """
+    updates a user on all related nodes as of its change sequence, the
+    removals from nodes are urgent unless a priority is given
+    """
     if old_inbounds is None:
         old_inbounds = set()
 
@@ -30,28 +38,83 @@ def update_user(
     for inb in old_inbounds:
         node_inbounds[inb[0]]
 
+    sequence = user.change_seq
+    user = User.model_validate(user)
     for node_id, tags in node_inbounds.items():
         if marznode.nodes.get(node_id):
-            asyncio.ensure_future(
-                marznode.nodes[node_id].update_user(
-                    user=User.model_validate(user), inbounds=tags
-                )
+            marznode.nodes[node_id].queue_user_updates(
+                [(user, tags, sequence)], priority
+            )
+
+
+def remove_users(
+    users: list["DBUser"],
+    node_ids: list[tuple[int, int]],
+    sequence: int | None = None,
+):
+    """
+    removes users from their nodes with one batch per node
+    node_ids: the (user_id, node_id) pairs of the nodes users are on
+    sequence: the change sequence of the removals, for users without
+    their own change_seq
+    """
+    users_by_id = {user.id: User.model_validate(user) for user in users}
+    sequences = {
+        user.id: user.change_seq if sequence is None else sequence
+        for user in users
+    }
+    node_updates = defaultdict(list)
+    for user_id, node_id in node_ids:
+        if user_id in users_by_id:
+            node_updates[node_id].append(
+                (users_by_id[user_id], [], sequences[user_id])
+            )
+
+    for node_id, updates in node_updates.items():
+        if marznode.nodes.get(node_id):
+            marznode.nodes[node_id].queue_user_updates(updates)
+
+
+def add_users(users: list["DBUser"], inbounds: list[tuple[int, int, str]]):
+    """
+    adds users to their nodes with one batch per node
+    inbounds: the (user_id, node_id, tag) of the inbounds users have
+    """
+    users_by_id = {user.id: User.model_validate(user) for user in users}
+    sequences = {user.id: user.change_seq for user in users}
+    node_tags = defaultdict(lambda: defaultdict(list))
+    for user_id, node_id, tag in inbounds:
+        if user_id in users_by_id:
+            node_tags[node_id][user_id].append(tag)
+
+    for node_id, user_tags in node_tags.items():
+        if marznode.nodes.get(node_id):
+            marznode.nodes[node_id].queue_user_updates(
+                [
+                    (users_by_id[user_id], tags, sequences[user_id])
+                    for user_id, tags in user_tags.items()
+                ]
             )
 
 
 async def remove_user(user: "DBUser"):
     node_ids = set(inb.node_id for inb in user.inbounds)
 
+    # the outboxes outlive the session of the db user
+    sequence = user.change_seq
+    user = User.model_validate(user)
     for node_id in node_ids:
         if marznode.nodes.get(node_id):
-            asyncio.ensure_future(
-                marznode.nodes[node_id].update_user(user=user, inbounds=[])
-            )
+            marznode.nodes[node_id].queue_user_updates([(user, [], sequence)])
 
 
 async def remove_node(node_id: int):
-    if node_id in marznode.nodes:
-        del marznode.nodes[node_id]
+    usage.stop_polling(node_id)
+    # the status of a stopped node isn't set anymore
+    if node := marznode.nodes.pop(node_id, None):
+        await node.stop()
+    node_health.forget(node_id)
+    close_broadcasters(node_id)
 
 
 async def add_node(db_node, certificate):
@@ -73,6 +136,13 @@ async def add_node(db_node, certificate):
             usage_coefficient=db_node.usage_coefficient,
         )
     marznode.nodes[db_node.id] = node
+    usage.start_polling(db_node.id, node)
 
 
-__all__ = ["update_user", "add_node", "remove_node"]
+__all__ = [
+    "update_user",
+    "add_users",
+    "remove_users",
+    "add_node",
+    "remove_node",
+]
@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import deque
+from enum import IntEnum
+from itertools import islice
+from typing import Callable
+
+# updates of each lane whose waits are kept for its latency percentiles
+LATENCY_SAMPLES = 1000
+
+
+class UpdatePriority(IntEnum):
+    """the lanes of an outbox, the lower ones are sent first"""
+
+    urgent = 0
+    normal = 1
+
+
+class OutboxLane:
+    """the pending updates of a priority and how long the sent ones waited"""
+
+    def __init__(self):
+        self.pending: dict[int, tuple] = {}
+        self.enqueued = 0
+        self.sent = 0
+        self.waits: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    @property
+    def oldest_age(self) -> float | None:
+        for _, _, enqueued_at, *_ in self.pending.values():
+            return time.monotonic() - enqueued_at
+        return None
+
+    def wait_percentile(self, percentile: float) -> float | None:
+        """a percentile, 0 to 100, of the waits of the latest sent updates"""
+        if not self.waits:
+            return None
+        waits = sorted(self.waits)
+        return waits[min(len(waits) - 1, int(len(waits) * percentile / 100))]
+
+
+class UserUpdatesOutbox:
+    """
+    keeps the latest pending state of each user to be sent to a node;
+    updating a user who is already pending replaces its state in place,
+    so it keeps its position and repeated edits are sent once. a node
+    keeps the key a user was added with, so a user whose removal or key
+    change is pending is sent as a removal followed by its new state.
+
+    the updates are kept in lanes by priority and a lane is only sent
+    from once the more urgent ones are empty, so e.g. a removal doesn't
+    wait behind a bulk of additions
+
+    each update carries the sequence of the change it reflects; a batch
+    acknowledges the latest sequence sent, but none which a pending update
+    or, as given by `settled`, a change not queued yet precedes
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        settled: Callable[[], int] = lambda: 0,
+    ):
+        self.batch_size = batch_size
+        self._settled = settled
+        self._sent_sequence = 0
+        self.lanes = {priority: OutboxLane() for priority in UpdatePriority}
+        self._ready = asyncio.Event()
+        self.enqueued = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.last_batch_size = 0
+
+    def __len__(self) -> int:
+        return sum(len(lane.pending) for lane in self.lanes.values())
+
+    def put(
+        self,
+        user,
+        inbounds,
+        sequence: int,
+        priority: UpdatePriority | None = None,
+    ) -> None:
+        """
+        queues the state of a user as of the change `sequence`, a removal
+        is urgent unless told otherwise; a pending user keeps the more
+        urgent of its lanes
+        """
+        if priority is None:
+            priority = (
+                UpdatePriority.normal if inbounds else UpdatePriority.urgent
+            )
+        self.enqueued += 1
+        enqueued_at = time.monotonic()
+        removes_first = False
+        for current, lane in self.lanes.items():
+            if pending := lane.pending.get(user.id):
+                self.coalesced += 1
+                pending_user, pending_inbounds, _, _, pending_removal = pending
+                sequence = max(sequence, pending[3])
+                removes_first = bool(inbounds) and (
+                    pending_removal
+                    or not pending_inbounds
+                    or pending_user.key != user.key
+                )
+                if current <= priority:
+                    priority, enqueued_at = current, pending[2]
+                else:
+                    del lane.pending[user.id]
+                break
+        lane = self.lanes[priority]
+        lane.enqueued += 1
+        lane.pending[user.id] = (
+            user,
+            inbounds,
+            enqueued_at,
+            sequence,
+            removes_first,
+        )
+        self._ready.set()
+
+    async def get_batch(self) -> tuple[list[tuple], int]:
+        """
+        waits for pending updates and takes up to batch_size of them, the
+        most urgent first, along with the sequence all the changes up to
+        which are sent once the whole batch is, 0 if there is none
+        """
+        while not len(self):
+            self._ready.clear()
+            await self._ready.wait()
+        batch, now = [], time.monotonic()
+        for lane in self.lanes.values():
+            if len(batch) >= self.batch_size:
+                break
+            user_ids = list(islice(lane.pending, self.batch_size - len(batch)))
+            for uid in user_ids:
+                user, inbounds, enqueued_at, sequence, removes_first = (
+                    lane.pending.pop(uid)
+                )
+                self._sent_sequence = max(self._sent_sequence, sequence)
+                lane.waits.append(now - enqueued_at)
+                if removes_first:
+                    batch.append((user, ()))
+                batch.append((user, inbounds))
+            lane.sent += len(user_ids)
+        self.sent += len(batch)
+        self.last_batch_size = len(batch)
+        sequence = min(self._sent_sequence, self._settled())
+        if len(self):
+            sequence = min(
+                sequence,
+                min(
+                    p[3]
+                    for lane in self.lanes.values()
+                    for p in lane.pending.values()
+                )
+                - 1,
+            )
+        return batch, max(sequence, 0)
+
+    def advance(self, sequence: int) -> None:
+        """
+        notes that the node holds the changes up to sequence, e.g. once it
+        is repopulated
+        """
+        self._sent_sequence = max(self._sent_sequence, sequence)
+
+    @property
+    def oldest_age(self) -> float | None:
+        """seconds the oldest pending update has been waiting for"""
+        return max(
+            (
+                age
+                for lane in self.lanes.values()
+                if (age := lane.oldest_age) is not None
+            ),
+            default=None,
+        )
@@ -0,0 +1,95 @@
+"""
+keeps the live status of the connected nodes and stores their changes in
+batches, off the event loop
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+from app.db import GetDB, crud
+from app.models.node import NodeStatus
+
+logger = logging.getLogger(__name__)
+
+
+class NodeHealth(NamedTuple):
+    status: NodeStatus
+    message: str | None
+    last_status_change: datetime
+
+
+class NodeHealthRegistry:
+    """
+    the authoritative status of the connected nodes; a change is stored
+    along with the other ones made within `delay` seconds, and setting
+    the status a node already has changes nothing
+    """
+
+    def __init__(self, delay: float = 0.5):
+        self.delay = delay
+        self._health: dict[int, NodeHealth] = {}
+        self._pending: set[int] = set()
+        self._task: asyncio.Task | None = None
+
+    def get(self, node_id: int) -> NodeHealth | None:
+        return self._health.get(node_id)
+
+    def statuses(self) -> dict[int, NodeStatus]:
+        return {
+            node_id: health.status for node_id, health in self._health.items()
+        }
+
+    def set(
+        self, node_id: int, status: NodeStatus, message: str | None = None
+    ) -> None:
+        current = self._health.get(node_id)
+        if current:
+            if current.status == status and message in (None, current.message):
+                return
+            # a change without a message keeps the last one
+            message = message or current.message
+        self._health[node_id] = NodeHealth(status, message, datetime.utcnow())
+        self._pending.add(node_id)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._write_later())
+
+    def forget(self, node_id: int) -> None:
+        """drops a node which is no longer connected, unstored changes too"""
+        self._health.pop(node_id, None)
+        self._pending.discard(node_id)
+
+    async def _write_later(self):
+        while self._pending:
+            await asyncio.sleep(self.delay)
+            await self.flush()
+
+    async def flush(self) -> None:
+        statuses = {
+            node_id: self._health[node_id]
+            for node_id in self._pending
+            if node_id in self._health
+        }
+        self._pending.clear()
+        if not statuses:
+            return
+        try:
+            await asyncio.to_thread(self._store, statuses)
+        except Exception:
+            logger.exception("Failed to store %i node statuses", len(statuses))
+
+    @staticmethod
+    def _store(statuses: dict[int, NodeHealth]) -> None:
+        with GetDB() as db:
+            crud.update_nodes_status(db, statuses)
+
+
+node_health = NodeHealthRegistry()
+
+
+def live_node_status(node_id: int, stored: NodeStatus) -> NodeStatus:
+    """the status of a node, live unless it is disabled or not connected"""
+    if stored != NodeStatus.disabled and (health := node_health.get(node_id)):
+        return health.status
+    return stored
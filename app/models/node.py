@@ -100,6 +100,7 @@ class NodeUsageResponse(BaseModel):
     node_name: str
     uplink: int
     downlink: int
+    usages: list[tuple[int, int]] | None = None
 
 
 class NodesUsageResponse(BaseModel):
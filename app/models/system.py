@@ -1,3 +1,6 @@
+from datetime import datetime
+from enum import Enum
+
 from pydantic import BaseModel
 
 
@@ -39,5 +42,56 @@ class NodesStats(BaseModel):
     unhealthy: int
 
 
+class UsageResolution(str, Enum):
+    hour = "hour"
+    day = "day"
+    week = "week"
+    month = "month"
+
+
 class TrafficUsageSeries(BaseModel):
     usages: list[tuple[int, int]]
+
+
+class NodePollingStats(BaseModel):
+    node_id: int
+    state: str
+    streaming: bool
+    polls: int
+    failures: int
+    consecutive_failures: int
+    timeout: float
+    last_latency: float | None = None
+    average_latency: float | None = None
+    last_success_at: datetime | None = None
+
+
+class OutboxLaneStats(BaseModel):
+    pending: int
+    oldest_age: float | None = None
+    enqueued: int
+    sent: int
+    wait_p50: float | None = None
+    wait_p99: float | None = None
+    wait_max: float | None = None
+
+
+class NodeOutboxStats(BaseModel):
+    node_id: int
+    pending: int
+    oldest_age: float | None = None
+    enqueued: int
+    coalesced: int
+    sent: int
+    last_batch_size: int
+    lanes: dict[str, OutboxLaneStats] = {}
+
+
+class UsageIngestionStats(BaseModel):
+    queued_records: int
+    buffered_usages: int
+    loop_lag_max: float
+    loop_lag_mean: float
+    journal_duration: float | None = None
+    flush_duration: float | None = None
+    nodes: list[NodePollingStats]
@@ -32,6 +32,14 @@ class UserDataUsageResetStrategy(str, Enum):
     year = "year"
 
 
+reset_strategy_to_days = {
+    UserDataUsageResetStrategy.day: 1,
+    UserDataUsageResetStrategy.week: 7,
+    UserDataUsageResetStrategy.month: 30,
+    UserDataUsageResetStrategy.year: 365,
+}
+
+
 class UserExpireStrategy(str, Enum):
     NEVER = "never"
     FIXED_DATE = "fixed_date"
@@ -1,12 +1,14 @@
+import asyncio
 import logging
+import re
 from typing import Annotated
 
 import sqlalchemy
+from sqlalchemy import and_, or_
 from fastapi import APIRouter, Body, Query
 from fastapi import HTTPException, WebSocket
 from fastapi_pagination.ext.sqlalchemy import paginate
 from fastapi_pagination.links import Page
-from starlette.websockets import WebSocketDisconnect
 
 from app import marznode
 from app.db import crud, get_tls_certificate
@@ -18,6 +20,8 @@ from app.dependencies import (
     StartDateDep,
     get_admin,
 )
+from app.marznode.logs import get_broadcaster, line_filter
+from app.marznode.status import node_health
 from app.models.node import (
     NodeCreate,
     NodeModify,
@@ -28,11 +32,22 @@ from app.models.node import (
     BackendConfig,
     BackendStats,
 )
+from app.models.system import UsageResolution
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/nodes", tags=["Node"])
 
 
+def live_node(db_node: Node) -> NodeResponse:
+    """the node with its live status if it is connected"""
+    node = NodeResponse.model_validate(db_node, from_attributes=True)
+    if node.status != NodeStatus.disabled and (
+        health := node_health.get(node.id)
+    ):
+        node.status, node.message = health.status, health.message
+    return node
+
+
 @router.get("", response_model=Page[NodeResponse])
 def get_nodes(
     db: DBDep,
@@ -46,9 +61,19 @@ def get_nodes(
         query = query.filter(Node.name.ilike(f"%{name}%"))
 
     if status:
-        query = query.filter(Node.status.in_(status))
+        live = node_health.statuses()
+        enabled = Node.status != NodeStatus.disabled
+        conditions = [
+            and_(enabled, Node.id.in_([i for i in live if live[i] in status])),
+            and_(enabled, Node.id.not_in(list(live)), Node.status.in_(status)),
+        ]
+        if NodeStatus.disabled in status:
+            conditions.append(~enabled)
+        query = query.filter(or_(*conditions))
 
-    return paginate(db, query)
+    return paginate(
+        db, query, transformer=lambda nodes: [live_node(n) for n in nodes]
+    )
 
 
 @router.post("", response_model=NodeResponse)
@@ -81,11 +106,12 @@ def get_usage(
     admin: SudoAdminDep,
     start_date: StartDateDep,
     end_date: EndDateDep,
+    resolution: UsageResolution | None = None,
 ):
     """
-    Get nodes usage
+    Get nodes usage, with a usage series per node if a resolution is given
     """
-    usages = crud.get_nodes_usage(db, start_date, end_date)
+    usages = crud.get_nodes_usage(db, start_date, end_date, resolution)
 
     return {"usages": usages}
 
@@ -96,7 +122,7 @@ def get_node(node_id: int, db: DBDep, admin: SudoAdminDep):
     if not db_node:
         raise HTTPException(status_code=404, detail="Node not found")
 
-    return db_node
+    return live_node(db_node)
 
 
 @router.websocket("/{node_id}/{backend}/logs")
@@ -106,7 +132,13 @@ async def node_logs(
     websocket: WebSocket,
     db: DBDep,
     include_buffer: bool = True,
+    search: str | None = None,
+    regex: bool = False,
 ):
+    """
+    Streams the logs of a node backend, only the lines containing `search`
+    or matching it as a regular expression if given
+    """
     token = websocket.query_params.get("token") or websocket.headers.get(
         "Authorization", ""
     ).removeprefix("Bearer ")
@@ -115,20 +147,41 @@ async def node_logs(
     if not admin or not admin.is_sudo:
         return await websocket.close(reason="You're not allowed", code=4403)
 
-    if not marznode.nodes.get(node_id):
+    if not (node := marznode.nodes.get(node_id)):
         return await websocket.close(reason="Node not found", code=4404)
 
+    try:
+        matches = line_filter(search, regex)
+    except re.error:
+        return await websocket.close(reason="Invalid expression", code=4400)
+
     await websocket.accept()
+    broadcaster = get_broadcaster(node, backend)
+    subscriber = broadcaster.subscribe(include_buffer, matches)
+
+    async def wait_closed():
+        # a filtered viewer may not be sent a line to notice it has left
+        # by, so it is unsubscribed as soon as it closes the socket
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+        finally:
+            broadcaster.unsubscribe(subscriber)
+            subscriber.put(None)
+
+    closed = asyncio.create_task(wait_closed())
     try:
-        async for line in marznode.nodes[node_id].get_logs(
-            name=backend, include_buffer=include_buffer
-        ):
-            try:
-                await websocket.send_text(line)
-            except WebSocketDisconnect:
-                break
-    except:
+        while (line := await subscriber.get()) is not None:
+            await websocket.send_text(line)
         await websocket.close()
+    except Exception:
+        # the viewer has left
+        pass
+    finally:
+        closed.cancel()
+        broadcaster.unsubscribe(subscriber)
 
 
 @router.put("/{node_id}", response_model=NodeResponse)
@@ -128,10 +128,15 @@ async def modify_service(
 
 
 @router.delete("/{id}")
-def remove_service(id: int, db: DBDep, admin: SudoAdminDep):
+async def remove_service(id: int, db: DBDep, admin: SudoAdminDep):
     dbservice = crud.get_service(db, id)
     if not dbservice:
         raise HTTPException(status_code=404, detail="Service not found")
 
+    old_inbounds = {(i.node_id, i.protocol, i.tag) for i in dbservice.inbounds}
+    users = list(dbservice.users)
     crud.remove_service(db, dbservice)
+    for user in users:
+        if user.activated:
+            marznode.operations.update_user(user, old_inbounds=old_inbounds)
     return dict()
@@ -9,6 +9,7 @@ from app.db import crud
 from app.db.models import Settings
 from app.dependencies import DBDep, SubUserDep, StartDateDep, EndDateDep
 from app.models.settings import SubscriptionSettings
+from app.models.system import UsageResolution
 from app.models.user import UserResponse
 from app.utils.share import (
     encode_title,
@@ -130,8 +131,11 @@ def user_get_usage(
     db: DBDep,
     start_date: StartDateDep,
     end_date: EndDateDep,
+    resolution: UsageResolution = UsageResolution.hour,
 ):
-    usages = crud.get_user_usages(db, db_user, start_date, end_date)
+    usages = crud.get_user_usages(
+        db, db_user, start_date, end_date, resolution
+    )
 
     return {"usages": usages, "username": db_user.username}
 
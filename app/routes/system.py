@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from app import marznode, usage
 from app.db import crud
 from app.db.models import Admin as DBAdmin, Settings
 from app.db.models import Node
@@ -10,15 +11,22 @@ from app.dependencies import (
     EndDateDep,
     StartDateDep,
 )
+from app.marznode.status import live_node_status
 from app.models.node import NodeStatus
 from app.models.settings import SubscriptionSettings, TelegramSettings
 from app.models.system import (
     UsersStats,
     NodesStats,
     AdminsStats,
+    NodeOutboxStats,
+    OutboxLaneStats,
+    NodePollingStats,
     TrafficUsageSeries,
+    UsageIngestionStats,
+    UsageResolution,
 )
 from app.models.user import UserExpireStrategy
+from app.utils.loop_monitor import loop_monitor
 
 router = APIRouter(tags=["System"], prefix="/system")
 
@@ -60,22 +68,90 @@ def get_admins_stats(db: DBDep, admin: SudoAdminDep):
 
 @router.get("/stats/nodes", response_model=NodesStats)
 def get_nodes_stats(db: DBDep, admin: SudoAdminDep):
+    statuses = [
+        live_node_status(node_id, status)
+        for node_id, status in db.query(Node.id, Node.status)
+    ]
     return NodesStats(
-        total=db.query(Node).count(),
-        healthy=db.query(Node)
-        .filter(Node.status == NodeStatus.healthy)
-        .count(),
-        unhealthy=db.query(Node)
-        .filter(Node.status == NodeStatus.unhealthy)
-        .count(),
+        total=len(statuses),
+        healthy=statuses.count(NodeStatus.healthy),
+        unhealthy=statuses.count(NodeStatus.unhealthy),
     )
 
 
+@router.get("/stats/ingestion", response_model=UsageIngestionStats)
+def get_ingestion_stats(admin: SudoAdminDep):
+    """
+    Usage ingestion metrics, durations, latencies and event loop lags are
+    in seconds
+    """
+    return UsageIngestionStats(
+        queued_records=usage.queue.qsize(),
+        buffered_usages=usage.accumulator.size,
+        loop_lag_max=loop_monitor.max_lag,
+        loop_lag_mean=loop_monitor.mean_lag,
+        journal_duration=usage.worker.durations.get("journal"),
+        flush_duration=usage.worker.durations.get("flush"),
+        nodes=[
+            NodePollingStats(
+                node_id=node_id,
+                state=poller.state,
+                streaming=poller.streaming,
+                polls=poller.polls,
+                failures=poller.failures,
+                consecutive_failures=poller.consecutive_failures,
+                timeout=poller.timeout,
+                last_latency=poller.last_latency,
+                average_latency=poller.average_latency,
+                last_success_at=poller.last_success_at,
+            )
+            for node_id, poller in usage.pollers.items()
+        ],
+    )
+
+
+@router.get("/stats/outbox", response_model=list[NodeOutboxStats])
+def get_outbox_stats(admin: SudoAdminDep):
+    """
+    Pending user updates of each node and of each of its priority lanes;
+    the ages and the waits of the latest sent updates are in seconds
+    """
+    return [
+        NodeOutboxStats(
+            node_id=node_id,
+            pending=len(node.outbox),
+            oldest_age=node.outbox.oldest_age,
+            enqueued=node.outbox.enqueued,
+            coalesced=node.outbox.coalesced,
+            sent=node.outbox.sent,
+            last_batch_size=node.outbox.last_batch_size,
+            lanes={
+                priority.name: OutboxLaneStats(
+                    pending=len(lane.pending),
+                    oldest_age=lane.oldest_age,
+                    enqueued=lane.enqueued,
+                    sent=lane.sent,
+                    wait_p50=lane.wait_percentile(50),
+                    wait_p99=lane.wait_percentile(99),
+                    wait_max=max(lane.waits, default=None),
+                )
+                for priority, lane in node.outbox.lanes.items()
+            },
+        )
+        for node_id, node in marznode.nodes.items()
+        if hasattr(node, "outbox")
+    ]
+
+
 @router.get("/stats/traffic", response_model=TrafficUsageSeries)
 def get_total_traffic_stats(
-    db: DBDep, admin: AdminDep, start_date: StartDateDep, end_date: EndDateDep
+    db: DBDep,
+    admin: AdminDep,
+    start_date: StartDateDep,
+    end_date: EndDateDep,
+    resolution: UsageResolution = UsageResolution.hour,
 ):
-    return crud.get_total_usages(db, admin, start_date, end_date)
+    return crud.get_total_usages(db, admin, start_date, end_date, resolution)
 
 
 @router.get("/stats/users", response_model=UsersStats)
@@ -22,6 +22,7 @@ from app.dependencies import (
     ModifyUsersAccess,
 )
 from app.models.service import ServiceResponse
+from app.models.system import UsageResolution
 from app.models.user import (
     UserCreate,
     UserModify,
@@ -29,6 +30,7 @@ from app.models.user import (
     UserUsageSeriesResponse,
 )
 from app.utils import report
+from app.utils.expiry import expiry_timers
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/users", tags=["User"])
@@ -136,6 +138,7 @@ async def add_user(new_user: UserCreate, db: DBDep, admin: AdminDep):
 
     user = UserResponse.model_validate(db_user)
     marznode.operations.update_user(user=db_user)
+    expiry_timers.schedule_user(db_user)
     asyncio.ensure_future(
         report.user_created(user=user, user_id=db_user.id, by=admin)
     )
@@ -245,6 +248,7 @@ async def modify_user(
         )
         db_user.activated = db_user.is_active
         db.commit()
+    expiry_timers.schedule_user(db_user)
 
     asyncio.ensure_future(
         report.user_updated(
@@ -285,6 +289,7 @@ async def remove_user(
     Remove a user
     """
     marznode.operations.update_user(db_user, remove=True)
+    expiry_timers.schedule(db_user.id, None)
 
     crud.remove_user(db, db_user)
     db.flush()
@@ -331,6 +336,7 @@ async def reset_user_data_usage(
         marznode.operations.update_user(db_user)
         db_user.activated = True
         db.commit()
+        expiry_timers.schedule_user(db_user)
 
     user = UserResponse.model_validate(db_user)
     asyncio.ensure_future(report.user_data_usage_reset(user=user, by=admin))
@@ -360,6 +366,7 @@ async def enable_user(
         marznode.operations.update_user(db_user)
 
     db.commit()
+    expiry_timers.schedule_user(db_user)
 
     user = UserResponse.model_validate(db_user)
 
@@ -406,8 +413,11 @@ async def revoke_user_subscription(
     db_user = crud.revoke_user_sub(db, db_user)
 
     if db_user.is_active:
+        # the old key is cut off as urgently as a removal would be
         marznode.operations.update_user(db_user, remove=True)
-        marznode.operations.update_user(db_user)
+        marznode.operations.update_user(
+            db_user, priority=marznode.UpdatePriority.urgent
+        )
     user = UserResponse.model_validate(db_user)
     asyncio.ensure_future(
         report.user_subscription_revoked(user=user, by=admin)
@@ -420,13 +430,17 @@ async def revoke_user_subscription(
 
 @router.get("/{username}/usage", response_model=UserUsageSeriesResponse)
 def get_user_usage(
-    db: DBDep, db_user: UserDep, start_date: StartDateDep, end_date: EndDateDep
+    db: DBDep,
+    db_user: UserDep,
+    start_date: StartDateDep,
+    end_date: EndDateDep,
+    resolution: UsageResolution = UsageResolution.hour,
 ):
     """
     Get users usage
     """
 
-    return crud.get_user_usages(db, db_user, start_date, end_date)
+    return crud.get_user_usages(db, db_user, start_date, end_date, resolution)
 
 
 @router.put("/{username}/set-owner", response_model=UserResponse)
@@ -1,14 +1,32 @@
 from .nodes import nodes_startup
-from .record_usages import record_user_usages
+from .record_usages import (
+    flush_user_usages,
+    ingest_pending_usages,
+    ingest_user_usages,
+    load_remaining_quotas,
+    replay_usage_journal,
+)
 from .reset_user_data_usage import reset_user_data_usage
-from .review_users import review_users
+from .rollup_usages import rollup_usages
+from .review_users import (
+    load_expiry_timers,
+    review_user_timers,
+    review_users,
+)
 from .send_notifications import delete_expired_reminders, send_notifications
 
 __all__ = [
     "nodes_startup",
-    "record_user_usages",
+    "ingest_user_usages",
+    "ingest_pending_usages",
+    "flush_user_usages",
+    "replay_usage_journal",
+    "load_remaining_quotas",
     "reset_user_data_usage",
+    "rollup_usages",
     "review_users",
+    "review_user_timers",
+    "load_expiry_timers",
     "delete_expired_reminders",
     "send_notifications",
 ]
@@ -1,10 +1,15 @@
 from app import marznode
-from app.db import GetDB, crud, get_tls_certificate
+from app.db import GetDB, change_sequence, crud, get_tls_certificate
 
 
 async def nodes_startup():
+    """
+    starts connecting to the enabled nodes, which sync in the background
+    at most NODE_SYNC_CONCURRENCY at a time
+    """
     with GetDB() as db:
+        change_sequence.load(db)
         certificate = get_tls_certificate(db)
         db_nodes = crud.get_nodes(db=db, enabled=True)
-        for db_node in db_nodes:
-            await marznode.operations.add_node(db_node, certificate)
+    for db_node in db_nodes:
+        await marznode.operations.add_node(db_node, certificate)
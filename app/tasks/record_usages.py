@@ -1,180 +1,299 @@
 import asyncio
-from collections import defaultdict
+import logging
 from datetime import datetime
 
-from sqlalchemy import and_, select, insert, update, bindparam
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
 
-from app import marznode
-from app.db import GetDB
+from app.config.env import USAGE_FLUSH_THRESHOLD
+from app.db import GetDB, change_sequence, crud
+from app.db.base import upsert_increment
 from app.db.models import NodeUsage, NodeUserUsage, User
-from app.marznode import MarzNodeBase
+from app.models.user import UserExpireStrategy
+from app.usage import accumulator, journal, queue, quotas, worker
+from app.usage.accumulator import UserUsages, reduce_buckets
+from app.utils.expiry import expiry_timers
+from .review_users import apply_deactivated_users, load_deactivated_users
 
+logger = logging.getLogger(__name__)
 
-def record_user_usage_logs(
-    params: list, node_id: int, consumption_factor: int = 1
-):
-    if not params:
-        return
+flush_lock = asyncio.Lock()
 
-    created_at = datetime.fromisoformat(
-        datetime.utcnow().strftime("%Y-%m-%dT%H:00:00")
-    )
+# number of users checked for reaching their data limit per query
+LIMIT_CHECK_CHUNK = 1000
 
-    with GetDB() as db:
-        # make user usage row if doesn't exist
-        select_stmt = select(NodeUserUsage.user_id).where(
-            and_(
-                NodeUserUsage.node_id == node_id,
-                NodeUserUsage.created_at == created_at,
-            )
+
+def record_usages(
+    db: Session,
+    node_user_usages: dict[tuple[datetime, int], UserUsages],
+    users_usages: UserUsages,
+    nodes_usages: dict[tuple[datetime, int], int],
+) -> tuple[list[int], dict[int, int | None], list[int]]:
+    """
+    writes the merged usages of all nodes in a single transaction
+    node_user_usages: maps (hour, node_id) to the unique ids of its users
+    and their coefficient applied usages
+    users_usages: the unique user ids and their coefficient applied usages
+    nodes_usages: maps (hour, node_id) to the raw usage of the node
+    users who reached their data limit are deactivated in the same
+    transaction; returns their ids, the data left to the other users,
+    None for the ones without a limit or not activated, and the on hold
+    users who just came online
+    """
+    limited, remaining, on_hold = [], {}, []
+    if node_user_usages:
+        db.execute(
+            upsert_increment(
+                NodeUserUsage,
+                ["created_at", "user_id", "node_id"],
+                ["used_traffic"],
+            ),
+            [
+                {
+                    "created_at": hour,
+                    "user_id": uid,
+                    "node_id": node_id,
+                    "used_traffic": value,
+                }
+                for (hour, node_id), (uids, usages) in node_user_usages.items()
+                for uid, value in zip(uids.tolist(), usages.tolist())
+            ],
         )
-        existings = [r[0] for r in db.execute(select_stmt).fetchall()]
-        uids_to_insert = set()
-
-        for p in params:
-            uid = p["uid"]
-            if uid in existings:
-                continue
-            uids_to_insert.add(uid)
-
-        if uids_to_insert:
-            stmt = insert(NodeUserUsage).values(
-                user_id=bindparam("uid"),
-                created_at=created_at,
-                node_id=node_id,
-                used_traffic=0,
-            )
-            db.execute(stmt, [{"uid": uid} for uid in uids_to_insert])
+        # late usages, e.g. replayed from the journal, would be missing
+        # from the rollups and lost once their hours are purged
+        crud.add_compacted_node_user_usages(db, node_user_usages)
 
-        # record
+    if nodes_usages:
+        db.execute(
+            upsert_increment(
+                NodeUsage, ["created_at", "node_id"], ["downlink"]
+            ),
+            [
+                {
+                    "created_at": hour,
+                    "node_id": node_id,
+                    "uplink": 0,
+                    "downlink": value,
+                }
+                for (hour, node_id), value in nodes_usages.items()
+            ],
+        )
+
+    uids, values = (array.tolist() for array in users_usages)
+    if uids:
+        users = User.__table__
         stmt = (
-            update(NodeUserUsage)
+            update(users)
+            .where(users.c.id == bindparam("uid"))
             .values(
-                used_traffic=NodeUserUsage.used_traffic
-                + bindparam("value") * consumption_factor
-            )
-            .where(
-                and_(
-                    NodeUserUsage.user_id == bindparam("uid"),
-                    NodeUserUsage.node_id == node_id,
-                    NodeUserUsage.created_at == created_at,
-                )
+                used_traffic=users.c.used_traffic + bindparam("value"),
+                lifetime_used_traffic=users.c.lifetime_used_traffic
+                + bindparam("value"),
+                online_at=datetime.utcnow(),
             )
         )
-        db.connection().execute(
-            stmt, params, execution_options={"synchronize_session": None}
+        db.execute(
+            stmt,
+            [{"uid": uid, "value": value} for uid, value in zip(uids, values)],
         )
-        db.commit()
 
+        # only the users whose usage just grew can have crossed the limit
+        for i in range(0, len(uids), LIMIT_CHECK_CHUNK):
+            rows = db.execute(
+                select(
+                    users.c.id,
+                    users.c.activated,
+                    users.c.data_limit - users.c.used_traffic,
+                    users.c.expire_strategy,
+                ).where(users.c.id.in_(uids[i : i + LIMIT_CHECK_CHUNK]))
+            )
+            crossed = []
+            for uid, activated, left, strategy in rows:
+                if strategy == UserExpireStrategy.START_ON_FIRST_USE:
+                    on_hold.append(uid)
+                if not activated or left is None:
+                    remaining[uid] = None
+                elif left <= 0:
+                    remaining[uid] = None
+                    crossed.append(uid)
+                else:
+                    remaining[uid] = left
+            if crossed:
+                # sequenced, so reconnecting nodes learn of the removal
+                db.execute(
+                    update(users)
+                    .where(users.c.id.in_(crossed))
+                    .values(
+                        activated=False,
+                        change_seq=change_sequence.next(db),
+                    )
+                )
+                limited.extend(crossed)
 
-def record_node_stats(node_id: int, usage: int):
-    if not usage:
-        return
+    db.commit()
+    return limited, remaining, on_hold
 
-    created_at = datetime.fromisoformat(
-        datetime.utcnow().strftime("%Y-%m-%dT%H:00:00")
-    )
 
+def write_journal(records: list[tuple]):
+    for record in records:
+        journal.append(*record)
+    journal.sync()
+
+
+def load_limited_users(user_ids: list[int], held: list[int]) -> list[tuple]:
     with GetDB() as db:
+        change_sequence.hold(db, held)
+        return load_deactivated_users(db, user_ids)
 
-        # make node usage row if doesn't exist
-        select_stmt = select(NodeUsage.node_id).where(
-            and_(
-                NodeUsage.node_id == node_id,
-                NodeUsage.created_at == created_at,
-            )
+
+def consume_quotas(records: list[tuple]) -> bool:
+    """lowers the data left to users, returns whether any ran out"""
+    exhausted = False
+    for _, _, coefficient, uids, usages in records:
+        exhausted = quotas.consume(coefficient, uids, usages) or exhausted
+    return exhausted
+
+
+def store_usages(
+    buckets: dict, held: list[int]
+) -> tuple[list[int], list[int]]:
+    journaled = journal.rotate() if journal else 0
+    with GetDB() as db:
+        change_sequence.hold(db, held)
+        limited, remaining, on_hold = record_usages(
+            db, *reduce_buckets(buckets)
         )
-        notfound = db.execute(select_stmt).first() is None
-        if notfound:
-            stmt = insert(NodeUsage).values(
-                created_at=created_at, node_id=node_id, uplink=0, downlink=0
+    quotas.refresh(remaining)
+    if journal:
+        # the usages are stored, failing here mustn't get them restored
+        # and stored twice; the next discard removes the segments left
+        try:
+            journal.discard(journaled)
+        except Exception:
+            logger.exception("Failed to discard the usage journal")
+    return limited, on_hold
+
+
+async def ingest(records: list[tuple]):
+    """journals the polled usage records and buffers them"""
+    # the journal write is queued before the records are buffered, so a
+    # flush draining them rotates the journal only after they are written
+    journaled = (
+        worker.submit("journal", write_journal, records) if journal else None
+    )
+    # the quotas are only ever changed on the worker thread, in order with
+    # the flushes refreshing them
+    consumed = (
+        worker.submit("consume", consume_quotas, records)
+        if len(quotas)
+        else None
+    )
+    for record in records:
+        accumulator.add(*record)
+    if journaled:
+        try:
+            await journaled
+        except OSError:
+            logger.exception("Failed to journal the user usages")
+    exhausted = await consumed if consumed else False
+
+    # storing right away deactivates the users who ran out of data
+    if exhausted or accumulator.size >= USAGE_FLUSH_THRESHOLD:
+        await flush_user_usages()
+
+
+def drain_queue() -> list[tuple]:
+    records = list()
+    while not queue.empty():
+        records.append(queue.get_nowait())
+    return records
+
+
+async def ingest_user_usages():
+    """
+    moves the usage records the node pollers put into the ingestion queue
+    to the accumulator, batching whatever arrived in the meantime
+    """
+    while True:
+        records = [await queue.get()]
+        try:
+            await ingest(records + drain_queue())
+        except Exception:
+            logger.exception("Failed to ingest the user usages")
+
+
+async def ingest_pending_usages():
+    """ingests the records left in the ingestion queue, e.g. on shutdown"""
+    if records := drain_queue():
+        await ingest(records)
+
+
+async def flush_user_usages():
+    """stores the accumulated usages in the database"""
+    async with flush_lock:
+        if not accumulator.size:
+            return
+
+        buckets = accumulator.drain()
+        # the limited users are sequenced on the worker thread, nodes are
+        # told they hold the changes only once their removals are queued
+        held = []
+        try:
+            limited, on_hold = await worker.submit(
+                "flush", store_usages, buckets, held
             )
-            db.execute(stmt)
+        except Exception:
+            change_sequence.release(held)
+            accumulator.restore(buckets)
+            logger.exception("Failed to store the user usages")
+            return
 
-        # record
-        stmt = (
-            update(NodeUsage)
-            .values(
-                downlink=NodeUsage.downlink + usage,
+    # the first usage of an on hold user activates it
+    now = datetime.utcnow()
+    for uid in on_hold:
+        expiry_timers.schedule(uid, now)
+
+    try:
+        if limited:
+            deactivated = await worker.submit(
+                "deactivate", load_limited_users, limited, held
             )
-            .where(
-                and_(
-                    NodeUsage.node_id == node_id,
-                    NodeUsage.created_at == created_at,
+            apply_deactivated_users(deactivated)
+    except Exception:
+        logger.exception("Failed to deactivate the limited users")
+    finally:
+        change_sequence.release(held)
+
+
+def reload_remaining_quotas() -> None:
+    users = User.__table__
+    with GetDB() as db:
+        remaining = dict(
+            db.execute(
+                select(
+                    users.c.id, users.c.data_limit - users.c.used_traffic
+                ).where(
+                    users.c.activated == True,
+                    users.c.data_limit.isnot(None),
                 )
-            )
+            ).all()
         )
+    quotas.refresh(remaining)
 
-        db.execute(stmt)
-        db.commit()
 
+async def load_remaining_quotas():
+    """loads the data left to the activated users with a data limit"""
+    await worker.submit("quotas", reload_remaining_quotas)
 
-async def get_users_stats(
-    node_id: int, node: MarzNodeBase
-) -> tuple[int, list[dict]]:
-    try:
-        params = list()
-        for stat in await asyncio.wait_for(node.fetch_users_stats(), 10):
-            if stat.usage:
-                params.append({"uid": stat.uid, "value": stat.usage})
-        return node_id, params
-    except:
-        return node_id, []
-
-
-async def record_user_usages():
-    # usage_coefficient = {None: 1}  # default usage coefficient for the main api instance
-
-    results = await asyncio.gather(
-        *[
-            get_users_stats(node_id, node)
-            for node_id, node in marznode.nodes.items()
-        ]
-    )
-    api_params = {node_id: params for node_id, params in list(results)}
-
-    users_usage = defaultdict(int)
-    for node_id, params in api_params.items():
-        coefficient = (
-            node.usage_coefficient
-            if (node := marznode.nodes.get(node_id))
-            else 1
-        )
-        node_usage = 0
-        for param in params:
-            users_usage[param["uid"]] += (
-                param["value"] * coefficient
-            )  # apply the usage coefficient
-            node_usage += param["value"]
-        record_node_stats(node_id, node_usage)
-
-    users_usage = list(
-        {"id": uid, "value": value} for uid, value in users_usage.items()
-    )
-    if not users_usage:
-        return
 
-    # record users usage
-    with GetDB() as db:
-        stmt = update(User).values(
-            used_traffic=User.used_traffic + bindparam("value"),
-            lifetime_used_traffic=User.lifetime_used_traffic
-            + bindparam("value"),
-            online_at=datetime.utcnow(),
-        )
+async def replay_usage_journal():
+    """stores the usages left in the journal by the previous run"""
+    if not journal:
+        return
 
-        db.execute(
-            stmt, users_usage, execution_options={"synchronize_session": None}
-        )
-        db.commit()
-
-    for node_id, params in api_params.items():
-        record_user_usage_logs(
-            params,
-            node_id,
-            (
-                node.usage_coefficient
-                if (node := marznode.nodes.get(node_id))
-                else 1
-            ),
-        )
+    records = await worker.submit("replay", lambda: list(journal.replay()))
+    for record in records:
+        accumulator.add(*record)
+    if accumulator.size:
+        logger.info("Replaying %i journaled usages", accumulator.size)
+        await flush_user_usages()
@@ -2,45 +2,33 @@ import logging
 from datetime import datetime
 
 from app import marznode
-from app.db import crud, GetDB, get_users
-from app.models.user import UserDataUsageResetStrategy
+from app.db import crud, GetDB
+from app.db.models import User
+from app.utils.expiry import expiry_timers
+from .record_usages import load_remaining_quotas
 
 logger = logging.getLogger(__name__)
 
-reset_strategy_to_days = {
-    UserDataUsageResetStrategy.day.value: 1,
-    UserDataUsageResetStrategy.week.value: 7,
-    UserDataUsageResetStrategy.month.value: 30,
-    UserDataUsageResetStrategy.year.value: 365,
-}
-
 
 async def reset_user_data_usage():
-    now = datetime.utcnow()
     with GetDB() as db:
-        for user in get_users(
-            db,
-            reset_strategy=[
-                UserDataUsageResetStrategy.day.value,
-                UserDataUsageResetStrategy.week.value,
-                UserDataUsageResetStrategy.month.value,
-                UserDataUsageResetStrategy.year.value,
-            ],
-        ):
-            last_reset_time = user.traffic_reset_at or user.created_at
-            num_days_to_reset = reset_strategy_to_days[
-                user.data_limit_reset_strategy
-            ]
-
-            if not (now - last_reset_time).days >= num_days_to_reset:
-                continue
-
-            was_active = user.is_active
-            crud.reset_user_data_usage(db, user)
-            # make user active if limited on usage reset
-            if user.is_active and not was_active:
-                marznode.operations.update_user(user)
-                user.activated = True
-                db.commit()
-
-            logger.info("User data usage reset for User `%s`", user.username)
+        count, reactivated = crud.reset_due_users_data_usage(
+            db, datetime.utcnow()
+        )
+        # make users limited on usage active again
+        for i in range(0, len(reactivated), 1000):
+            chunk = reactivated[i : i + 1000]
+            users = db.query(User).filter(User.id.in_(chunk)).all()
+            marznode.operations.add_users(
+                users, crud.get_users_node_inbounds(db, chunk)
+            )
+            for user in users:
+                expiry_timers.schedule_user(user)
+
+    if count:
+        await load_remaining_quotas()
+        logger.info(
+            "User data usage reset for %i users, %i activated again",
+            count,
+            len(reactivated),
+        )
@@ -1,80 +1,236 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlalchemy.orm import Session, selectinload
 
 from app import marznode
-from app.db import (
-    GetDB,
-    get_users,
-)
+from app.db import GetDB, crud, mark_users_changed
+from app.db.models import User
 from app.models.user import (
     UserResponse,
     UserExpireStrategy,
 )
 from app.utils import report
+from app.utils.expiry import expiry_timers
 
-if TYPE_CHECKING:
-    pass
+logger = logging.getLogger(__name__)
 
+# number of users changed per statement
+REVIEW_CHUNK = 1000
 
-logger = logging.getLogger(__name__)
 
+def _chunks(ids: list[int]):
+    for i in range(0, len(ids), REVIEW_CHUNK):
+        yield ids[i : i + REVIEW_CHUNK]
 
-async def review_users():
-    now = datetime.utcnow()
-    with GetDB() as db:
-        for user in get_users(db, activated=True, is_active=False):
-            """looking for expired/to be limited users who are still active"""
-
-            marznode.operations.update_user(user, remove=True)
-            user.activated = False
-            db.commit()
-            db.refresh(user)
-            asyncio.ensure_future(
-                report.status_change(
-                    user.username,
-                    user.status,
-                    UserResponse.model_validate(user),
-                )
+
+def deactivation_due(now: datetime):
+    """matches the expired/limited users who are still activated"""
+    return and_(
+        User.activated == True,
+        or_(
+            User.enabled == False,
+            User.removed == True,
+            and_(
+                User.expire_strategy == UserExpireStrategy.FIXED_DATE,
+                User.expire_date <= now,
+            ),
+            User.data_limit_reached,
+        ),
+    )
+
+
+def activation_due(now: datetime):
+    """
+    matches the on hold users who came online after 'base_time' or
+    didn't connect until their activation deadline
+    """
+    return and_(
+        User.expire_strategy == UserExpireStrategy.START_ON_FIRST_USE,
+        User.enabled == True,
+        User.removed == False,
+        ~User.data_limit_reached,
+        or_(
+            User.online_at >= func.coalesce(User.edit_at, User.created_at),
+            User.activation_deadline <= now,
+        ),
+    )
+
+
+def load_status_changes(db: Session, user_ids: list[int]) -> list[tuple]:
+    """the (username, status, user) of users changed together"""
+    users = (
+        db.query(User)
+        .options(selectinload(User.admin))
+        .filter(User.id.in_(user_ids))
+        .all()
+    )
+    return [
+        (user.username, user.status, UserResponse.model_validate(user))
+        for user in users
+    ]
+
+
+def report_status_changes(
+    db: Session, user_ids: list[int]
+) -> list[UserResponse]:
+    """emits the notifications of users changed together as one batch"""
+    changes = load_status_changes(db, user_ids)
+    asyncio.ensure_future(report.status_changes(changes))
+    return [user for _, _, user in changes]
+
+
+def load_deactivated_users(
+    db: Session, user_ids: list[int]
+) -> list[tuple[list[tuple], list[tuple[int, int]], int]]:
+    """
+    sequences the removal of deactivated users from their nodes and
+    loads, per chunk, their status changes, the nodes they are on and
+    the sequence of the removal;
+    needs no event loop, unlike apply_deactivated_users
+    """
+    chunks = []
+    for chunk in _chunks(user_ids):
+        sequence = mark_users_changed(db, chunk)
+        db.commit()
+        chunks.append(
+            (
+                load_status_changes(db, chunk),
+                crud.get_users_node_ids(db, chunk),
+                sequence,
             )
+        )
+    return chunks
+
 
+def apply_deactivated_users(chunks: list[tuple]):
+    """reports the loaded deactivated users and removes them from nodes"""
+    for changes, node_ids, sequence in chunks:
+        asyncio.ensure_future(report.status_changes(changes))
+        users = [user for _, _, user in changes]
+        marznode.operations.remove_users(users, node_ids, sequence)
+        for user in users:
+            expiry_timers.schedule(user.id, None)
             logger.info(
                 "User `%s` activation state changed to `%s`",
                 user.username,
                 str(user.activated),
             )
 
-        for user in get_users(
-            db,
-            expire_strategy=UserExpireStrategy.START_ON_FIRST_USE,
-            is_active=True,
-        ):
-            """looking for to be activated, on hold users"""
-            base_time = user.edit_at or user.created_at
-
-            # Check if the user is online After or at 'base_time' or...
-            # If the user didn't connect until activation_deadline; change status to "Active"
-            if not (
-                (user.online_at and base_time <= user.online_at)
-                or (
-                    user.activation_deadline
-                    and (user.activation_deadline <= now)
-                )
+
+def remove_deactivated_users(db: Session, user_ids: list[int]):
+    """removes deactivated users from their nodes, one batch per node"""
+    apply_deactivated_users(load_deactivated_users(db, user_ids))
+
+
+def deactivate_users(db: Session, user_ids: list[int]):
+    users = User.__table__
+    for chunk in _chunks(user_ids):
+        db.execute(
+            update(users).where(users.c.id.in_(chunk)).values(activated=False)
+        )
+    db.commit()
+    remove_deactivated_users(db, user_ids)
+
+
+def activate_on_hold_users(
+    db: Session, durations: list[tuple[int, int]], now: datetime
+):
+    """starts the usage duration of the (user_id, usage_duration) pairs"""
+    users = User.__table__
+    expire_dates = {
+        user_id: now + timedelta(seconds=duration or 0)
+        for user_id, duration in durations
+    }
+    db.execute(
+        update(users)
+        .where(users.c.id == bindparam("uid"))
+        .values(
+            expire_date=bindparam("expire_at"),
+            expire_strategy=UserExpireStrategy.FIXED_DATE,
+        ),
+        [
+            {"uid": user_id, "expire_at": expire_at}
+            for user_id, expire_at in expire_dates.items()
+        ],
+    )
+    db.commit()
+    for chunk in _chunks(list(expire_dates)):
+        for user in report_status_changes(db, chunk):
+            logger.info("on hold user `%s` has been activated", user.username)
+    for user_id, expire_at in expire_dates.items():
+        expiry_timers.schedule(user_id, expire_at)
+
+
+def review(db: Session, now: datetime, user_ids: list[int] | None = None):
+    """deactivates and activates the due users, among user_ids if given"""
+    query = select(User.id).where(deactivation_due(now))
+    if user_ids is not None:
+        query = query.where(User.id.in_(user_ids))
+    if deactivated := db.execute(query).scalars().all():
+        deactivate_users(db, deactivated)
+
+    query = select(User.id, User.usage_duration).where(activation_due(now))
+    if user_ids is not None:
+        query = query.where(User.id.in_(user_ids))
+    if activated := db.execute(query).all():
+        activate_on_hold_users(db, activated, now)
+
+
+async def review_user_timers(user_ids: list[int]):
+    """reviews the users whose expire date or activation deadline came"""
+    now = datetime.utcnow()
+    with GetDB() as db:
+        for chunk in _chunks(user_ids):
+            review(db, now, chunk)
+            for user in db.execute(
+                select(
+                    User.id,
+                    User.removed,
+                    User.activated,
+                    User.expire_strategy,
+                    User.expire_date,
+                    User.activation_deadline,
+                ).where(User.id.in_(chunk))
             ):
-                continue
+                expiry_timers.schedule_user(user)
+
 
-            user.expire_date = datetime.utcnow() + timedelta(
-                seconds=user.usage_duration
+async def load_expiry_timers():
+    """schedules the upcoming expire dates and activation deadlines"""
+    with GetDB() as db:
+        rows = db.query(
+            User.id,
+            User.expire_strategy,
+            User.expire_date,
+            User.activation_deadline,
+        ).filter(
+            User.removed == False,
+            (
+                (User.expire_strategy == UserExpireStrategy.FIXED_DATE)
+                & (User.activated == True)
             )
-            user.expire_strategy = UserExpireStrategy.FIXED_DATE
-            db.commit()
-            db.refresh(user)
-            asyncio.ensure_future(
-                report.status_change(
-                    user.username,
-                    user.status,
-                    UserResponse.model_validate(user),
-                )
+            | (User.expire_strategy == UserExpireStrategy.START_ON_FIRST_USE),
+        )
+        # the ones already due are reviewed as soon as the timers run
+        for user_id, strategy, expire_date, activation_deadline in rows:
+            expiry_timers.schedule(
+                user_id,
+                (
+                    expire_date
+                    if strategy == UserExpireStrategy.FIXED_DATE
+                    else activation_deadline
+                ),
             )
-            logger.info("on hold user `%s` has been activated", user.username)
+    logger.info("Scheduled %i user expiry timers", len(expiry_timers))
+
+
+async def review_users():
+    """
+    reconciles the users the expiry timers might have missed, e.g. the
+    ones whose state was changed by other means than the api
+    """
+    with GetDB() as db:
+        review(db, datetime.utcnow())
@@ -0,0 +1,40 @@
+import logging
+from datetime import datetime, timedelta
+
+from app.config.env import (
+    USAGE_DAILY_RETENTION_DAYS,
+    USAGE_HOURLY_RETENTION_DAYS,
+)
+from app.db import GetDB, crud
+from app.usage import worker
+
+logger = logging.getLogger(__name__)
+
+
+def compact_usages():
+    now = datetime.utcnow()
+    with GetDB() as db:
+        # leave an hour for the usages of the last hour to be stored, the
+        # ones stored later are added to the rollups as they are stored
+        compacted = crud.rollup_node_user_usages(db, now - timedelta(hours=1))
+        crud.purge_node_user_usages(
+            db,
+            (
+                now - timedelta(days=USAGE_HOURLY_RETENTION_DAYS)
+                if USAGE_HOURLY_RETENTION_DAYS
+                else None
+            ),
+            (
+                now - timedelta(days=USAGE_DAILY_RETENTION_DAYS)
+                if USAGE_DAILY_RETENTION_DAYS
+                else None
+            ),
+        )
+    if compacted:
+        logger.info("Compacted %i periods of user usages", compacted)
+
+
+async def rollup_usages():
+    """compacts the closed periods of user usages and applies retention"""
+    # runs on the ingestion worker so it doesn't race the usage flushes
+    await worker.submit("rollup", compact_usages)
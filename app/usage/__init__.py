@@ -0,0 +1,53 @@
+"""polls the usages of nodes and buffers them until they are stored"""
+
+import asyncio
+
+from app.config.env import (
+    USAGE_JOURNAL_DIR,
+    USAGE_POLL_INTERVAL,
+    USAGE_POLL_TIMEOUT,
+)
+from .accumulator import UsageAccumulator
+from .journal import UsageJournal
+from .poller import NodePoller
+from .quotas import RemainingQuotas
+from .worker import IngestionWorker
+
+accumulator = UsageAccumulator()
+worker = IngestionWorker()
+journal: UsageJournal | None = (
+    UsageJournal(USAGE_JOURNAL_DIR) if USAGE_JOURNAL_DIR else None
+)
+queue: asyncio.Queue = asyncio.Queue()
+pollers: dict[int, NodePoller] = {}
+quotas = RemainingQuotas()
+
+
+def start_polling(node_id: int, node) -> None:
+    stop_polling(node_id)
+    pollers[node_id] = NodePoller(
+        node_id, node, queue, USAGE_POLL_INTERVAL, USAGE_POLL_TIMEOUT
+    )
+    pollers[node_id].start()
+
+
+def stop_polling(node_id: int) -> None:
+    if poller := pollers.pop(node_id, None):
+        poller.stop()
+
+
+__all__ = [
+    "accumulator",
+    "journal",
+    "worker",
+    "queue",
+    "pollers",
+    "quotas",
+    "start_polling",
+    "stop_polling",
+    "IngestionWorker",
+    "NodePoller",
+    "RemainingQuotas",
+    "UsageAccumulator",
+    "UsageJournal",
+]
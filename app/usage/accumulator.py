@@ -0,0 +1,99 @@
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable
+
+import numpy as np
+
+BucketKey = tuple[datetime, int, float]
+# unique user ids and their usages, as int64 arrays
+UserUsages = tuple[np.ndarray, np.ndarray]
+
+
+class UsageAccumulator:
+    """
+    keeps the user usage deltas fetched from nodes in memory until they
+    are flushed; deltas are appended to compact arrays per
+    (hour, node, usage coefficient) and only summed up on drain
+    """
+
+    def __init__(self):
+        self._buckets: dict[BucketKey, tuple[array, array]] = {}
+        self.size = 0
+        self.first_added_at: float | None = None
+
+    def add(
+        self,
+        created_at: datetime,
+        node_id: int,
+        coefficient: float,
+        uids: Iterable[int],
+        usages: Iterable[int],
+    ) -> None:
+        key = (created_at, node_id, coefficient)
+        if key not in self._buckets:
+            self._buckets[key] = (array("I"), array("Q"))
+        bucket_uids, bucket_usages = self._buckets[key]
+        count = len(bucket_uids)
+        bucket_uids.extend(uids)
+        bucket_usages.extend(usages)
+        self.size += len(bucket_uids) - count
+        if self.first_added_at is None and self.size:
+            self.first_added_at = time.monotonic()
+
+    def drain(self) -> dict[BucketKey, tuple[array, array]]:
+        """takes out all the buffered deltas"""
+        buckets, self._buckets = self._buckets, {}
+        self.size = 0
+        self.first_added_at = None
+        return buckets
+
+    def restore(self, buckets: dict[BucketKey, tuple[array, array]]):
+        """puts back drained deltas, e.g. when storing them failed"""
+        for key, (uids, usages) in buckets.items():
+            self.add(*key, uids, usages)
+
+
+def sum_by_uid(parts: Iterable[UserUsages]) -> UserUsages:
+    """
+    sums up the usages of each uid over the (uids, usages) arrays, in
+    whole bytes; user ids are dense, so they index the sums directly
+    """
+    parts = [(uids, usages) for uids, usages in parts if len(uids)]
+    if not parts:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    uids = np.concatenate([uids for uids, _ in parts])
+    usages = np.concatenate([usages for _, usages in parts])
+    counts = np.bincount(uids, minlength=int(uids.max()) + 1)
+    if len(parts) == 1 and counts.max() == 1:
+        # e.g. a single poll of a node, which reports each user once
+        return uids.astype(np.int64), usages.astype(np.int64)
+    present = np.flatnonzero(counts)
+    sums = np.bincount(uids, weights=usages, minlength=len(counts))
+    return present, sums[present].astype(np.int64)
+
+
+def reduce_buckets(
+    buckets: dict[BucketKey, tuple[array, array]],
+) -> tuple[dict, UserUsages, dict]:
+    """
+    sums up drained deltas per (hour, node) and user, per user and per
+    (hour, node), applying the usage coefficient of the nodes; the user
+    usages are returned as arrays of unique uids and their usages
+    """
+    weighted = defaultdict(list)
+    nodes_usages: dict[tuple[datetime, int], int] = defaultdict(int)
+    for (created_at, node_id, coefficient), (uids, usages) in buckets.items():
+        usages = np.frombuffer(usages, np.uint64)
+        key = (created_at, node_id)
+        weighted[key].append(
+            (np.frombuffer(uids, np.uint32), usages * float(coefficient))
+        )
+        nodes_usages[key] += int(usages.sum())
+
+    node_user_usages = {
+        key: sum_by_uid(parts) for key, parts in weighted.items()
+    }
+    users_usages = sum_by_uid(node_user_usages.values())
+    return node_user_usages, users_usages, nodes_usages
@@ -0,0 +1,166 @@
+import logging
+import os
+import struct
+import zlib
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# payload length, crc32 of the payload
+_RECORD_HEADER = struct.Struct("<II")
+# hour, node id, usage coefficient, number of users
+_RECORD_META = struct.Struct("<qIdI")
+
+_SUFFIX = ".journal"
+
+JournalRecord = tuple[datetime, int, float, array, array]
+
+
+class UsageJournal:
+    """
+    an append-only on disk log of the usages fetched from nodes, so they
+    survive a crash until they are stored in the database.
+
+    records are appended to the current segment and fsynced in batches by
+    calling `sync`; `rotate` closes the current segment and returns its
+    sequence number which can be passed to `discard` once everything
+    written up to that segment is stored.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024**2):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self._file: BinaryIO | None = None
+        self._seq = 0
+        self._dirty = False
+
+    def _segments(self) -> list[tuple[int, Path]]:
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (int(path.stem), path)
+            for path in self.directory.iterdir()
+            if path.suffix == _SUFFIX and path.stem.isdigit()
+        )
+
+    def _open_segment(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if segments := self._segments():
+            self._seq = max(self._seq, segments[-1][0])
+        self._seq += 1
+        path = self.directory / f"{self._seq:012d}{_SUFFIX}"
+        self._file = open(path, "ab")
+        # persist the directory entry of the new segment as well
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def append(
+        self,
+        created_at: datetime,
+        node_id: int,
+        coefficient: float,
+        uids: Iterable[int],
+        usages: Iterable[int],
+    ) -> None:
+        uids, usages = array("I", uids), array("Q", usages)
+        payload = b"".join(
+            (
+                _RECORD_META.pack(
+                    int(created_at.replace(tzinfo=timezone.utc).timestamp()),
+                    node_id,
+                    coefficient,
+                    len(uids),
+                ),
+                uids.tobytes(),
+                usages.tobytes(),
+            )
+        )
+        if self._file is None:
+            self._open_segment()
+        self._file.write(
+            _RECORD_HEADER.pack(len(payload), zlib.crc32(payload))
+        )
+        self._file.write(payload)
+        self._dirty = True
+        if self._file.tell() >= self.segment_size:
+            self.rotate()
+
+    def sync(self) -> None:
+        """makes the appended records durable"""
+        if self._file is None or not self._dirty:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._dirty = False
+
+    def rotate(self) -> int:
+        """
+        closes the current segment, the following records go to a new one
+        returns the sequence number of the last closed segment
+        """
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+        return self._seq
+
+    def discard(self, until: int) -> None:
+        """removes the closed segments up to and including `until`"""
+        for seq, path in self._segments():
+            if seq > until:
+                break
+            path.unlink(missing_ok=True)
+
+    def replay(self) -> Iterator[JournalRecord]:
+        """
+        yields the records of all the segments on disk, they are covered
+        by the sequence number returned from the next `rotate`
+        """
+        self.rotate()
+        segments = self._segments()
+        if segments:
+            self._seq = max(self._seq, segments[-1][0])
+        for _, path in segments:
+            yield from self._read_segment(path)
+
+    @staticmethod
+    def _read_segment(path: Path) -> Iterator[JournalRecord]:
+        with open(path, "rb") as file:
+            data = file.read()
+
+        offset = 0
+        while offset < len(data):
+            if offset + _RECORD_HEADER.size > len(data):
+                logger.warning("Truncated usage journal record in %s", path)
+                return
+            length, checksum = _RECORD_HEADER.unpack_from(data, offset)
+            offset += _RECORD_HEADER.size
+            payload = data[offset : offset + length]
+            offset += length
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                logger.warning("Corrupted usage journal record in %s", path)
+                return
+
+            timestamp, node_id, coefficient, count = _RECORD_META.unpack_from(
+                payload
+            )
+            uids, usages = array("I"), array("Q")
+            start = _RECORD_META.size
+            uids.frombytes(payload[start : start + count * uids.itemsize])
+            usages.frombytes(payload[start + count * uids.itemsize :])
+            yield (
+                datetime.utcfromtimestamp(timestamp),
+                node_id,
+                coefficient,
+                uids,
+                usages,
+            )
+
+    def close(self) -> None:
+        self.rotate()
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+# how long to poll a node which can't stream usages before trying again
+STREAM_RETRY_INTERVAL = 3600
+
+
+class BreakerState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class NodePoller:
+    """
+    polls the user usages of a single node on its own jittered schedule
+    and puts the results into the ingestion queue as soon as they arrive;
+    nodes which can push their usages are streamed from instead.
+
+    the timeout follows the observed latency of the node; after
+    `failure_threshold` consecutive failures the circuit opens and the
+    node is only retried after an exponentially growing backoff.
+    """
+
+    def __init__(
+        self,
+        node_id: int,
+        node,
+        queue: asyncio.Queue,
+        interval: float,
+        max_timeout: float,
+        min_timeout: float = 2,
+        failure_threshold: int = 3,
+        max_backoff: float = 300,
+    ):
+        self.node_id = node_id
+        self.node = node
+        self.queue = queue
+        self.interval = interval
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.failure_threshold = failure_threshold
+        self.max_backoff = max_backoff
+
+        self.state = BreakerState.closed
+        self.polls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_latency: float | None = None
+        self.average_latency: float | None = None
+        self.last_success_at: datetime | None = None
+        self._stream_retry_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def timeout(self) -> float:
+        if self.average_latency is None:
+            return self.max_timeout
+        return min(
+            self.max_timeout,
+            max(self.min_timeout, self.average_latency * 4),
+        )
+
+    def _next_delay(self) -> float:
+        if self.state == BreakerState.closed:
+            return self.interval * random.uniform(0.8, 1.2)
+        tripped = self.consecutive_failures - self.failure_threshold
+        backoff = min(self.max_backoff, self.interval * 2 ** (tripped + 1))
+        return backoff * random.uniform(0.5, 1)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    @property
+    def streaming(self) -> bool:
+        return self._stream_retry_at <= time.monotonic()
+
+    async def _run(self) -> None:
+        # spread the first polls of the nodes over an interval
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            if self.streaming:
+                await self.stream()
+            else:
+                await self.poll()
+            await asyncio.sleep(self._next_delay())
+
+    async def stream(self) -> None:
+        """
+        consumes the usage batches pushed by the node until the stream
+        breaks, falls back to polling if the node can't stream them
+        """
+        if self.state == BreakerState.open:
+            self.state = BreakerState.half_open
+
+        batches = aiter(self.node.stream_users_stats(int(self.interval)))
+        try:
+            while True:
+                stats = await asyncio.wait_for(
+                    anext(batches), self.interval * 2 + self.timeout
+                )
+                self.polls += 1
+                self._succeeded()
+                self._put(stats)
+        except StopAsyncIteration:
+            return
+        except NotImplementedError:
+            logger.info(
+                "Node %i can't stream usages, falling back to polling",
+                self.node_id,
+            )
+            self._stream_retry_at = time.monotonic() + STREAM_RETRY_INTERVAL
+            await self.poll()
+        except Exception as exc:
+            self._failed(exc)
+        finally:
+            await batches.aclose()
+
+    async def poll(self) -> None:
+        if self.state == BreakerState.open:
+            self.state = BreakerState.half_open
+
+        start = time.perf_counter()
+        self.polls += 1
+        try:
+            stats = await asyncio.wait_for(
+                self.node.fetch_users_stats(), self.timeout
+            )
+        except Exception as exc:
+            self._failed(exc)
+            return
+
+        latency = time.perf_counter() - start
+        self.last_latency = latency
+        self.average_latency = (
+            latency
+            if self.average_latency is None
+            else self.average_latency * 0.8 + latency * 0.2
+        )
+        self._succeeded()
+        self._put(stats)
+
+    def _put(self, stats) -> None:
+        uids, usages = stats
+        if uids:
+            self.queue.put_nowait(
+                (
+                    datetime.fromisoformat(
+                        datetime.utcnow().strftime("%Y-%m-%dT%H:00:00")
+                    ),
+                    self.node_id,
+                    self.node.usage_coefficient,
+                    uids,
+                    usages,
+                )
+            )
+
+    def _succeeded(self) -> None:
+        self.last_success_at = datetime.utcnow()
+        if self.state != BreakerState.closed:
+            logger.info("Usage polling of node %i recovered", self.node_id)
+        self.state = BreakerState.closed
+        self.consecutive_failures = 0
+
+    def _failed(self, exc: Exception) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if (
+            self.state == BreakerState.half_open
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.state == BreakerState.closed:
+                logger.warning(
+                    "Usage polling of node %i failed %i times, backing off",
+                    self.node_id,
+                    self.consecutive_failures,
+                )
+            self.state = BreakerState.open
+        logger.debug(
+            "Failed to fetch the usages of node %i: %r", self.node_id, exc
+        )
@@ -0,0 +1,40 @@
+from typing import Iterable
+
+
+class RemainingQuotas:
+    """
+    the data left to users with a data limit as of the last stored usages,
+    lowered by the usages fetched since then; running out only tells that
+    the usages should be stored now, the database decides about the limit.
+    it is only used on the usage ingestion worker thread
+    """
+
+    def __init__(self):
+        self._remaining: dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._remaining)
+
+    def refresh(self, remaining: dict[int, int | None]) -> None:
+        """sets the data left to users, None drops a user"""
+        for uid, left in remaining.items():
+            if left is None:
+                self._remaining.pop(uid, None)
+            else:
+                self._remaining[uid] = left
+
+    def consume(
+        self, coefficient: float, uids: Iterable[int], usages: Iterable[int]
+    ) -> bool:
+        """subtracts usages, returns whether any user ran out of data"""
+        remaining = self._remaining
+        if not remaining:
+            return False
+        exhausted = False
+        for uid, usage in zip(uids, usages):
+            left = remaining.get(uid)
+            if left is not None:
+                left -= usage * coefficient
+                remaining[uid] = left
+                exhausted = exhausted or left <= 0
+        return exhausted
@@ -0,0 +1,39 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class IngestionWorker:
+    """
+    runs the blocking parts of usage ingestion, journal writes and
+    database flushes, on a dedicated thread instead of the event loop;
+    a single thread runs the jobs in the order they were submitted
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="usage-ingestion"
+        )
+        self.durations: dict[str, float] = {}
+
+    def submit(
+        self, name: str, func: Callable[..., Any], *args
+    ) -> asyncio.Future:
+        """
+        schedules `func` on the worker thread, the job is queued as soon
+        as this is called and the returned future can be awaited later
+        """
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, self._run, name, func, args
+        )
+
+    def _run(self, name: str, func: Callable[..., Any], args: tuple):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.durations[name] = time.perf_counter() - start
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
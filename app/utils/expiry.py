@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from app.models.user import UserExpireStrategy
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryTimers:
+    """
+    keeps the upcoming expire dates and activation deadlines of users in a
+    min-heap and wakes up when the earliest one is due; a user has at most
+    one instant, rescheduling leaves the old heap entry to be skipped
+    """
+
+    def __init__(self, max_sleep: float = 3600):
+        self.max_sleep = max_sleep
+        self._heap: list[tuple[datetime, int]] = []
+        self._due: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, user_id: int, at: datetime | None) -> None:
+        """sets the instant of a user, None cancels it"""
+        if at is None:
+            self._due.pop(user_id, None)
+            return
+        if at.tzinfo:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        if self._due.get(user_id) == at:
+            return
+        self._due[user_id] = at
+        if not self._heap or at < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (at, user_id))
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(at, uid) for uid, at in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def schedule_user(self, user) -> None:
+        """
+        schedules the next instant the state of the user changes at,
+        instants already passed are left to the reconciliation pass
+        """
+        at = None
+        if user.removed:
+            pass
+        elif user.expire_strategy == UserExpireStrategy.FIXED_DATE:
+            if user.activated:
+                at = user.expire_date
+        elif user.expire_strategy == UserExpireStrategy.START_ON_FIRST_USE:
+            at = user.activation_deadline
+        if at and at <= datetime.utcnow():
+            at = None
+        self.schedule(user.id, at)
+
+    def pop_due(self, now: datetime) -> list[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, user_id = heapq.heappop(self._heap)
+            if self._due.get(user_id) == at:
+                del self._due[user_id]
+                due.append(user_id)
+        return due
+
+    async def run(
+        self, callback: Callable[[list[int]], Awaitable[None]]
+    ) -> None:
+        """calls back with the users whose instant came, until cancelled"""
+        while True:
+            self._wakeup.clear()
+            now = datetime.utcnow()
+            if due := self.pop_due(now):
+                try:
+                    await callback(due)
+                except Exception:
+                    logger.exception("Failed to review %i users", len(due))
+                continue
+
+            timeout = self.max_sleep
+            if self._heap:
+                timeout = min(
+                    timeout, (self._heap[0][0] - now).total_seconds()
+                )
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+expiry_timers = ExpiryTimers()
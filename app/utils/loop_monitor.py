@@ -0,0 +1,33 @@
+import asyncio
+from collections import deque
+
+
+class LoopLagMonitor:
+    """
+    measures how late a sleeping task is woken up by the event loop,
+    which is how long the loop was blocked by synchronous work
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 3000):
+        self.interval = interval
+        self.samples: deque[float] = deque(maxlen=window)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    @property
+    def max_lag(self) -> float:
+        return max(self.samples, default=0.0)
+
+    @property
+    def mean_lag(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(self.samples) / len(self.samples)
+
+
+loop_monitor = LoopLagMonitor()
@@ -49,6 +49,12 @@ async def status_change(
         )
 
 
+async def status_changes(changes: list[tuple]) -> None:
+    """reports the (username, activation, user) changes made together"""
+    for username, activation, user in changes:
+        await status_change(username, activation, user)
+
+
 async def user_created(user: UserResponse, user_id: int, by: Admin) -> None:
     await telegram.report_new_user(
         user_id=user_id,
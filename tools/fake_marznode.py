@@ -0,0 +1,335 @@
+"""
+a simulated marznode, for exercising the panel without real nodes
+
+it keeps the users the panel gives it, reports the inbounds and traffic
+it is configured with and can be made slow or flaky; run one on its own
+to point a panel at it:
+
+    python -m tools.fake_marznode --port 53042 --inbounds 3
+"""
+
+import asyncio
+import json
+import random
+import ssl
+import time
+from array import array
+from collections import Counter
+
+import typer
+from grpclib import GRPCError, Status
+from grpclib.server import Server
+
+from app.marznode.marznode_grpc import MarzServiceBase
+from app.marznode.marznode_pb2 import (
+    Backend,
+    BackendConfig,
+    BackendsResponse,
+    BackendStats,
+    ConfigFormat,
+    Empty,
+    Inbound,
+    LogLine,
+    SyncState,
+    UsersStats,
+)
+
+# seconds between the lines of the simulated backend logs
+LOG_INTERVAL = 0.5
+
+
+class FakeMarzNode(MarzServiceBase):
+    """
+    serves the node api from memory; each tick of usages reports
+    `traffic` bytes for the `active_ratio` of the users, every call
+    takes `latency` plus up to `jitter` seconds and fails with
+    `failure_rate` probability
+    """
+
+    def __init__(
+        self,
+        inbounds: int = 3,
+        traffic: int = 1 << 20,
+        active_ratio: float = 1.0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.inbounds = [
+            Inbound(
+                tag=f"inbound-{i}",
+                config=json.dumps(
+                    {"tag": f"inbound-{i}", "protocol": "vless", "port": i}
+                ),
+            )
+            for i in range(1, inbounds + 1)
+        ]
+        self.traffic = traffic
+        self.active_ratio = active_ratio
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+        self.users: dict[int, tuple[str, str, list[str]]] = {}
+        self.sequence = 0
+        # when the last update of each user arrived, in perf_counter time
+        self.received: dict[int, float] = {}
+        self.repopulations = 0
+        self.update_streams = 0
+        self.reported_bytes = 0
+        self.reported_usages = 0
+        self.calls = Counter()
+        self.failures = Counter()
+        self._offset = 0
+        self._detached = asyncio.Event()
+
+    async def _call(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(
+                self.latency + self._random.uniform(0, self.jitter)
+            )
+        if self._random.random() < self.failure_rate:
+            self.failures[name] += 1
+            raise GRPCError(Status.UNAVAILABLE, "simulated failure")
+
+    def tick(self) -> tuple[array, array]:
+        """the usages of a tick, rotating through the active users"""
+        uids = array("I", self.users)
+        active = int(len(uids) * self.active_ratio)
+        if not self.traffic or not active:
+            return array("I"), array("Q")
+        self._offset = (self._offset + active) % len(uids)
+        uids = (uids[self._offset :] + uids[: self._offset])[:active]
+        self.reported_bytes += self.traffic * active
+        self.reported_usages += active
+        return uids, array("Q", [self.traffic]) * active
+
+    def _apply(self, user_data) -> None:
+        tags = [inbound.tag for inbound in user_data.inbounds]
+        if existing := self.users.get(user_data.user.id):
+            if tags:
+                # as marznode does, only the inbounds of a user it already
+                # has change; its key stays until it is removed
+                self.users[user_data.user.id] = (*existing[:2], tags)
+            else:
+                del self.users[user_data.user.id]
+        elif tags:
+            self.users[user_data.user.id] = (
+                user_data.user.username,
+                user_data.user.key,
+                tags,
+            )
+        self.received[user_data.user.id] = time.perf_counter()
+
+    def _unpack(self, packed, users: dict) -> None:
+        indexes = iter(packed.inbound_indexes)
+        for user_id, username, key, count in zip(
+            packed.ids, packed.usernames, packed.keys, packed.inbound_counts
+        ):
+            users[user_id] = (
+                username,
+                key,
+                [packed.tags[next(indexes)] for _ in range(count)],
+            )
+
+    def _repopulated(self, users: dict, sequence: int) -> None:
+        self.users = users
+        self.sequence = sequence
+        self.repopulations += 1
+
+    def detach(self) -> None:
+        """ends the open user update streams, as a backend restart does"""
+        self._detached.set()
+        self._detached = asyncio.Event()
+
+    def restart(self) -> None:
+        """forgets the users, as a restarted node does"""
+        self.users = {}
+        self.sequence = 0
+        self.detach()
+
+    async def _receive_updates(self, stream) -> None:
+        async for user_data in stream:
+            self._apply(user_data)
+            # the panel sends the sequence every update before it covers
+            if user_data.sequence:
+                self.sequence = user_data.sequence
+
+    async def SyncUsers(self, stream):
+        await self._call("SyncUsers")
+        receiving = asyncio.ensure_future(self._receive_updates(stream))
+        detached = asyncio.ensure_future(self._detached.wait())
+        self.update_streams += 1
+        try:
+            await asyncio.wait(
+                [receiving, detached], return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            self.update_streams -= 1
+            receiving.cancel()
+            detached.cancel()
+        await stream.send_message(Empty())
+
+    async def RepopulateUsers(self, stream):
+        request = await stream.recv_message()
+        await self._call("RepopulateUsers")
+        users = dict()
+        for user_data in request.users_data:
+            users[user_data.user.id] = (
+                user_data.user.username,
+                user_data.user.key,
+                [inbound.tag for inbound in user_data.inbounds],
+            )
+        self._repopulated(users, request.sequence)
+        await stream.send_message(Empty())
+
+    async def RepopulatePackedUsers(self, stream):
+        request = await stream.recv_message()
+        await self._call("RepopulatePackedUsers")
+        users = dict()
+        self._unpack(request, users)
+        self._repopulated(users, request.sequence)
+        await stream.send_message(Empty())
+
+    async def StreamRepopulateUsers(self, stream):
+        await self._call("StreamRepopulateUsers")
+        users, sequence = dict(), 0
+        async for packed in stream:
+            self._unpack(packed, users)
+            sequence = packed.sequence
+        self._repopulated(users, sequence)
+        await stream.send_message(Empty())
+
+    async def FetchSyncState(self, stream):
+        await stream.recv_message()
+        await self._call("FetchSyncState")
+        await stream.send_message(SyncState(sequence=self.sequence))
+
+    async def FetchBackends(self, stream):
+        await stream.recv_message()
+        await self._call("FetchBackends")
+        await stream.send_message(
+            BackendsResponse(
+                backends=[
+                    Backend(
+                        name="xray",
+                        type="xray",
+                        version="1.8.24",
+                        inbounds=self.inbounds,
+                    )
+                ]
+            )
+        )
+
+    async def FetchUsersStats(self, stream):
+        await stream.recv_message()
+        await self._call("FetchUsersStats")
+        uids, usages = self.tick()
+        await stream.send_message(UsersStats(uids=uids, usages=usages))
+
+    async def StreamUsersStats(self, stream):
+        request = await stream.recv_message()
+        await self._call("StreamUsersStats")
+        while True:
+            await asyncio.sleep(request.interval)
+            uids, usages = self.tick()
+            await stream.send_message(UsersStats(uids=uids, usages=usages))
+
+    async def FetchBackendConfig(self, stream):
+        await stream.recv_message()
+        await self._call("FetchBackendConfig")
+        await stream.send_message(
+            BackendConfig(
+                configuration=json.dumps(
+                    {
+                        "inbounds": [
+                            json.loads(inbound.config)
+                            for inbound in self.inbounds
+                        ]
+                    }
+                ),
+                config_format=ConfigFormat.JSON,
+            )
+        )
+
+    async def RestartBackend(self, stream):
+        await stream.recv_message()
+        await self._call("RestartBackend")
+        await stream.send_message(Empty())
+
+    async def StreamBackendLogs(self, stream):
+        request = await stream.recv_message()
+        await self._call("StreamBackendLogs")
+        line = 0
+        while True:
+            line += 1
+            await stream.send_message(
+                LogLine(line=f"{request.backend_name}: simulated line {line}")
+            )
+            await asyncio.sleep(LOG_INTERVAL)
+
+    async def GetBackendStats(self, stream):
+        await stream.recv_message()
+        await self._call("GetBackendStats")
+        await stream.send_message(BackendStats(running=True))
+
+
+def server_ssl_context(cert_file: str, key_file: str) -> ssl.SSLContext:
+    """a server context for the panels connecting with grpclib"""
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.load_cert_chain(cert_file, key_file)
+    ctx.set_alpn_protocols(["h2"])
+    return ctx
+
+
+async def start_node(
+    node: FakeMarzNode,
+    host: str,
+    port: int,
+    ssl_context: ssl.SSLContext | None = None,
+) -> Server:
+    server = Server([node])
+    await server.start(host, port, ssl=ssl_context)
+    return server
+
+
+def main(
+    host: str = typer.Option("127.0.0.1", "--host"),
+    port: int = typer.Option(53042, "--port", "-p"),
+    inbounds: int = typer.Option(3, "--inbounds"),
+    traffic: int = typer.Option(
+        1 << 20, "--traffic", help="Bytes per active user per tick"
+    ),
+    active_ratio: float = typer.Option(1.0, "--active-ratio"),
+    latency: float = typer.Option(0.0, "--latency", help="Seconds per call"),
+    jitter: float = typer.Option(0.0, "--jitter"),
+    failure_rate: float = typer.Option(0.0, "--failure-rate"),
+    cert_file: str = typer.Option(
+        None, "--cert", help="Serve over tls, for grpclib panels"
+    ),
+    key_file: str = typer.Option(None, "--key"),
+):
+    """
+    Serves a simulated node until interrupted
+    """
+    node = FakeMarzNode(
+        inbounds, traffic, active_ratio, latency, jitter, failure_rate
+    )
+    ctx = server_ssl_context(cert_file, key_file) if cert_file else None
+
+    async def serve():
+        server = await start_node(node, host, port, ctx)
+        typer.echo(f"Simulated node listening on {host}:{port}")
+        await server.wait_closed()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,730 @@
+"""
+drives the panel against simulated nodes and reports how it copes
+
+    python -m tools.node_load_test --nodes 20 --users 10000
+
+the panel runs in this process, on a scratch sqlite database unless
+--database points it at an empty, migrated one; each scenario reports
+its throughput, latency percentiles, event loop lag and memory
+"""
+
+import asyncio
+import os
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from enum import Enum
+from typing import List, NamedTuple, Optional
+
+import typer
+
+# seconds between the samples of the event loop lag
+LAG_SAMPLE_INTERVAL = 0.01
+# seconds to wait for the nodes to catch up before giving up
+SETTLE_TIMEOUT = 300
+# seconds a node gets to take the new key of a revoked subscription
+REVOKE_TIMEOUT = 30
+# python allocations the repopulation of a node may peak at, however many
+# users it has; sending all of them at once takes about 0.3 KiB per user
+REPOPULATION_MEMORY_LIMIT = 4 << 20
+
+
+class Scenario(str, Enum):
+    sync = "sync"
+    resync = "resync"
+    usage = "usage"
+    updates = "updates"
+    preemption = "preemption"
+    revoke = "revoke"
+    repopulation = "repopulation"
+
+
+class Outcome(NamedTuple):
+    operations: int
+    unit: str
+    elapsed: float
+    latencies: list[float]
+    note: str
+    passed: bool = True
+
+
+class Result(NamedTuple):
+    scenario: str
+    outcome: Outcome
+    loop_lag: float
+    peak_rss: int
+    peak_traced: int | None
+
+
+def percentiles(samples: list[float]) -> tuple[float, float, float]:
+    """the 50th, 95th and 99th percentiles of the samples"""
+    if not samples:
+        return (float("nan"),) * 3
+    if len(samples) == 1:
+        return (samples[0],) * 3
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def peak_rss() -> int:
+    """the peak resident memory of the process in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LoopLag:
+    """samples how late the event loop runs a callback"""
+
+    def __init__(self):
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _sample(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            self.samples.append(
+                time.perf_counter() - start - LAG_SAMPLE_INTERVAL
+            )
+
+    def start(self):
+        self.samples.clear()
+        self._task = asyncio.create_task(self._sample())
+
+    def stop(self) -> float:
+        self._task.cancel()
+        return max(self.samples, default=0.0)
+
+
+async def wait_until(predicate, timeout: float = SETTLE_TIMEOUT) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+class Harness:
+    def __init__(
+        self,
+        nodes: int,
+        users: int,
+        inbounds: int,
+        backend: str,
+        base_port: int,
+        traffic: int,
+        node_options: dict,
+    ):
+        from app.db import GetDB, crud
+        from tools.fake_marznode import FakeMarzNode
+
+        self.node_count = nodes
+        self.user_count = users
+        self.backend = backend
+        self.base_port = base_port
+        # reported by the nodes during the usage scenario only
+        self.traffic = traffic
+        self.fakes = {}
+        self.servers = []
+        self._ssl_context = None
+        self.node_ids: list[int] = []
+        self._make_fake = lambda: FakeMarzNode(
+            inbounds, traffic=0, **node_options
+        )
+        self.db_nodes = {}
+        self.user_ids: list[int] = []
+        with GetDB() as db:
+            self.certificate = crud.get_tls_certificate(db)
+
+    def seed(self):
+        """adds the nodes, their inbounds and users sharing all of them"""
+        from sqlalchemy import insert
+
+        from app.db import GetDB, crud, mark_users_changed
+        from app.db.models import (
+            Admin,
+            Inbound,
+            Node,
+            Service,
+            User,
+            users_services,
+        )
+        from app.models.node import NodeStatus
+
+        with GetDB() as db:
+            admin = Admin(
+                username=f"loadtest-{os.getpid()}",
+                hashed_password="!",
+                is_sudo=True,
+            )
+            db.add(admin)
+            for i in range(self.node_count):
+                port = self.base_port + i
+                db.add(
+                    Node(
+                        name=f"loadtest-{port}",
+                        address="127.0.0.1",
+                        port=port,
+                        connection_backend=self.backend,
+                        status=NodeStatus.unhealthy,
+                        usage_coefficient=1,
+                    )
+                )
+            db.commit()
+            self.db_nodes = {
+                node.id: node
+                for node in db.query(Node).filter(
+                    Node.name.startswith("loadtest-")
+                )
+            }
+            self.node_ids = sorted(self.db_nodes)
+            for node_id in self.node_ids:
+                self.fakes[node_id] = self._make_fake()
+                crud.ensure_node_inbounds(
+                    db, self.fakes[node_id].inbounds, node_id
+                )
+
+            service = Service(name="loadtest")
+            service.inbounds = (
+                db.query(Inbound)
+                .filter(Inbound.node_id.in_(self.node_ids))
+                .all()
+            )
+            db.add(service)
+            db.commit()
+
+            last = db.query(User.id).order_by(User.id.desc()).first()
+            first = last[0] + 1 if last else 1
+            user_ids = range(first, first + self.user_count)
+            db.execute(
+                insert(User.__table__),
+                [
+                    dict(
+                        id=uid,
+                        username=f"load{uid}",
+                        key=f"{uid:032x}",
+                        admin_id=admin.id,
+                    )
+                    for uid in user_ids
+                ],
+            )
+            db.execute(
+                insert(users_services),
+                [dict(user_id=uid, service_id=service.id) for uid in user_ids],
+            )
+            db.commit()
+            self.user_ids = list(user_ids)
+            # sequenced as changed, so resynced nodes only get what changes
+            mark_users_changed(db, self.user_ids)
+            db.commit()
+            for node in self.db_nodes.values():
+                db.refresh(node)
+                db.expunge(node)
+
+    async def start_nodes(self):
+        from app.marznode.grpclib import string_to_temp_file
+        from tools.fake_marznode import server_ssl_context, start_node
+
+        if self.backend == "grpclib" and self._ssl_context is None:
+            self._cert = string_to_temp_file(self.certificate.certificate)
+            self._key = string_to_temp_file(self.certificate.key)
+            self._ssl_context = server_ssl_context(
+                self._cert.name, self._key.name
+            )
+        for node_id in self.node_ids:
+            self.servers.append(
+                await start_node(
+                    self.fakes[node_id],
+                    "127.0.0.1",
+                    self.db_nodes[node_id].port,
+                    self._ssl_context,
+                )
+            )
+
+    async def stop_nodes(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers.clear()
+
+    async def connect(self):
+        from app.marznode import operations
+
+        for node_id in self.node_ids:
+            await operations.add_node(self.db_nodes[node_id], self.certificate)
+
+    async def stop(self):
+        from app import marznode
+        from app.marznode import operations
+
+        await self.stop_nodes()
+        for node_id in self.node_ids:
+            if node_id in marznode.nodes:
+                await operations.remove_node(node_id)
+
+    def synced(self, node_id: int) -> bool:
+        from app import marznode
+
+        node = marznode.nodes.get(node_id)
+        return bool(node and node.synced)
+
+    async def measure_sync(self, start: float, ready) -> Outcome:
+        """times each node until it is ready"""
+        pending, latencies = set(self.node_ids), []
+        deadline = start + SETTLE_TIMEOUT
+        while pending and time.perf_counter() < deadline:
+            for node_id in [n for n in pending if ready(n)]:
+                latencies.append(time.perf_counter() - start)
+                pending.discard(node_id)
+            await asyncio.sleep(0.005)
+        complete = sum(
+            len(self.fakes[n].users) == self.user_count for n in self.node_ids
+        )
+        repopulated = sum(self.fakes[n].repopulations for n in self.node_ids)
+        return Outcome(
+            (self.node_count - len(pending)) * self.user_count,
+            "users",
+            time.perf_counter() - start,
+            latencies,
+            f"{complete}/{self.node_count} nodes hold all users, "
+            f"{repopulated} repopulations",
+        )
+
+    async def sync(self) -> Outcome:
+        """connects the nodes, which are repopulated"""
+        start = time.perf_counter()
+        await self.connect()
+        return await self.measure_sync(start, self.synced)
+
+    async def resync(self) -> Outcome:
+        """
+        ends the update streams of the synced nodes, which keep their
+        users and only need what changed once the panel syncs them again
+        """
+        # a node is synced a moment before its update stream opens
+        await wait_until(
+            lambda: all(fake.update_streams for fake in self.fakes.values())
+        )
+        streams = {n: self.fakes[n].calls["SyncUsers"] for n in self.node_ids}
+        for fake in self.fakes.values():
+            fake.repopulations = 0
+        start = time.perf_counter()
+        for fake in self.fakes.values():
+            fake.detach()
+        return await self.measure_sync(
+            start,
+            lambda n: self.fakes[n].calls["SyncUsers"] > streams[n]
+            and self.synced(n),
+        )
+
+    async def usage(self, duration: float, flush_interval: float) -> Outcome:
+        """stores the usages the nodes report for duration seconds"""
+        from sqlalchemy import func, select
+
+        from app.config.env import USAGE_POLL_INTERVAL
+        from app.db import GetDB
+        from app.db.models import User
+        from app.tasks import (
+            flush_user_usages,
+            ingest_pending_usages,
+            ingest_user_usages,
+        )
+
+        def stored_bytes():
+            with GetDB() as db:
+                return db.execute(
+                    select(func.coalesce(func.sum(User.used_traffic), 0))
+                ).scalar()
+
+        stored_before = stored_bytes()
+        for fake in self.fakes.values():
+            fake.reported_bytes = fake.reported_usages = 0
+            fake.traffic = self.traffic
+        ingestion = asyncio.create_task(ingest_user_usages())
+        latencies = []
+        start = time.perf_counter()
+        end = start + duration
+        while time.perf_counter() < end:
+            await asyncio.sleep(min(flush_interval, end - time.perf_counter()))
+            flushing = time.perf_counter()
+            await flush_user_usages()
+            latencies.append(time.perf_counter() - flushing)
+
+        # let the batches on their way arrive before the last flush
+        for fake in self.fakes.values():
+            fake.traffic = 0
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(USAGE_POLL_INTERVAL * 1.5)
+        ingestion.cancel()
+        await ingest_pending_usages()
+        await flush_user_usages()
+
+        reported = sum(fake.reported_bytes for fake in self.fakes.values())
+        stored = stored_bytes() - stored_before
+        return Outcome(
+            sum(fake.reported_usages for fake in self.fakes.values()),
+            "usages",
+            elapsed,
+            latencies,
+            f"flush latencies; stored {stored} of {reported} bytes",
+        )
+
+    def arrivals(self, queued_at: dict[int, float]) -> dict[int, list]:
+        """how long the queued updates took to reach each node, per user"""
+        return {
+            uid: [
+                fake.received[uid] - at
+                for fake in self.fakes.values()
+                if fake.received.get(uid, 0) >= at
+            ]
+            for uid, at in queued_at.items()
+        }
+
+    def arrived(self, queued_at: dict[int, float]) -> bool:
+        return all(
+            fake.received.get(uid, 0) >= at
+            for fake in self.fakes.values()
+            for uid, at in queued_at.items()
+        )
+
+    async def updates(self, count: int) -> Outcome:
+        """updates users on all of their nodes, timing each arrival"""
+        from sqlalchemy.orm import selectinload
+
+        from app.db import GetDB
+        from app.db.models import User
+        from app.marznode import operations
+
+        user_ids = self.user_ids[:: max(1, self.user_count // count)][:count]
+        with GetDB() as db:
+            users = (
+                db.query(User)
+                .options(selectinload(User.inbounds))
+                .filter(User.id.in_(user_ids))
+                .all()
+            )
+            queued_at = {}
+            start = time.perf_counter()
+            for user in users:
+                queued_at[user.id] = time.perf_counter()
+                operations.update_user(user)
+
+        await wait_until(lambda: self.arrived(queued_at))
+        latencies = [
+            latency
+            for user_latencies in self.arrivals(queued_at).values()
+            for latency in user_latencies
+        ]
+        return Outcome(
+            len(latencies),
+            "updates",
+            time.perf_counter() - start,
+            latencies,
+            f"end to end latencies, {len(latencies)} of "
+            f"{len(queued_at) * self.node_count} arrived",
+        )
+
+    async def preemption(self, count: int) -> Outcome:
+        """
+        removes users from their nodes right after queueing all the other
+        ones to be added in bulk, timing how long the removals wait
+        """
+        from app.db import GetDB, crud
+        from app.db.models import User
+        from app.marznode import operations
+
+        removed_ids = set(
+            self.user_ids[:: max(1, self.user_count // count)][:count]
+        )
+        added_ids = [uid for uid in self.user_ids if uid not in removed_ids]
+        with GetDB() as db:
+            added = db.query(User).filter(User.id.in_(added_ids)).all()
+            removed = db.query(User).filter(User.id.in_(removed_ids)).all()
+            inbounds = crud.get_users_node_inbounds(db, added_ids)
+            node_ids = crud.get_users_node_ids(db, list(removed_ids))
+
+            start = time.perf_counter()
+            queued_at = dict.fromkeys(added_ids, start)
+            operations.add_users(added, inbounds)
+            queued_at.update(dict.fromkeys(removed_ids, time.perf_counter()))
+            operations.remove_users(removed, node_ids)
+
+            await wait_until(lambda: self.arrived(queued_at))
+            elapsed = time.perf_counter() - start
+            arrivals = self.arrivals(queued_at)
+            # the removed users are put back for the other scenarios
+            restored = dict.fromkeys(removed_ids, time.perf_counter())
+            operations.add_users(
+                removed, crud.get_users_node_inbounds(db, list(removed_ids))
+            )
+        await wait_until(lambda: self.arrived(restored))
+
+        removals = [t for uid in removed_ids for t in arrivals[uid]]
+        additions = [t for uid in added_ids for t in arrivals[uid]]
+        p50, _, p99 = percentiles(additions)
+        return Outcome(
+            len(removals),
+            "removals",
+            elapsed,
+            removals,
+            f"removal latencies; the {len(additions)} bulk additions "
+            f"queued before them took p50 {p50 * 1000:.0f} ms, "
+            f"p99 {p99 * 1000:.0f} ms",
+        )
+
+    async def revoke(self, count: int) -> Outcome:
+        """
+        revokes the subscriptions of users as the api does, timing how
+        long their nodes take to hold the new keys
+        """
+        from sqlalchemy.orm import selectinload
+
+        from app import marznode
+        from app.db import GetDB, crud
+        from app.db.models import User
+
+        user_ids = self.user_ids[:: max(1, self.user_count // count)][:count]
+        with GetDB() as db:
+            users = (
+                db.query(User)
+                .options(selectinload(User.inbounds))
+                .filter(User.id.in_(user_ids))
+                .all()
+            )
+            keys, queued_at = {}, {}
+            start = time.perf_counter()
+            for user in users:
+                user = crud.revoke_user_sub(db, user)
+                keys[user.id] = user.key
+                queued_at[user.id] = time.perf_counter()
+                marznode.operations.update_user(user, remove=True)
+                marznode.operations.update_user(
+                    user, priority=marznode.UpdatePriority.urgent
+                )
+
+        def revoked(fake) -> bool:
+            return all(
+                uid in fake.users and fake.users[uid][1] == key
+                for uid, key in keys.items()
+            )
+
+        await wait_until(
+            lambda: all(revoked(fake) for fake in self.fakes.values()),
+            REVOKE_TIMEOUT,
+        )
+        latencies = [
+            latency
+            for user_latencies in self.arrivals(queued_at).values()
+            for latency in user_latencies
+        ]
+        stale = sum(
+            uid in fake.users and fake.users[uid][1] != key
+            for fake in self.fakes.values()
+            for uid, key in keys.items()
+        )
+        return Outcome(
+            len(latencies),
+            "revocations",
+            time.perf_counter() - start,
+            latencies,
+            f"end to end latencies, {stale} of "
+            f"{len(keys) * self.node_count} nodes kept a revoked key",
+        )
+
+    async def repopulation(self) -> Outcome:
+        """
+        restarts the nodes one at a time, tracing the python allocations
+        of the panel while it repopulates each of them; the simulated nodes
+        run in this process, so what is left allocated once a node holds
+        its users again is not counted
+        """
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        latencies, peaks = [], []
+        start = time.perf_counter()
+        for node_id, fake in self.fakes.items():
+            repopulations = fake.repopulations
+            restarted = time.perf_counter()
+            fake.restart()
+            tracemalloc.reset_peak()
+            await wait_until(
+                lambda: fake.repopulations > repopulations
+                and self.synced(node_id)
+            )
+            latencies.append(time.perf_counter() - restarted)
+            traced, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - traced)
+        if not tracing:
+            tracemalloc.stop()
+
+        complete = sum(
+            len(fake.users) == self.user_count for fake in self.fakes.values()
+        )
+        peak = max(peaks)
+        return Outcome(
+            len(latencies) * self.user_count,
+            "users",
+            time.perf_counter() - start,
+            latencies,
+            f"{complete}/{self.node_count} nodes hold all users, "
+            f"at most {peak / 2**20:.1f} MiB traced per node, "
+            f"{REPOPULATION_MEMORY_LIMIT / 2**20:.0f} MiB allowed",
+            complete == self.node_count and peak <= REPOPULATION_MEMORY_LIMIT,
+        )
+
+
+def print_result(result: Result):
+    outcome = result.outcome
+    p50, p95, p99 = percentiles(outcome.latencies)
+    traced = (
+        f", {result.peak_traced / 2**20:.1f} MiB traced"
+        if result.peak_traced is not None
+        else ""
+    )
+    typer.echo(
+        f"{result.scenario}: {outcome.operations} {outcome.unit} in "
+        f"{outcome.elapsed:.2f} s, "
+        f"{outcome.operations / outcome.elapsed:,.0f} {outcome.unit}/s\n"
+        f"  latency p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, "
+        f"p99 {p99 * 1000:.1f} ms\n"
+        f"  max loop lag {result.loop_lag * 1000:.0f} ms, "
+        f"peak rss {result.peak_rss / 2**20:.0f} MiB{traced}\n"
+        f"  {outcome.note}" + ("" if outcome.passed else "\n  FAILED")
+    )
+
+
+async def run(
+    scenarios: list[Scenario],
+    harness: Harness,
+    duration: float,
+    flush_interval: float,
+    update_count: int,
+    trace_memory: bool,
+) -> list[Result]:
+    lag = LoopLag()
+    results = []
+    harness.seed()
+    await harness.start_nodes()
+    for scenario in scenarios:
+        if scenario != Scenario.sync and not harness.synced(
+            harness.node_ids[0]
+        ):
+            await harness.sync()
+        if trace_memory:
+            tracemalloc.reset_peak()
+        lag.start()
+        if scenario == Scenario.usage:
+            outcome = await harness.usage(duration, flush_interval)
+        elif scenario == Scenario.updates:
+            outcome = await harness.updates(update_count)
+        elif scenario == Scenario.preemption:
+            outcome = await harness.preemption(update_count)
+        elif scenario == Scenario.revoke:
+            outcome = await harness.revoke(update_count)
+        else:
+            outcome = await getattr(harness, scenario.value)()
+        results.append(
+            Result(
+                scenario.value,
+                outcome,
+                lag.stop(),
+                peak_rss(),
+                tracemalloc.get_traced_memory()[1] if trace_memory else None,
+            )
+        )
+        print_result(results[-1])
+    await harness.stop()
+    return results
+
+
+def main(
+    nodes: int = typer.Option(10, "--nodes", "-n"),
+    users: int = typer.Option(10000, "--users", "-u"),
+    inbounds: int = typer.Option(3, "--inbounds"),
+    scenarios: Optional[List[Scenario]] = typer.Option(
+        None, "--scenario", "-s", help="Runs all of them if not given"
+    ),
+    backend: str = typer.Option("grpclib", "--backend"),
+    database: str = typer.Option(
+        None, "--database", help="An empty, migrated database url"
+    ),
+    base_port: int = typer.Option(54000, "--base-port"),
+    duration: float = typer.Option(
+        30, "--duration", help="Seconds of usage reporting"
+    ),
+    poll_interval: int = typer.Option(2, "--poll-interval"),
+    flush_interval: float = typer.Option(5, "--flush-interval"),
+    traffic: int = typer.Option(
+        1 << 20, "--traffic", help="Bytes per active user per tick"
+    ),
+    active_ratio: float = typer.Option(0.5, "--active-ratio"),
+    update_count: int = typer.Option(1000, "--updates"),
+    latency: float = typer.Option(
+        0.0, "--latency", help="Seconds each node call takes"
+    ),
+    jitter: float = typer.Option(0.0, "--jitter"),
+    failure_rate: float = typer.Option(0.0, "--failure-rate"),
+    trace_memory: bool = typer.Option(
+        False, "--trace-memory", help="Also trace the peak python allocations"
+    ),
+):
+    """
+    Runs the load scenarios against simulated nodes
+    """
+    scratch = None
+    if database is None:
+        scratch = tempfile.NamedTemporaryFile(suffix=".sqlite3")
+        database = f"sqlite:///{scratch.name}"
+    # the panel reads its configuration once, on import
+    os.environ["SQLALCHEMY_DATABASE_URL"] = database
+    os.environ["USAGE_POLL_INTERVAL"] = str(poll_interval)
+    # journaled usages would be replayed into the panel's own database
+    os.environ["USAGE_JOURNAL_DIR"] = ""
+    if scratch:
+        from alembic import command
+        from alembic.config import Config
+
+        command.upgrade(Config("alembic.ini"), "head")
+
+    if trace_memory:
+        tracemalloc.start()
+
+    async def load_test():
+        harness = Harness(
+            nodes,
+            users,
+            inbounds,
+            backend,
+            base_port,
+            traffic,
+            dict(
+                active_ratio=active_ratio,
+                latency=latency,
+                jitter=jitter,
+                failure_rate=failure_rate,
+            ),
+        )
+        return await run(
+            scenarios or list(Scenario),
+            harness,
+            duration,
+            flush_interval,
+            update_count,
+            trace_memory,
+        )
+
+    typer.echo(
+        f"{nodes} {backend} nodes, {users} users on {inbounds} inbounds, "
+        f"{latency * 1000:.0f}+{jitter * 1000:.0f} ms per call, "
+        f"{failure_rate:.0%} of the calls failing"
+    )
+    results = asyncio.run(load_test())
+    if not all(result.outcome.passed for result in results):
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)